@@ -2,6 +2,10 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import flt
 
+from healthcare_manufacturing.analytics import metrics
+from healthcare_manufacturing.manufacturing.oee import get_oee_rollup
+from healthcare_manufacturing.utils.cache import dashboard_cache
+
 class KPI(Document):
     def validate(self):
         self.validate_calculation_method()
@@ -43,6 +47,7 @@ class KPI(Document):
         """Get predefined KPI calculations"""
         kpi_calculations = {
             "Production Efficiency": self.calculate_production_efficiency,
+            "OEE": self.calculate_oee,
             "Quality Pass Rate": self.calculate_quality_pass_rate,
             "On-Time Delivery": self.calculate_on_time_delivery,
             "Inventory Turnover": self.calculate_inventory_turnover,
@@ -57,17 +62,23 @@ class KPI(Document):
     def calculate_production_efficiency(self):
         """Calculate production efficiency percentage"""
         # Get completed work orders vs planned
-        completed = frappe.db.count("Work Order", {"status": "Completed"})
-        total = frappe.db.count("Work Order", {"status": ["!=", "Cancelled"]})
+        work_orders = metrics.get_work_order_counters()
+        completed = work_orders["status:Completed"]
+        total = work_orders["total_work_orders"] - work_orders["status:Cancelled"]
         
         if total > 0:
             return (completed / total) * 100
         return 0
 
+    def calculate_oee(self):
+        """Calculate plant-wide Overall Equipment Effectiveness"""
+        return get_oee_rollup()["plant"]["oee"]
+
     def calculate_quality_pass_rate(self):
         """Calculate quality inspection pass rate"""
-        passed = frappe.db.count("Quality Inspection", {"status": "Accepted"})
-        total = frappe.db.count("Quality Inspection", {"status": ["in", ["Accepted", "Rejected"]]})
+        inspections = metrics.get_quality_inspection_counters()
+        passed = inspections["accepted"]
+        total = inspections["accepted"] + inspections["rejected"]
         
         if total > 0:
             return (passed / total) * 100
@@ -118,6 +129,7 @@ def update_all_kpis():
     return {"status": "success", "message": f"Updated {updated_count} KPIs"}
 
 @frappe.whitelist()
+@dashboard_cache(depends_on=["KPI"])
 def get_kpi_dashboard_data():
     """Get KPI data for dashboard display"""
     kpis = frappe.get_all("KPI", 
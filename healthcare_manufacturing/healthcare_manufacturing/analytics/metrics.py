@@ -0,0 +1,142 @@
+import frappe
+from frappe.utils import cint, flt, get_first_day, get_last_day, today
+
+# Every dashboard counter for a doctype is expressed as a conditional aggregate
+# so that the whole set is evaluated in a single pass over the table:
+#     metric key -> (condition, expression summed when the condition holds)
+# Conditions are trusted SQL fragments; runtime values go through %(name)s.
+
+WORK_ORDER_STATUSES = ["Draft", "Not Started", "In Process", "Completed", "Stopped", "Cancelled"]
+
+WORK_ORDER_METRICS = {
+    "total_work_orders": ("1=1", "1"),
+    "open_work_orders": ("status IN ('Not Started', 'In Process')", "1"),
+    "completed_today": ("status = 'Completed' AND actual_end_date >= %(today)s", "1"),
+    "overdue_orders": ("status IN ('Not Started', 'In Process') AND planned_end_date < %(today)s", "1"),
+}
+WORK_ORDER_METRICS.update({
+    f"status:{status}": (f"status = '{status}'", "1") for status in WORK_ORDER_STATUSES
+})
+# Any status outside the known ones, so the distribution still adds up to all work orders
+WORK_ORDER_METRICS["status:Other"] = (
+    "IFNULL(status, '') NOT IN ({})".format(", ".join(f"'{status}'" for status in WORK_ORDER_STATUSES)), "1")
+
+QUALITY_INSPECTION_METRICS = {
+    "pending_inspections": ("status = 'Draft'", "1"),
+    "accepted": ("status = 'Accepted'", "1"),
+    "rejected": ("status = 'Rejected'", "1"),
+    "month_accepted": ("status = 'Accepted' AND inspection_date BETWEEN %(first_day)s AND %(last_day)s", "1"),
+    "month_rejected": ("status = 'Rejected' AND inspection_date BETWEEN %(first_day)s AND %(last_day)s", "1"),
+}
+
+NCR_METRICS = {
+    "open_ncrs": ("status = 'Open'", "1"),
+}
+
+CAPA_METRICS = {
+    "capa_actions": ("status IN ('Open', 'In Progress')", "1"),
+}
+
+SALES_INVOICE_METRICS = {
+    "monthly_revenue": ("docstatus = 1 AND posting_date BETWEEN %(first_day)s AND %(last_day)s", "grand_total"),
+}
+
+ACCOUNT_METRICS = {
+    "accounts_receivable": ("account_name = 'Accounts Receivable'", "balance"),
+    "accounts_payable": ("account_name = 'Accounts Payable'", "balance"),
+}
+
+# Items are joined to their per-item bin totals so stock counts and the
+# inventory valuation come out of the same scan.
+INVENTORY_SOURCE = """
+    `tabItem` i
+    LEFT JOIN (
+        SELECT item_code,
+            SUM(actual_qty) AS actual_qty,
+            SUM(CASE WHEN actual_qty > 0 THEN actual_qty * valuation_rate ELSE 0 END) AS stock_value
+        FROM `tabBin`
+        GROUP BY item_code
+    ) b ON b.item_code = i.name
+"""
+
+INVENTORY_METRICS = {
+    "total_items": ("i.is_stock_item = 1", "1"),
+    "low_stock_items": ("i.is_stock_item = 1 AND (b.actual_qty <= i.reorder_level OR b.actual_qty IS NULL)", "1"),
+    "inventory_value": ("b.stock_value IS NOT NULL", "b.stock_value"),
+}
+
+
+def get_aggregates(doctype, metrics, values=None, from_clause=None):
+    """Evaluate all ``metrics`` over ``doctype`` with one conditional-aggregate query.
+
+    ``from_clause`` replaces the plain table when the metrics need a join.
+    Metrics whose expression is ``"1"`` are counters and come back as ints,
+    the rest as floats.
+    """
+    from_clause = from_clause or f"`tab{doctype}`"
+    columns = ",\n".join(
+        f"SUM(CASE WHEN {condition} THEN {expression} ELSE 0 END) AS `{key}`"
+        for key, (condition, expression) in metrics.items()
+    )
+
+    row = frappe.db.sql(f"SELECT {columns} FROM {from_clause}", values or {}, as_dict=True)[0]
+
+    return {
+        key: cint(row.get(key)) if expression == "1" else flt(row.get(key))
+        for key, (condition, expression) in metrics.items()
+    }
+
+
+def get_period_values():
+    """Date parameters shared by the metric definitions"""
+    return {
+        "today": today(),
+        "first_day": get_first_day(today()),
+        "last_day": get_last_day(today())
+    }
+
+
+def get_work_order_counters():
+    return get_aggregates("Work Order", WORK_ORDER_METRICS, get_period_values())
+
+
+def get_quality_inspection_counters():
+    return get_aggregates("Quality Inspection", QUALITY_INSPECTION_METRICS, get_period_values())
+
+
+def get_ncr_counters():
+    return get_aggregates("NCR", NCR_METRICS)
+
+
+def get_capa_counters():
+    return get_aggregates("CAPA", CAPA_METRICS)
+
+
+def get_sales_invoice_counters():
+    return get_aggregates("Sales Invoice", SALES_INVOICE_METRICS, get_period_values())
+
+
+def get_account_counters():
+    return get_aggregates("Account", ACCOUNT_METRICS)
+
+
+def get_stock_counters():
+    return get_aggregates("Item", INVENTORY_METRICS, from_clause=INVENTORY_SOURCE)
+
+
+def get_status_distribution(counters, statuses=WORK_ORDER_STATUSES):
+    """Build chart data from the ``status:*`` entries of a counters dict, with an Other bucket"""
+    counts = [(status, counters.get(f"status:{status}", 0)) for status in list(statuses) + ["Other"]]
+    counts = [(status, count) for status, count in counts if count]
+
+    return {
+        "labels": [status for status, count in counts],
+        "datasets": [{"values": [count for status, count in counts]}]
+    }
+
+
+def get_pass_rate(accepted, rejected):
+    total = accepted + rejected
+    if total > 0:
+        return round((accepted / total) * 100, 1)
+    return 0
@@ -1,24 +1,28 @@
 import frappe
 from frappe import _
-from frappe.utils import flt
+from frappe.utils import add_days, cint, flt, getdate, today
+
+from healthcare_manufacturing.analytics import metrics
+from healthcare_manufacturing.manufacturing.oee import get_oee_rollup
+from healthcare_manufacturing.manufacturing.doctype.production_rollup.production_rollup import get_daily_production
+from healthcare_manufacturing.utils.cache import dashboard_cache
+from healthcare_manufacturing.utils.concurrency import fan_out
+
+# Seconds the executive summary waits for its slowest metric provider
+EXECUTIVE_SUMMARY_TIMEOUT = 5
+
+# Weeks of inspections on the quality trend chart
+QUALITY_TREND_WEEKS = 4
+# Specifications on the defect categories chart, the rest are summed as Other
+DEFECT_CATEGORIES = 5
 
 @frappe.whitelist()
+@dashboard_cache(depends_on=["Work Order", "Quality Inspection", "Production Rollup"])
 def get_production_metrics():
     """Get production dashboard metrics"""
     
-    # Work order metrics
-    open_work_orders = frappe.db.count("Work Order", 
-        {"status": ["in", ["Not Started", "In Process"]]})
-    
-    completed_today = frappe.db.count("Work Order", {
-        "status": "Completed",
-        "actual_end_date": [">=", frappe.utils.today()]
-    })
-    
-    overdue_orders = frappe.db.count("Work Order", {
-        "status": ["in", ["Not Started", "In Process"]],
-        "planned_end_date": ["<", frappe.utils.today()]
-    })
+    # Work order metrics, all counted in a single pass
+    work_orders = metrics.get_work_order_counters()
     
     # Calculate OEE (Overall Equipment Effectiveness)
     oee_percentage = calculate_oee()
@@ -27,33 +31,31 @@ def get_production_metrics():
     production_trend = get_production_trend_data()
     
     # Work order status distribution
-    work_order_status = get_work_order_status_distribution()
+    work_order_status = get_work_order_status_distribution(work_orders)
     
     return {
-        "open_work_orders": open_work_orders,
-        "completed_today": completed_today,
-        "overdue_orders": overdue_orders,
+        "open_work_orders": work_orders["open_work_orders"],
+        "completed_today": work_orders["completed_today"],
+        "overdue_orders": work_orders["overdue_orders"],
         "oee_percentage": oee_percentage,
         "production_trend": production_trend,
         "work_order_status": work_order_status
     }
 
 @frappe.whitelist()
+@dashboard_cache(depends_on=["Quality Inspection", "NCR", "CAPA"])
 def get_quality_metrics():
     """Get quality control dashboard metrics"""
     
     # Quality inspection metrics
-    pending_inspections = frappe.db.count("Quality Inspection", 
-        {"status": "Draft"})
+    inspections = metrics.get_quality_inspection_counters()
     
-    open_ncrs = frappe.db.count("NCR", 
-        {"status": "Open"})
+    open_ncrs = metrics.get_ncr_counters()["open_ncrs"]
     
     # Calculate pass rate for current month
-    pass_rate = calculate_quality_pass_rate()
+    pass_rate = calculate_quality_pass_rate(inspections)
     
-    capa_actions = frappe.db.count("CAPA", 
-        {"status": ["in", ["Open", "In Progress"]]})
+    capa_actions = metrics.get_capa_counters()["capa_actions"]
     
     # Quality trend data
     quality_trend = get_quality_trend_data()
@@ -62,7 +64,7 @@ def get_quality_metrics():
     defect_categories = get_defect_categories_data()
     
     return {
-        "pending_inspections": pending_inspections,
+        "pending_inspections": inspections["pending_inspections"],
         "open_ncrs": open_ncrs,
         "pass_rate": pass_rate,
         "capa_actions": capa_actions,
@@ -71,6 +73,7 @@ def get_quality_metrics():
     }
 
 @frappe.whitelist()
+@dashboard_cache(depends_on=["Sales Invoice", "Account"])
 def get_finance_metrics():
     """Get finance dashboard metrics"""
     
@@ -78,11 +81,7 @@ def get_finance_metrics():
     monthly_revenue = get_monthly_revenue()
     
     # Account balances
-    accounts_receivable = frappe.db.get_value("Account", 
-        {"account_name": "Accounts Receivable"}, "balance") or 0
-    
-    accounts_payable = frappe.db.get_value("Account", 
-        {"account_name": "Accounts Payable"}, "balance") or 0
+    accounts = metrics.get_account_counters()
     
     # Calculate profit margin
     profit_margin = calculate_profit_margin()
@@ -92,94 +91,46 @@ def get_finance_metrics():
     
     return {
         "monthly_revenue": monthly_revenue,
-        "accounts_receivable": accounts_receivable,
-        "accounts_payable": accounts_payable,
+        "accounts_receivable": accounts["accounts_receivable"],
+        "accounts_payable": accounts["accounts_payable"],
         "profit_margin": profit_margin,
         "revenue_trend": revenue_trend
     }
 
 @frappe.whitelist()
+@dashboard_cache(depends_on=["Item", "Bin"])
 def get_inventory_metrics():
     """Get inventory dashboard metrics"""
     
-    # Stock levels
-    total_items = frappe.db.count("Item", {"is_stock_item": 1})
-    
-    low_stock_items = frappe.db.sql("""
-        SELECT COUNT(*) 
-        FROM `tabItem` i
-        LEFT JOIN `tabBin` b ON i.name = b.item_code
-        WHERE i.is_stock_item = 1 
-        AND (b.actual_qty <= i.reorder_level OR b.actual_qty IS NULL)
-    """)[0][0] or 0
-    
-    # Inventory value
-    inventory_value = calculate_inventory_value()
+    # Stock levels and inventory value
+    stock = metrics.get_stock_counters()
     
     # Inventory turnover
     inventory_turnover = calculate_inventory_turnover()
     
     return {
-        "total_items": total_items,
-        "low_stock_items": low_stock_items,
-        "inventory_value": inventory_value,
+        "total_items": stock["total_items"],
+        "low_stock_items": stock["low_stock_items"],
+        "inventory_value": calculate_inventory_value(stock),
         "inventory_turnover": inventory_turnover
     }
 
 def calculate_oee():
-    """Calculate Overall Equipment Effectiveness"""
+    """Calculate plant-wide Overall Equipment Effectiveness for the last 30 days"""
     # OEE = Availability × Performance × Quality
-    # This is a simplified calculation
-    
-    # Availability: Planned production time vs actual production time
-    availability = 85  # Mock value
-    
-    # Performance: Actual production rate vs ideal production rate  
-    performance = 90  # Mock value
-    
-    # Quality: Good units produced vs total units produced
-    quality = 96  # Mock value
-    
-    oee = (availability * performance * quality) / 10000
-    return round(oee, 1)
+    return get_oee_rollup()["plant"]["oee"]
 
-def calculate_quality_pass_rate():
+def calculate_quality_pass_rate(inspections=None):
     """Calculate quality inspection pass rate for current month"""
-    from frappe.utils import get_first_day, get_last_day, today
-    
-    first_day = get_first_day(today())
-    last_day = get_last_day(today())
-    
-    total_inspections = frappe.db.count("Quality Inspection", {
-        "inspection_date": ["between", [first_day, last_day]],
-        "status": ["in", ["Accepted", "Rejected"]]
-    })
-    
-    passed_inspections = frappe.db.count("Quality Inspection", {
-        "inspection_date": ["between", [first_day, last_day]],
-        "status": "Accepted"
-    })
-    
-    if total_inspections > 0:
-        return round((passed_inspections / total_inspections) * 100, 1)
+    inspections = inspections or metrics.get_quality_inspection_counters()
     
-    return 0
+    return metrics.get_pass_rate(inspections["month_accepted"], inspections["month_rejected"])
 
-def get_monthly_revenue():
+def get_monthly_revenue(invoices=None):
     """Get current month revenue"""
-    from frappe.utils import get_first_day, get_last_day, today
+    invoices = invoices or metrics.get_sales_invoice_counters()
     
-    first_day = get_first_day(today())
-    last_day = get_last_day(today())
-    
-    revenue = frappe.db.sql("""
-        SELECT SUM(grand_total)
-        FROM `tabSales Invoice`
-        WHERE posting_date BETWEEN %s AND %s
-        AND docstatus = 1
-    """, (first_day, last_day))[0][0] or 0
-    
-    return flt(revenue)
+    return flt(invoices["monthly_revenue"])
 
 def calculate_profit_margin():
     """Calculate profit margin percentage"""
@@ -187,15 +138,11 @@ def calculate_profit_margin():
     # For now, return a mock value
     return 18.5
 
-def calculate_inventory_value():
+def calculate_inventory_value(stock=None):
     """Calculate total inventory value"""
-    inventory_value = frappe.db.sql("""
-        SELECT SUM(b.actual_qty * b.valuation_rate)
-        FROM `tabBin` b
-        WHERE b.actual_qty > 0
-    """)[0][0] or 0
+    stock = stock or metrics.get_stock_counters()
     
-    return flt(inventory_value)
+    return flt(stock["inventory_value"])
 
 def calculate_inventory_turnover():
     """Calculate inventory turnover ratio"""
@@ -203,50 +150,66 @@ def calculate_inventory_turnover():
     # For now, return a mock value
     return 8.5
 
-def get_production_trend_data():
-    """Get production trend data for charts"""
-    # Mock data for demonstration
+def get_production_trend_data(days=7, item_code=None, workstation=None):
+    """Get production trend data for charts from the daily production rollup"""
+    to_date = getdate(today())
+    from_date = add_days(to_date, -(cint(days) - 1))
+    produced = get_daily_production(from_date, to_date, item_code, workstation)
+    dates = [add_days(from_date, i) for i in range(cint(days))]
+    
     return {
-        "labels": ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"],
+        "labels": [d.strftime("%a") for d in dates],
         "datasets": [{
             "name": "Units Produced",
-            "values": [12, 15, 8, 20, 18, 10, 14]
+            "values": [produced.get(d, 0) for d in dates]
         }]
     }
 
-def get_work_order_status_distribution():
+def get_work_order_status_distribution(work_orders=None):
     """Get work order status distribution"""
-    statuses = frappe.db.sql("""
-        SELECT status, COUNT(*) as count
-        FROM `tabWork Order`
-        GROUP BY status
-    """, as_dict=True)
+    work_orders = work_orders or metrics.get_work_order_counters()
     
-    labels = [s.status for s in statuses]
-    values = [s.count for s in statuses]
-    
-    return {
-        "labels": labels,
-        "datasets": [{"values": values}]
-    }
+    return metrics.get_status_distribution(work_orders)
+
+def get_quality_trend_data(weeks=QUALITY_TREND_WEEKS):
+    """Weekly pass rate of the inspections decided over the last ``weeks`` weeks, in one query"""
+    start = getdate(today())
+    start = add_days(start, -start.weekday() - 7 * (cint(weeks) - 1))
+
+    rows = frappe.db.sql("""
+        SELECT DATE_SUB(DATE(inspection_date), INTERVAL WEEKDAY(inspection_date) DAY) AS week,
+            SUM(status = 'Accepted'), COUNT(*)
+        FROM `tabQuality Inspection`
+        WHERE docstatus = 1 AND status IN ('Accepted', 'Rejected') AND inspection_date >= %s
+        GROUP BY week
+        ORDER BY week
+    """, start)
 
-def get_quality_trend_data():
-    """Get quality trend data for charts"""
-    # Mock data for demonstration
     return {
-        "labels": ["Week 1", "Week 2", "Week 3", "Week 4"],
+        "labels": [_("Week of {0}").format(getdate(week).strftime("%d %b")) for week, accepted, total in rows],
         "datasets": [{
-            "name": "Pass Rate %",
-            "values": [95, 97, 94, 98]
+            "name": _("Pass Rate %"),
+            "values": [flt(flt(accepted) * 100 / total, 1) for week, accepted, total in rows]
         }]
     }
 
-def get_defect_categories_data():
-    """Get defect categories data"""
-    # Mock data for demonstration
+def get_defect_categories_data(limit=DEFECT_CATEGORIES):
+    """Nonconformities by specification, totalled from the c control charts"""
+    rows = frappe.db.sql("""
+        SELECT specification, SUM(defect_sum) AS defects
+        FROM `tabControl Chart`
+        WHERE chart_type = 'c' AND defect_sum > 0
+        GROUP BY specification
+        ORDER BY defects DESC, specification
+    """)
+
+    categories = [(specification or _("Unspecified"), cint(defects)) for specification, defects in rows[:limit]]
+    if len(rows) > limit:
+        categories.append((_("Other"), sum(cint(defects) for specification, defects in rows[limit:])))
+
     return {
-        "labels": ["Dimensional", "Visual", "Functional", "Other"],
-        "datasets": [{"values": [3, 2, 1, 1]}]
+        "labels": [category for category, defects in categories],
+        "datasets": [{"values": [defects for category, defects in categories]}]
     }
 
 def get_revenue_trend_data():
@@ -261,30 +224,48 @@ def get_revenue_trend_data():
     }
 
 @frappe.whitelist()
+@dashboard_cache(depends_on=["Work Order", "Quality Inspection", "NCR", "Sales Invoice", "Item", "Bin"])
 def get_executive_summary():
     """Get executive summary for top management"""
     
+    # Independent providers run concurrently, one aggregate query per source doctype
+    results, stale, errors = fan_out({
+        "work_orders": metrics.get_work_order_counters,
+        "inspections": metrics.get_quality_inspection_counters,
+        "ncrs": metrics.get_ncr_counters,
+        "invoices": metrics.get_sales_invoice_counters,
+        "stock": metrics.get_stock_counters,
+        "oee": calculate_oee
+    }, timeout=EXECUTIVE_SUMMARY_TIMEOUT)
+    
+    work_orders = results["work_orders"] or {}
+    inspections = results["inspections"]
+    invoices = results["invoices"]
+    stock = results["stock"]
+    
     summary = {
         "production": {
-            "total_work_orders": frappe.db.count("Work Order"),
+            "total_work_orders": work_orders.get("total_work_orders"),
             "completion_rate": 85,
-            "oee": calculate_oee()
+            "oee": results["oee"]
         },
         "quality": {
-            "pass_rate": calculate_quality_pass_rate(),
-            "open_ncrs": frappe.db.count("NCR", {"status": "Open"}),
+            "pass_rate": calculate_quality_pass_rate(inspections) if inspections else None,
+            "open_ncrs": (results["ncrs"] or {}).get("open_ncrs"),
             "customer_complaints": 2  # Mock value
         },
         "finance": {
-            "monthly_revenue": get_monthly_revenue(),
+            "monthly_revenue": get_monthly_revenue(invoices) if invoices else None,
             "profit_margin": calculate_profit_margin(),
             "cash_flow": "Positive"  # Mock value
         },
         "inventory": {
-            "inventory_value": calculate_inventory_value(),
+            "inventory_value": calculate_inventory_value(stock) if stock else None,
             "turnover_ratio": calculate_inventory_turnover(),
             "stock_outs": 3  # Mock value
-        }
+        },
+        "stale": stale,
+        "errors": errors
     }
     
     return summary
\ No newline at end of file
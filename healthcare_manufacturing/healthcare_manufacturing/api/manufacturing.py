@@ -1,15 +1,21 @@
 import frappe
 from frappe import _
+from frappe.utils import add_days, cint, flt, getdate
+
+from healthcare_manufacturing.manufacturing.bom_explosion import get_default_boms
+from healthcare_manufacturing.manufacturing.doctype.work_order.work_order import insert_work_orders
+from healthcare_manufacturing.utils.db import decode_cursor, encode_cursor
 
 @frappe.whitelist()
 def create_work_order_from_sales_order(sales_order):
     """Create work orders from sales order"""
     so_doc = frappe.get_doc("Sales Order", sales_order)
     work_orders = []
+    boms = get_default_boms([item.item_code for item in so_doc.items])
     
     for item in so_doc.items:
         # Check if item has BOM
-        bom = frappe.db.get_value("BOM", {"item": item.item_code, "is_active": 1, "is_default": 1})
+        bom = boms[item.item_code]
         if bom:
             wo = frappe.get_doc({
                 "doctype": "Work Order",
@@ -24,6 +30,25 @@ def create_work_order_from_sales_order(sales_order):
     
     return work_orders
 
+@frappe.whitelist()
+def create_work_orders_in_bulk(sales_order):
+    """Create work orders for every sales order line with a default BOM in one pass.
+
+    For large orders such as hospital tenders: all lines are validated and
+    written together instead of inserting one work order at a time.
+    """
+    frappe.has_permission("Work Order", "create", throw=True)
+    so_doc = frappe.get_doc("Sales Order", sales_order)
+    boms = get_default_boms([item.item_code for item in so_doc.items])
+
+    return insert_work_orders([{
+        "production_item": item.item_code,
+        "bom_no": boms[item.item_code],
+        "qty": item.qty,
+        "sales_order": sales_order,
+        "planned_start_date": so_doc.delivery_date
+    } for item in so_doc.items if boms[item.item_code]])
+
 @frappe.whitelist()
 def get_work_orders(status=None, production_item=None):
     """Get work orders with filters"""
@@ -45,21 +70,80 @@ def update_work_order_status(work_order, status):
     doc.save()
     return {"status": "success", "message": f"Work Order {work_order} updated to {status}"}
 
+SCHEDULE_PAGE_LENGTH = 500
+SCHEDULE_MAX_PAGE_LENGTH = 2000
+
 @frappe.whitelist()
-def get_production_schedule():
-    """Get production schedule for Gantt view"""
-    work_orders = frappe.get_all("Work Order",
-        filters={"status": ["in", ["Not Started", "In Process"]]},
-        fields=["name", "production_item", "planned_start_date", "planned_end_date", "status"])
-    
-    schedule = []
-    for wo in work_orders:
-        schedule.append({
-            "id": wo.name,
-            "name": f"{wo.production_item} - {wo.name}",
-            "start": wo.planned_start_date,
-            "end": wo.planned_end_date,
-            "progress": 50 if wo.status == "In Process" else 0
-        })
-    
-    return schedule
\ No newline at end of file
+def get_production_schedule(from_date=None, to_date=None, workstation=None, after=None,
+        page_length=SCHEDULE_PAGE_LENGTH):
+    """Get production schedule for Gantt view.
+
+    Open work orders overlapping the ``from_date``..``to_date`` window, with an
+    operation on ``workstation`` if given, ordered by planned start. Returns one
+    page as ``{"tasks", "after"}``; pass ``after`` back for the next page, it
+    is ``None`` on the last one.
+    """
+    frappe.has_permission("Work Order", "read", throw=True)
+    page_length = min(max(cint(page_length), 1), SCHEDULE_MAX_PAGE_LENGTH)
+    query, values = get_schedule_query(from_date, to_date, workstation,
+        decode_cursor(after, 2) if after else None)
+    rows = frappe.db.sql(f"{query} LIMIT {page_length}", values, as_dict=True)
+
+    tasks = [{
+        "id": row.name,
+        "name": f"{row.production_item} - {row.name}",
+        "item": row.production_item,
+        "start": row.planned_start_date,
+        "end": row.planned_end_date or row.planned_start_date,
+        "progress": get_progress(row)
+    } for row in rows]
+
+    last = rows[-1] if len(rows) == page_length else None
+    return {"tasks": tasks, "after": encode_cursor([last.planned_start_date, last.name]) if last else None}
+
+def get_schedule_query(from_date=None, to_date=None, workstation=None, after=None):
+    """Open work orders by planned start, with operation and production progress per row.
+
+    The progress subqueries only run for the rows of the page.
+    """
+    conditions = ["wo.docstatus = 1", "wo.status IN ('Not Started', 'In Process')",
+        "wo.planned_start_date IS NOT NULL"]
+    values = {}
+    if from_date:
+        conditions.append("IFNULL(wo.planned_end_date, wo.planned_start_date) >= %(from_date)s")
+        values["from_date"] = getdate(from_date)
+    if to_date:
+        conditions.append("wo.planned_start_date < %(to_date)s")
+        values["to_date"] = add_days(getdate(to_date), 1)
+    if workstation:
+        conditions.append("""EXISTS (SELECT 1 FROM `tabWork Order Operation` op
+            WHERE op.parent = wo.name AND op.parenttype = 'Work Order' AND op.workstation = %(workstation)s)""")
+        values["workstation"] = workstation
+    if after:
+        conditions.append("(wo.planned_start_date, wo.name) > (%(after_start)s, %(after_name)s)")
+        values.update(after_start=after[0], after_name=after[1])
+
+    query = f"""
+        SELECT wo.name, wo.production_item, wo.qty, wo.status,
+            wo.planned_start_date, wo.planned_end_date,
+            (SELECT SUM(op.time_in_mins * IF(op.status = 'Completed', 1,
+                    LEAST(IFNULL(op.completed_qty / wo.qty, 0), 1))) / SUM(op.time_in_mins)
+                FROM `tabWork Order Operation` op
+                WHERE op.parent = wo.name AND op.parenttype = 'Work Order') AS operations_done,
+            (SELECT SUM(sed.qty)
+                FROM `tabStock Entry Detail` sed
+                INNER JOIN `tabStock Entry` se ON se.name = sed.parent
+                WHERE se.work_order = wo.name AND se.docstatus = 1
+                    AND se.stock_entry_type = 'Manufacture'
+                    AND sed.item_code = wo.production_item
+                    AND IFNULL(sed.t_warehouse, '') != '') AS produced_qty
+        FROM `tabWork Order` wo
+        WHERE {" AND ".join(conditions)}
+        ORDER BY wo.planned_start_date, wo.name
+    """
+    return query, values
+
+def get_progress(row):
+    """Percent complete: the larger of the operation time done and the qty produced"""
+    produced = flt(row.produced_qty) / flt(row.qty) if flt(row.qty) else 0
+    return round(min(max(flt(row.operations_done), produced), 1) * 100, 1)
@@ -1,5 +1,19 @@
+import csv
+import io
+from itertools import groupby
+
 import frappe
 from frappe import _
+from frappe.utils import cint, cstr
+from werkzeug.wrappers import Response
+
+from healthcare_manufacturing.inventory.doctype.batch_genealogy.batch_genealogy import (
+    get_batch_relatives, get_forward_traces)
+from healthcare_manufacturing.inventory.doctype.serial_no_movement.serial_no_movement import (
+    VOUCHER_ITEM_TABLES, parse_serial_nos)
+from healthcare_manufacturing.inventory.trace_cache import get_cached_traces
+from healthcare_manufacturing.utils.concurrency import site_connection
+from healthcare_manufacturing.utils.db import chunked, decode_cursor, encode_cursor
 
 @frappe.whitelist()
 def trace_serial(serial_no):
@@ -7,71 +21,113 @@ def trace_serial(serial_no):
     if not serial_no:
         frappe.throw(_("Serial number is required"))
     
-    # Get serial number details
-    serial_doc = frappe.get_doc("Serial No", serial_no)
-    
-    trace_data = {
-        "serial_no": serial_no,
-        "item_code": serial_doc.item_code,
-        "status": serial_doc.status,
-        "warehouse": serial_doc.warehouse,
-        "purchase_history": [],
-        "production_history": [],
-        "quality_inspections": [],
-        "delivery_history": []
-    }
-    
-    # Get purchase history
-    purchase_receipts = frappe.get_all("Purchase Receipt Item",
-        filters={"serial_no": ["like", f"%{serial_no}%"]},
-        fields=["parent", "supplier", "received_qty", "batch_no"])
-    
-    for pr in purchase_receipts:
-        pr_doc = frappe.get_doc("Purchase Receipt", pr.parent)
-        trace_data["purchase_history"].append({
+    trace_data = get_cached_traces("serial", [serial_no], get_serial_traces).get(serial_no)
+    if not trace_data:
+        frappe.throw(_("Serial No {0} not found").format(serial_no), frappe.DoesNotExistError)
+    
+    return trace_data
+
+@frappe.whitelist()
+def trace_serials(serial_nos, format="json"):
+    """Trace a recall list of serial numbers set-wise.
+
+    ``serial_nos`` is a list, a JSON list or newline separated text. Returns the
+    traces in input order with unknown serials under ``not_found``, or streams
+    one trace per line with ``format="ndjson"``.
+    """
+    return bulk_trace(parse_trace_list(serial_nos), "serial", get_serial_traces, format)
+
+def get_serial_traces(serial_nos):
+    """``{serial_no: trace}`` for existing ``serial_nos`` from a fixed number of queries"""
+    traces = {}
+    for serial in frappe.db.sql("""
+        SELECT name, item_code, status, warehouse
+        FROM `tabSerial No`
+        WHERE name IN %s
+    """, [tuple(serial_nos)], as_dict=True):
+        traces[serial.name] = {
+            "serial_no": serial.name,
+            "item_code": serial.item_code,
+            "status": serial.status,
+            "warehouse": serial.warehouse,
+            "purchase_history": [],
+            "production_history": [],
+            "quality_inspections": [],
+            "delivery_history": []
+        }
+    
+    if not traces:
+        return traces
+    found = list(traces)
+    
+    # One joined query per voucher type, whatever the number of movements
+    for pr in get_serial_voucher_rows(found, "Purchase Receipt"):
+        traces[pr.serial_no]["purchase_history"].append({
             "document": pr.parent,
-            "date": pr_doc.posting_date,
+            "date": pr.posting_date,
             "supplier": pr.supplier,
             "batch_no": pr.batch_no
         })
     
     # Get production history
-    stock_entries = frappe.get_all("Stock Entry Detail",
-        filters={"serial_no": ["like", f"%{serial_no}%"]},
-        fields=["parent", "item_code", "qty", "s_warehouse", "t_warehouse"])
-    
-    for se in stock_entries:
-        se_doc = frappe.get_doc("Stock Entry", se.parent)
-        if se_doc.stock_entry_type == "Manufacture":
-            trace_data["production_history"].append({
-                "document": se.parent,
-                "date": se_doc.posting_date,
-                "work_order": se_doc.work_order,
-                "from_warehouse": se.s_warehouse,
-                "to_warehouse": se.t_warehouse
-            })
+    for se in get_serial_voucher_rows(found, "Stock Entry"):
+        traces[se.serial_no]["production_history"].append({
+            "document": se.parent,
+            "date": se.posting_date,
+            "work_order": se.work_order,
+            "from_warehouse": se.s_warehouse,
+            "to_warehouse": se.t_warehouse
+        })
     
     # Get quality inspections
-    quality_inspections = frappe.get_all("Quality Inspection",
-        filters={"serial_no": serial_no},
-        fields=["name", "inspection_date", "status", "inspected_by"])
-    
-    trace_data["quality_inspections"] = quality_inspections
+    for qi in frappe.get_all("Quality Inspection",
+            filters={"serial_no": ["in", found]},
+            fields=["name", "inspection_date", "status", "inspected_by", "serial_no"]):
+        traces[qi.pop("serial_no")]["quality_inspections"].append(qi)
     
     # Get delivery history
-    delivery_notes = frappe.get_all("Delivery Note Item",
-        filters={"serial_no": ["like", f"%{serial_no}%"]},
-        fields=["parent", "customer", "qty"])
-    
-    for dn in delivery_notes:
-        dn_doc = frappe.get_doc("Delivery Note", dn.parent)
-        trace_data["delivery_history"].append({
+    for dn in get_serial_voucher_rows(found, "Delivery Note"):
+        traces[dn.serial_no]["delivery_history"].append({
             "document": dn.parent,
-            "date": dn_doc.posting_date,
+            "date": dn.posting_date,
             "customer": dn.customer
         })
     
-    return trace_data
+    return traces
+
+# Item and header fields read for each voucher type, plus an optional header condition
+SERIAL_VOUCHER_FIELDS = {
+    "Purchase Receipt": (["received_qty", "batch_no"], ["posting_date", "supplier"], ""),
+    "Stock Entry": (["item_code", "qty", "s_warehouse", "t_warehouse"],
+        ["posting_date", "stock_entry_type", "work_order"],
+        "AND voucher.stock_entry_type = 'Manufacture'"),
+    "Delivery Note": (["qty"], ["posting_date", "customer"], "")
+}
+
+def get_serial_voucher_rows(serial_nos, voucher_type):
+    """Item rows of ``voucher_type`` that moved ``serial_nos``, joined with their voucher header.
+
+    Goes from the serial movement index to the item row and its parent in a
+    single query, so the cost does not grow with the number of movements.
+    """
+    item_fields, voucher_fields, condition = SERIAL_VOUCHER_FIELDS[voucher_type]
+    columns = ", ".join(
+        ["movement.serial_no", "item.parent"]
+        + [f"item.{field}" for field in item_fields]
+        + [f"voucher.{field}" for field in voucher_fields]
+    )
+    
+    return frappe.db.sql(f"""
+        SELECT {columns}
+        FROM `tabSerial No Movement` movement
+        INNER JOIN `tab{VOUCHER_ITEM_TABLES[voucher_type]}` item ON item.name = movement.voucher_detail_no
+        INNER JOIN `tab{voucher_type}` voucher ON voucher.name = movement.voucher_no
+        WHERE movement.serial_no IN %(serial_nos)s
+            AND movement.voucher_type = %(voucher_type)s
+            AND voucher.docstatus = 1
+            {condition}
+        ORDER BY voucher.posting_date, voucher.name
+    """, {"serial_nos": tuple(serial_nos), "voucher_type": voucher_type}, as_dict=True)
 
 @frappe.whitelist()
 def trace_batch(batch_no):
@@ -79,61 +135,247 @@ def trace_batch(batch_no):
     if not batch_no:
         frappe.throw(_("Batch number is required"))
     
-    batch_doc = frappe.get_doc("Batch", batch_no)
+    trace_data = get_cached_traces("batch", [batch_no], get_batch_traces).get(batch_no)
+    if not trace_data:
+        frappe.throw(_("Batch {0} not found").format(batch_no), frappe.DoesNotExistError)
     
-    trace_data = {
-        "batch_no": batch_no,
-        "item_code": batch_doc.item,
-        "manufacturing_date": batch_doc.manufacturing_date,
-        "expiry_date": batch_doc.expiry_date,
-        "supplier_batch": batch_doc.supplier_batch_id,
-        "quality_inspections": [],
-        "stock_movements": []
-    }
+    return trace_data
+
+@frappe.whitelist()
+def trace_batches(batch_nos, format="json"):
+    """Trace a recall list of batch numbers set-wise, like :func:`trace_serials`"""
+    return bulk_trace(parse_trace_list(batch_nos), "batch", get_batch_traces, format)
+
+def get_batch_traces(batch_nos):
+    """``{batch_no: trace}`` for existing ``batch_nos`` from a fixed number of queries"""
+    traces = {}
+    for batch in frappe.db.sql("""
+        SELECT name, item, manufacturing_date, expiry_date, supplier_batch_id
+        FROM `tabBatch`
+        WHERE name IN %s
+    """, [tuple(batch_nos)], as_dict=True):
+        traces[batch.name] = {
+            "batch_no": batch.name,
+            "item_code": batch.item,
+            "manufacturing_date": batch.manufacturing_date,
+            "expiry_date": batch.expiry_date,
+            "supplier_batch": batch.supplier_batch_id,
+            "quality_inspections": [],
+            "stock_movements": []
+        }
     
-    # Get quality inspections for this batch
-    quality_inspections = frappe.get_all("Quality Inspection",
-        filters={"batch_no": batch_no},
-        fields=["name", "inspection_date", "status", "inspected_by", "reference_type", "reference_name"])
+    if not traces:
+        return traces
+    found = list(traces)
     
-    trace_data["quality_inspections"] = quality_inspections
+    # Get quality inspections for these batches
+    for qi in frappe.get_all("Quality Inspection",
+            filters={"batch_no": ["in", found]},
+            fields=["name", "inspection_date", "status", "inspected_by", "reference_type",
+                "reference_name", "batch_no"]):
+        traces[qi.pop("batch_no")]["quality_inspections"].append(qi)
     
     # Get stock movements
-    stock_ledger = frappe.get_all("Stock Ledger Entry",
-        filters={"batch_no": batch_no},
-        fields=["posting_date", "voucher_type", "voucher_no", "actual_qty", "warehouse"],
-        order_by="posting_date")
+    for sle in frappe.get_all("Stock Ledger Entry",
+            filters={"batch_no": ["in", found]},
+            fields=["posting_date", "voucher_type", "voucher_no", "actual_qty", "warehouse", "batch_no"],
+            order_by="posting_date"):
+        traces[sle.pop("batch_no")]["stock_movements"].append(sle)
     
-    trace_data["stock_movements"] = stock_ledger
+    # Multi-level genealogy from the closure table: one indexed query per direction
+    ancestors = get_batch_relatives(found, "ancestors")
+    for batch_no, forward in get_forward_traces(found, BULK_TRACE_CHUNK).items():
+        traces[batch_no]["genealogy"] = {
+            "ancestors": ancestors[batch_no],
+            "descendants": forward["descendants"],
+            "serial_nos": forward["serial_nos"],
+            "deliveries": forward["deliveries"],
+            "customers": forward["customers"]
+        }
     
-    return trace_data
+    return traces
+
+# Largest IN list sent to the database, and largest recall list accepted per request
+BULK_TRACE_CHUNK = 1000
+BULK_TRACE_LIMIT = 50000
+
+def parse_trace_list(values):
+    """Unique serial or batch numbers from a list, a JSON list or newline separated text"""
+    if isinstance(values, str):
+        values = frappe.parse_json(values) if values.lstrip().startswith("[") else parse_serial_nos(values)
+    
+    values = list(dict.fromkeys(cstr(value).strip() for value in values or [] if cstr(value).strip()))
+    if not values:
+        frappe.throw(_("At least one serial or batch number is required"))
+    if len(values) > BULK_TRACE_LIMIT:
+        frappe.throw(_("At most {0} numbers can be traced at once").format(BULK_TRACE_LIMIT))
+    return values
+
+def iter_bulk_traces(names, kind, get_traces):
+    """Traces of ``names`` in input order, cached or resolved one IN-list chunk at a time"""
+    key = f"{kind}_no"
+    for chunk in chunked(names, BULK_TRACE_CHUNK):
+        traces = get_cached_traces(kind, chunk, get_traces)
+        for name in chunk:
+            yield traces.get(name) or {key: name, "not_found": True}
+
+def bulk_trace(names, kind, get_traces, format="json"):
+    key = f"{kind}_no"
+    if format == "ndjson":
+        return ndjson_response(lambda: iter_bulk_traces(names, kind, get_traces), f"{key}_traces")
+    if format != "json":
+        frappe.throw(_("Unsupported trace format {0}").format(format))
+    
+    result = {"traces": [], "not_found": []}
+    for trace in iter_bulk_traces(names, kind, get_traces):
+        if trace.get("not_found"):
+            result["not_found"].append(trace[key])
+        else:
+            result["traces"].append(trace)
+    return result
+
+# Stock ledger rows are traced per batch, or per serial for unbatched stock. The
+# key is stored on each row in the trace_key custom field, so the report order
+# and its cursor are served by the index on REPORT_ORDER.
+TRACE_KEY = "LEFT(IF(IFNULL(batch_no, '') != '', batch_no, IFNULL(serial_no, '')), 140)"
+REPORT_ORDER = ["item_code", "trace_key", "posting_date", "posting_time", "name"]
+REPORT_FIELDS = ["name", "item_code", "batch_no", "serial_no", "voucher_type", "voucher_no",
+    "posting_date", "posting_time", "actual_qty", "warehouse"]
+REPORT_PAGE_LENGTH = 500
+REPORT_MAX_PAGE_LENGTH = 5000
+REPORT_CSV_CHUNK = 1000
 
 @frappe.whitelist()
-def get_traceability_report(item_code=None, from_date=None, to_date=None):
-    """Generate traceability report for items"""
-    filters = {}
-    if item_code:
-        filters["item_code"] = item_code
-    if from_date and to_date:
-        filters["posting_date"] = ["between", [from_date, to_date]]
-    
-    # Get all stock movements
-    stock_entries = frappe.get_all("Stock Ledger Entry",
-        filters=filters,
-        fields=["item_code", "batch_no", "serial_no", "voucher_type", "voucher_no", 
-                "posting_date", "actual_qty", "warehouse"])
-    
-    # Group by item and batch/serial
-    traceability_data = {}
-    for entry in stock_entries:
-        key = f"{entry.item_code}_{entry.batch_no or entry.serial_no}"
-        if key not in traceability_data:
-            traceability_data[key] = {
-                "item_code": entry.item_code,
-                "batch_no": entry.batch_no,
-                "serial_no": entry.serial_no,
-                "movements": []
-            }
-        traceability_data[key]["movements"].append(entry)
-    
-    return list(traceability_data.values())
\ No newline at end of file
+def get_traceability_report(item_code=None, from_date=None, to_date=None, after=None,
+        page_length=REPORT_PAGE_LENGTH, format="json"):
+    """Generate traceability report for items.
+
+    ``format="json"`` returns one page of groups and the ``after`` cursor of the
+    next page (``None`` on the last one). ``"ndjson"`` and ``"csv"`` stream the
+    whole report through a server-side cursor, so memory does not grow with the
+    number of ledger rows.
+    """
+    frappe.has_permission("Stock Ledger Entry", "read", throw=True)
+    filters = {"item_code": item_code, "from_date": from_date, "to_date": to_date}
+
+    if format in ("ndjson", "csv"):
+        return stream_traceability_report(format, filters)
+    if format != "json":
+        frappe.throw(_("Unsupported report format {0}").format(format))
+
+    page_length = min(max(cint(page_length), 1), REPORT_MAX_PAGE_LENGTH)
+    query, values = get_report_query(filters, decode_cursor(after, len(REPORT_ORDER)) if after else None)
+    rows = frappe.db.sql(f"{query} LIMIT {page_length}", values, as_dict=True)
+
+    if len(rows) < page_length:
+        return {"groups": list(group_movements(rows)), "after": None}
+
+    # Keep groups whole: the trailing group may continue past this page, so it
+    # starts the next one unless it fills the page on its own
+    last_key = (rows[-1].item_code, rows[-1].trace_key)
+    complete = [row for row in rows if (row.item_code, row.trace_key) != last_key] or rows
+    return {"groups": list(group_movements(complete)), "after": encode_report_cursor(complete[-1])}
+
+def get_report_query(filters, after=None):
+    """Stock ledger query ordered by trace group and time, starting past the ``after`` key"""
+    conditions, values = [], {}
+    if filters.get("item_code"):
+        conditions.append("item_code = %(item_code)s")
+        values["item_code"] = filters["item_code"]
+    if filters.get("from_date") and filters.get("to_date"):
+        conditions.append("posting_date BETWEEN %(from_date)s AND %(to_date)s")
+        values.update(from_date=filters["from_date"], to_date=filters["to_date"])
+    if after:
+        conditions.append(f"({', '.join(REPORT_ORDER)}) > %(after)s")
+        values["after"] = tuple(after)
+
+    query = f"""
+        SELECT {", ".join(REPORT_FIELDS)}, trace_key
+        FROM `tabStock Ledger Entry`
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY {", ".join(REPORT_ORDER)}
+    """
+    return query, values
+
+def set_trace_key(doc, method=None):
+    """doc_events handler for Stock Ledger Entry, keeping ``trace_key`` in step with :data:`TRACE_KEY`"""
+    doc.trace_key = (doc.batch_no or doc.serial_no or "")[:140]
+
+def set_stock_ledger_trace_keys(chunk_size=10000):
+    """Fill ``trace_key`` of existing Stock Ledger Entries, one primary key range per transaction"""
+    last = ""
+    while True:
+        names = frappe.db.sql_list("""
+            SELECT name FROM `tabStock Ledger Entry` WHERE name > %s ORDER BY name LIMIT %s
+        """, (last, chunk_size))
+        if not names:
+            break
+
+        frappe.db.sql(f"""
+            UPDATE `tabStock Ledger Entry` SET trace_key = {TRACE_KEY} WHERE name IN %s
+        """, [tuple(names)])
+        frappe.db.commit()
+        last = names[-1]
+
+def encode_report_cursor(row):
+    return encode_cursor([row.item_code, row.trace_key, row.posting_date, row.posting_time, row.name])
+
+def iter_report_rows(filters):
+    """Stream the ordered stock ledger rows without buffering the result set"""
+    query, values = get_report_query(filters)
+    with frappe.db.unbuffered_cursor():
+        yield from frappe.db.sql(query, values, as_dict=True, as_iterator=True)
+
+def group_movements(rows):
+    """Group consecutive ledger rows of the same item and batch/serial"""
+    for (item_code, trace_key), movements in groupby(rows, key=lambda row: (row.item_code, row.trace_key)):
+        movements = list(movements)
+        yield {
+            "item_code": item_code,
+            "batch_no": movements[0].batch_no,
+            "serial_no": movements[0].serial_no,
+            "movements": movements
+        }
+
+def stream_traceability_report(format, filters):
+    """Response streaming the report as NDJSON groups or CSV movement rows"""
+    if format == "ndjson":
+        return ndjson_response(lambda: group_movements(iter_report_rows(filters)), "traceability_report")
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(REPORT_FIELDS)
+        for i, row in enumerate(iter_report_rows(filters), 1):
+            writer.writerow([row[field] for field in REPORT_FIELDS])
+            if i % REPORT_CSV_CHUNK == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return streaming_response(generate, "text/csv", "traceability_report.csv")
+
+def ndjson_response(get_items, filename):
+    """Response streaming the items yielded by ``get_items()`` as one JSON document per line"""
+    def generate():
+        for item in get_items():
+            yield frappe.as_json(item, indent=None) + "\n"
+
+    return streaming_response(generate, "application/x-ndjson", f"{filename}.ndjson")
+
+def streaming_response(generate, mimetype, filename):
+    """Stream ``generate()`` as a download on a connection of its own.
+
+    The request's connection is closed before the body is sent, so the
+    generator runs in a fresh site context for the same user.
+    """
+    site, sites_path, user = frappe.local.site, frappe.local.sites_path, frappe.session.user
+
+    def body():
+        with site_connection(site, sites_path, user):
+            yield from generate()
+
+    return Response(body(), mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename={filename}"
+    })
@@ -0,0 +1,213 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+def connect(context):
+    import frappe
+
+    frappe.init(site=get_site(context))
+    frappe.connect()
+
+
+@click.command("backfill-production-rollup")
+@click.option("--from-date", help="First posting date to rebuild (defaults to the oldest Manufacture entry)")
+@click.option("--to-date", help="Last posting date to rebuild (defaults to the newest Manufacture entry)")
+@click.option("--chunk-days", default=7, type=int, help="Days rebuilt and committed per chunk")
+@pass_context
+def backfill_production_rollup(context, from_date=None, to_date=None, chunk_days=7):
+    """Rebuild the daily production rollup from Stock Entry history"""
+    import frappe
+    from healthcare_manufacturing.manufacturing.doctype.production_rollup.production_rollup import (
+        backfill_production_rollup,
+    )
+
+    connect(context)
+    try:
+        rows = backfill_production_rollup(from_date, to_date, chunk_days)
+        click.echo(f"Rebuilt {rows} production rollup rows")
+    finally:
+        frappe.destroy()
+
+
+@click.command("backfill-serial-no-movements")
+@click.option("--chunk-size", default=5000, type=int, help="Voucher item rows indexed and committed per chunk")
+@pass_context
+def backfill_serial_no_movements(context, chunk_size=5000):
+    """Index the serial numbers of all submitted receipts, stock entries and deliveries"""
+    import frappe
+    from healthcare_manufacturing.inventory.doctype.serial_no_movement.serial_no_movement import (
+        backfill_serial_no_movements,
+    )
+
+    connect(context)
+    try:
+        rows = backfill_serial_no_movements(chunk_size)
+        click.echo(f"Indexed {rows} serial number movements")
+    finally:
+        frappe.destroy()
+
+
+@click.command("rebuild-batch-genealogy")
+@click.option("--chunk-size", default=500, type=int, help="Source documents replayed and committed per chunk")
+@pass_context
+def rebuild_batch_genealogy(context, chunk_size=500):
+    """Rebuild the batch genealogy closure from batch tracking records and Manufacture entries"""
+    import frappe
+    from healthcare_manufacturing.inventory.doctype.batch_genealogy.batch_genealogy import (
+        rebuild_batch_genealogy,
+    )
+
+    connect(context)
+    try:
+        rebuild_batch_genealogy(chunk_size)
+        click.echo(f"Rebuilt {frappe.db.count('Batch Genealogy')} batch genealogy rows")
+    finally:
+        frappe.destroy()
+
+
+@click.command("reconcile-stock-balances")
+@click.option("--fix", is_flag=True, help="Overwrite drifted balances with the ledger totals")
+@click.option("--chunk-size", default=500, type=int, help="Items verified per ledger query")
+@pass_context
+def reconcile_stock_balances(context, fix=False, chunk_size=500):
+    """Verify the running stock balances against the stock ledger, and build them with --fix"""
+    import frappe
+    from healthcare_manufacturing.inventory.doctype.stock_balance.stock_balance import (
+        reconcile_stock_balances,
+    )
+
+    connect(context)
+    try:
+        mismatches = reconcile_stock_balances(fix, chunk_size)
+        click.echo(f"{len(mismatches)} balances {'fixed' if fix else 'drifted from the ledger'}")
+    finally:
+        frappe.destroy()
+
+
+@click.command("recost-boms")
+@click.option("--price-list", help="Price list to cost raw materials from (defaults to any item price)")
+@pass_context
+def recost_boms(context, price_list=None):
+    """Recost every BOM from current item prices, rolling sub-assembly costs up"""
+    import frappe
+    from healthcare_manufacturing.manufacturing.bom_costing import recost_all_boms
+
+    connect(context)
+    try:
+        count = recost_all_boms(price_list)
+        frappe.db.commit()
+        click.echo(f"Recosted {count} BOMs")
+    finally:
+        frappe.destroy()
+
+
+@click.command("rebuild-bom-where-used")
+@click.option("--chunk-size", default=1000, type=int, help="BOMs indexed and committed per chunk")
+@pass_context
+def rebuild_bom_where_used(context, chunk_size=1000):
+    """Rebuild the BOM where-used index from all submitted BOMs"""
+    import frappe
+    from healthcare_manufacturing.manufacturing.doctype.bom_where_used.bom_where_used import (
+        rebuild_bom_where_used,
+    )
+
+    connect(context)
+    try:
+        count = rebuild_bom_where_used(chunk_size)
+        click.echo(f"Indexed {count} BOMs")
+    finally:
+        frappe.destroy()
+
+
+@click.command("rebuild-control-charts")
+@click.option("--chunk-size", default=100, type=int, help="Items replayed and committed per chunk")
+@pass_context
+def rebuild_control_charts(context, chunk_size=100):
+    """Rebuild the SPC control charts from all submitted quality inspections"""
+    import frappe
+    from healthcare_manufacturing.quality_control.doctype.control_chart.control_chart import (
+        rebuild_all_control_charts,
+    )
+
+    connect(context)
+    try:
+        count = rebuild_all_control_charts(chunk_size)
+        click.echo(f"Charted {count} items")
+    finally:
+        frappe.destroy()
+
+
+@click.command("benchmark-trace-serials")
+@click.option("--count", default=10000, type=int, help="Serial numbers in the recall list, newest first")
+@click.option("--cold", is_flag=True, help="Drop the cached traces of the site before the first run")
+@pass_context
+def benchmark_trace_serials(context, count=10000, cold=False):
+    """Time trace_serials over a recall list of existing serial numbers, in serials per second"""
+    import time
+
+    import frappe
+    from healthcare_manufacturing.api.traceability import trace_serials
+    from healthcare_manufacturing.inventory.trace_cache import clear_trace_cache
+
+    connect(context)
+    try:
+        frappe.set_user("Administrator")
+        serial_nos = frappe.db.sql_list("SELECT name FROM `tabSerial No` ORDER BY creation DESC LIMIT %s", count)
+        if not serial_nos:
+            click.echo("No serial numbers to trace")
+            return
+        if cold:
+            clear_trace_cache()
+
+        for run in ("first", "repeated"):
+            start = time.perf_counter()
+            result = trace_serials(serial_nos)
+            elapsed = time.perf_counter() - start
+            click.echo(f"{run} run: {len(result['traces'])} of {len(serial_nos)} serials traced in "
+                f"{elapsed:.2f} s, {len(serial_nos) / elapsed:,.0f} serials/s")
+    finally:
+        frappe.destroy()
+
+
+@click.command("benchmark-work-orders")
+@click.argument("sales_order")
+@pass_context
+def benchmark_work_orders(context, sales_order):
+    """Time Work Order creation for a Sales Order one by one and in bulk, in lines per second.
+
+    Both paths run on the same order and are rolled back, so nothing is kept.
+    """
+    import time
+
+    import frappe
+    from healthcare_manufacturing.api.manufacturing import (
+        create_work_order_from_sales_order, create_work_orders_in_bulk,
+    )
+
+    connect(context)
+    try:
+        frappe.set_user("Administrator")
+        for label, method in (("one by one", create_work_order_from_sales_order),
+                ("bulk", create_work_orders_in_bulk)):
+            start = time.perf_counter()
+            names = method(sales_order)
+            elapsed = time.perf_counter() - start
+            frappe.db.rollback()
+            click.echo(f"{label}: {len(names)} Work Orders in {elapsed:.2f} s, "
+                f"{len(names) / elapsed:,.0f} lines/s")
+    finally:
+        frappe.db.rollback()
+        frappe.destroy()
+
+
+commands = [
+    backfill_production_rollup,
+    backfill_serial_no_movements,
+    rebuild_batch_genealogy,
+    reconcile_stock_balances,
+    recost_boms,
+    rebuild_bom_where_used,
+    rebuild_control_charts,
+    benchmark_trace_serials,
+    benchmark_work_orders
+]
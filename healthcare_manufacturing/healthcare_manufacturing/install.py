@@ -0,0 +1,45 @@
+import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+
+from healthcare_manufacturing.api.traceability import REPORT_ORDER, set_stock_ledger_trace_keys
+from healthcare_manufacturing.inventory.doctype.stock_balance.stock_balance import (
+    SETTLED_INDEX, reconcile_stock_balances)
+
+CUSTOM_FIELDS = {
+    "Stock Ledger Entry": [
+        {
+            "fieldname": "trace_key",
+            "label": "Trace Key",
+            "fieldtype": "Data",
+            "insert_after": "serial_no",
+            "read_only": 1,
+            "hidden": 1,
+            "no_copy": 1
+        },
+        {
+            "fieldname": "balance_settled",
+            "label": "Balance Settled",
+            "fieldtype": "Check",
+            "insert_after": "trace_key",
+            "default": "0",
+            "read_only": 1,
+            "hidden": 1,
+            "no_copy": 1
+        }
+    ]
+}
+
+def after_install():
+    setup_custom_fields()
+    set_stock_ledger_trace_keys()
+    seed_stock_balances()
+
+def setup_custom_fields():
+    """Add the app's stock ledger fields with their indexes"""
+    create_custom_fields(CUSTOM_FIELDS, update=True)
+    frappe.db.add_index("Stock Ledger Entry", REPORT_ORDER)
+    frappe.db.add_index("Stock Ledger Entry", SETTLED_INDEX)
+
+def seed_stock_balances():
+    """Set the running balances from the existing stock ledger, which postings only increment"""
+    reconcile_stock_balances(fix=True)
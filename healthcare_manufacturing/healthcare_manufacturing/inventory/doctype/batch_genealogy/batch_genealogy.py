@@ -0,0 +1,227 @@
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now
+
+from healthcare_manufacturing.inventory.trace_cache import invalidate_traces
+from healthcare_manufacturing.utils.db import chunked, make_row_name, upsert
+
+# Transitive closure of batch links: one row per (ancestor, descendant, depth)
+# with the number of distinct paths of that length, so removing a link is the
+# exact inverse of adding it. Every linked batch also has a depth 0 row to itself.
+CLOSURE_FIELDS = ["name", "ancestor_batch", "descendant_batch", "depth", "path_count",
+    "ancestor_item", "descendant_item"]
+
+class BatchGenealogy(Document):
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Batch Genealogy", ["ancestor_batch", "depth"])
+
+def ensure_batch_nodes(batches):
+    items = dict(frappe.db.sql("""
+        SELECT name, item FROM `tabBatch` WHERE name IN %s
+    """, [tuple(batches)]))
+
+    upsert("Batch Genealogy", CLOSURE_FIELDS, [
+        [make_row_name(batch, batch, 0), batch, batch, 0, 1, items.get(batch), items.get(batch)]
+        for batch in batches
+    ])
+
+def apply_link(input_batch, output_batch, sign):
+    """Add (``sign`` 1) or remove (``sign`` -1) every path running through one link.
+
+    Returns the ancestors of ``input_batch`` and the descendants of
+    ``output_batch``: every closure row changed has its ancestor in the first
+    and its descendant in the second.
+    """
+    ancestors, descendants = get_link_batches(input_batch, output_batch)
+    invalidate_traces("batch", ancestors | descendants)
+    timestamp, user = now(), frappe.session.user
+    frappe.db.sql("""
+        INSERT INTO `tabBatch Genealogy` (name, creation, modified, owner, modified_by,
+            ancestor_batch, descendant_batch, depth, path_count, ancestor_item, descendant_item)
+        SELECT MD5(CONCAT_WS('|', a.ancestor_batch, d.descendant_batch, a.depth + d.depth + 1)),
+            %(timestamp)s, %(timestamp)s, %(user)s, %(user)s,
+            a.ancestor_batch, d.descendant_batch, a.depth + d.depth + 1,
+            %(sign)s * a.path_count * d.path_count, a.ancestor_item, d.descendant_item
+        FROM `tabBatch Genealogy` a
+        INNER JOIN `tabBatch Genealogy` d ON d.ancestor_batch = %(output_batch)s
+        WHERE a.descendant_batch = %(input_batch)s
+        ON DUPLICATE KEY UPDATE
+            path_count = path_count + VALUES(path_count),
+            modified = VALUES(modified)
+    """, {"timestamp": timestamp, "user": user, "sign": sign,
+        "input_batch": input_batch, "output_batch": output_batch})
+
+    return ancestors, descendants
+
+def get_link_batches(input_batch, output_batch):
+    """Batches whose genealogy a link changes, as (ancestors of input, descendants of output)"""
+    ancestors = set(frappe.db.sql_list("""
+        SELECT ancestor_batch FROM `tabBatch Genealogy` WHERE descendant_batch = %s
+    """, input_batch))
+    descendants = set(frappe.db.sql_list("""
+        SELECT descendant_batch FROM `tabBatch Genealogy` WHERE ancestor_batch = %s
+    """, output_batch))
+    return ancestors | {input_batch}, descendants | {output_batch}
+
+def is_ancestor(batch, of_batch):
+    return bool(frappe.db.sql("""
+        SELECT name FROM `tabBatch Genealogy`
+        WHERE ancestor_batch = %s AND descendant_batch = %s
+        LIMIT 1
+    """, (batch, of_batch)))
+
+def add_batch_links(voucher_type, voucher_no, links):
+    """Record ``(input_batch, output_batch)`` links made by a voucher and extend the closure"""
+    links = list(dict.fromkeys((i, o) for i, o in links if i and o and i != o))
+    if not links:
+        return
+
+    ensure_batch_nodes({batch for link in links for batch in link})
+
+    for input_batch, output_batch in links:
+        if is_ancestor(output_batch, input_batch):
+            frappe.log_error(title="Batch genealogy cycle skipped",
+                message=f"{voucher_type} {voucher_no}: {output_batch} is already an ancestor of {input_batch}")
+            continue
+
+        apply_link(input_batch, output_batch, 1)
+        frappe.get_doc({
+            "doctype": "Batch Genealogy Link",
+            "input_batch": input_batch,
+            "output_batch": output_batch,
+            "voucher_type": voucher_type,
+            "voucher_no": voucher_no
+        }).db_insert()
+
+def remove_batch_links(voucher_type, voucher_no):
+    """Undo every link recorded for a voucher"""
+    links = frappe.get_all("Batch Genealogy Link",
+        filters={"voucher_type": voucher_type, "voucher_no": voucher_no},
+        fields=["name", "input_batch", "output_batch"])
+
+    # rows emptied by one link may be decremented again by the next, so they
+    # are deleted once every link is undone, among the pairs the links touched
+    touched = [apply_link(link.input_batch, link.output_batch, -1) for link in links]
+    for ancestors, descendants in touched:
+        for chunk in chunked(sorted(ancestors), 1000):
+            frappe.db.sql("""
+                DELETE FROM `tabBatch Genealogy`
+                WHERE ancestor_batch IN %s AND descendant_batch IN %s
+                    AND depth > 0 AND path_count <= 0
+            """, [tuple(chunk), tuple(descendants)])
+
+    if links:
+        frappe.db.delete("Batch Genealogy Link", {"name": ["in", [link.name for link in links]]})
+
+def get_stock_entry_links(doc):
+    """Every consumed batch of a Manufacture entry feeds every produced batch"""
+    consumed = [d.batch_no for d in doc.items if d.s_warehouse and d.batch_no]
+    produced = [d.batch_no for d in doc.items if d.t_warehouse and not d.s_warehouse and d.batch_no]
+    return [(input_batch, output_batch) for input_batch in consumed for output_batch in produced]
+
+def update_batch_genealogy(doc, method=None):
+    """doc_events handler for Manufacture Stock Entries"""
+    if doc.stock_entry_type != "Manufacture":
+        return
+
+    if method == "on_cancel":
+        remove_batch_links(doc.doctype, doc.name)
+    else:
+        add_batch_links(doc.doctype, doc.name, get_stock_entry_links(doc))
+
+def get_batch_relatives(batch_nos, direction="descendants"):
+    """``{batch_no: [related batches]}`` for many batches, at any depth, in one indexed query"""
+    this, other = ("ancestor", "descendant") if direction == "descendants" else ("descendant", "ancestor")
+    relatives = {batch_no: [] for batch_no in batch_nos}
+    if not relatives:
+        return relatives
+
+    for row in frappe.db.sql(f"""
+        SELECT {this}_batch AS source_batch, {other}_batch AS batch_no,
+            {other}_item AS item_code, MIN(depth) AS depth
+        FROM `tabBatch Genealogy`
+        WHERE {this}_batch IN %s AND depth > 0
+        GROUP BY {this}_batch, {other}_batch, {other}_item
+        ORDER BY depth, {other}_batch
+    """, [tuple(relatives)], as_dict=True):
+        relatives[row.pop("source_batch")].append(row)
+    return relatives
+
+def get_batch_descendants(batch_no):
+    """Every batch made, at any depth, from ``batch_no``"""
+    return get_batch_relatives([batch_no], "descendants")[batch_no]
+
+def get_batch_ancestors(batch_no):
+    """Every batch, at any depth, that went into ``batch_no``"""
+    return get_batch_relatives([batch_no], "ancestors")[batch_no]
+
+def get_forward_traces(batch_nos, chunk_size=1000):
+    """Finished batches, serial numbers and customer deliveries downstream of each batch.
+
+    Downstream batches of all ``batch_nos`` are resolved together with IN lists
+    of at most ``chunk_size`` and the rows are assigned back to every source
+    batch they descend from.
+    """
+    descendants = get_batch_relatives(batch_nos, "descendants")
+    sources = {}
+    for batch_no, relatives in descendants.items():
+        for downstream in [batch_no] + [d.batch_no for d in relatives]:
+            sources.setdefault(downstream, []).append(batch_no)
+
+    traces = {batch_no: {"descendants": descendants[batch_no], "serial_nos": [], "deliveries": []}
+        for batch_no in descendants}
+
+    for chunk in chunked(list(sources), chunk_size):
+        for serial in frappe.db.sql("""
+            SELECT name AS serial_no, item_code, batch_no, status, warehouse
+            FROM `tabSerial No`
+            WHERE batch_no IN %s
+        """, [tuple(chunk)], as_dict=True):
+            for batch_no in sources[serial.batch_no]:
+                traces[batch_no]["serial_nos"].append(serial)
+
+        for delivery in frappe.db.sql("""
+            SELECT dn.name AS delivery_note, dn.posting_date, dn.customer,
+                item.item_code, item.batch_no, item.qty
+            FROM `tabDelivery Note Item` item
+            INNER JOIN `tabDelivery Note` dn ON dn.name = item.parent
+            WHERE item.batch_no IN %s AND dn.docstatus = 1
+        """, [tuple(chunk)], as_dict=True):
+            for batch_no in sources[delivery.batch_no]:
+                traces[batch_no]["deliveries"].append(delivery)
+
+    for trace in traces.values():
+        trace["deliveries"].sort(key=lambda d: (d.posting_date, d.delivery_note))
+        trace["customers"] = sorted({d.customer for d in trace["deliveries"] if d.customer})
+
+    return traces
+
+def get_forward_trace(batch_no):
+    """Finished batches, serial numbers and customer deliveries downstream of a batch"""
+    return get_forward_traces([batch_no])[batch_no]
+
+def rebuild_batch_genealogy(chunk_size=500):
+    """Rebuild the genealogy from submitted batch tracking records and Manufacture entries"""
+    frappe.db.delete("Batch Genealogy")
+    frappe.db.delete("Batch Genealogy Link")
+    frappe.db.commit()
+
+    for doctype, filters in (("Production Batch Tracking", {"docstatus": 1}),
+            ("Stock Entry", {"docstatus": 1, "stock_entry_type": "Manufacture"})):
+        start = 0
+        while True:
+            names = frappe.get_all(doctype, filters=filters, pluck="name",
+                order_by="creation", start=start, page_length=chunk_size)
+            if not names:
+                break
+
+            for name in names:
+                doc = frappe.get_doc(doctype, name)
+                if doctype == "Stock Entry":
+                    update_batch_genealogy(doc, "on_submit")
+                else:
+                    doc.update_batch_genealogy()
+            frappe.db.commit()
+            start += chunk_size
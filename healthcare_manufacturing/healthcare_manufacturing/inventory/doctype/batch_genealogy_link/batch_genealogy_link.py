@@ -0,0 +1,8 @@
+import frappe
+from frappe.model.document import Document
+
+class BatchGenealogyLink(Document):
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Batch Genealogy Link", ["voucher_type", "voucher_no"])
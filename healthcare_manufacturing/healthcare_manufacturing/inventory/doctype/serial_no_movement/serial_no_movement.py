@@ -0,0 +1,89 @@
+import re
+
+import frappe
+from frappe.model.document import Document
+
+from healthcare_manufacturing.utils.db import make_row_name, upsert
+
+# Vouchers whose item rows carry newline separated serial numbers
+VOUCHER_ITEM_TABLES = {
+    "Purchase Receipt": "Purchase Receipt Item",
+    "Stock Entry": "Stock Entry Detail",
+    "Delivery Note": "Delivery Note Item"
+}
+
+MOVEMENT_FIELDS = ["name", "serial_no", "item_code", "voucher_type", "voucher_no", "voucher_detail_no"]
+
+class SerialNoMovement(Document):
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Serial No Movement", ["voucher_type", "voucher_no"])
+
+def parse_serial_nos(serial_nos):
+    """Split a serial number text field into unique serial numbers, keeping their order"""
+    return list(dict.fromkeys(s.strip() for s in re.split(r"[\n,]", serial_nos or "") if s.strip()))
+
+def get_movement_rows(voucher_type, voucher_no, items):
+    rows = []
+    for item in items:
+        for serial_no in parse_serial_nos(item.serial_no):
+            rows.append([make_row_name(serial_no, voucher_type, item.name), serial_no,
+                item.item_code, voucher_type, voucher_no, item.name])
+    return rows
+
+def update_serial_no_movements(doc, method=None):
+    """Index the serial numbers of a voucher on submit and drop them on cancel"""
+    if doc.doctype not in VOUCHER_ITEM_TABLES:
+        return
+
+    frappe.db.sql("""
+        DELETE FROM `tabSerial No Movement`
+        WHERE voucher_type = %s AND voucher_no = %s
+    """, (doc.doctype, doc.name))
+
+    if method != "on_cancel":
+        upsert("Serial No Movement", MOVEMENT_FIELDS,
+            get_movement_rows(doc.doctype, doc.name, doc.items))
+
+def get_serial_no_movements(serial_no):
+    """Voucher rows that moved ``serial_no``, grouped by voucher type, from one indexed query"""
+    movements = {}
+    for row in frappe.db.sql("""
+        SELECT voucher_type, voucher_no, voucher_detail_no
+        FROM `tabSerial No Movement`
+        WHERE serial_no = %s
+    """, serial_no, as_dict=True):
+        movements.setdefault(row.voucher_type, []).append(row)
+    return movements
+
+def backfill_serial_no_movements(chunk_size=5000):
+    """Index serial numbers of every submitted voucher, committing per chunk of item rows"""
+    indexed = 0
+    for voucher_type, item_table in VOUCHER_ITEM_TABLES.items():
+        last_name = ""
+        while True:
+            items = frappe.db.sql(f"""
+                SELECT item.name, item.parent, item.item_code, item.serial_no
+                FROM `tab{item_table}` item
+                INNER JOIN `tab{voucher_type}` voucher ON voucher.name = item.parent
+                WHERE item.name > %s
+                    AND voucher.docstatus = 1
+                    AND IFNULL(item.serial_no, '') != ''
+                ORDER BY item.name
+                LIMIT %s
+            """, (last_name, chunk_size), as_dict=True)
+
+            if not items:
+                break
+
+            rows = []
+            for item in items:
+                rows.extend(get_movement_rows(voucher_type, item.parent, [item]))
+            upsert("Serial No Movement", MOVEMENT_FIELDS, rows)
+            frappe.db.commit()
+
+            indexed += len(rows)
+            last_name = items[-1].name
+
+    return indexed
@@ -0,0 +1,358 @@
+import time
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import flt, now
+
+from healthcare_manufacturing.utils.db import chunked, make_row_name, upsert
+
+# Running balances of the stock ledger: one row per item and warehouse with an
+# empty batch_no, plus one row per item, warehouse and batch. actual_qty is
+# updated by every posting; settled_qty is the ledger total of the entries the
+# hourly update_stock_balances job has folded in and flagged balance_settled,
+# which it uses to verify actual_qty.
+BALANCE_FIELDS = ["name", "item_code", "warehouse", "batch_no", "actual_qty"]
+SETTLED_FIELDS = ["name", "item_code", "warehouse", "batch_no", "settled_qty"]
+RESERVED_FIELDS = ["name", "item_code", "warehouse", "batch_no", "reserved_qty"]
+RESERVATION_FIELDS = ["name", "creation", "modified", "owner", "modified_by",
+    "item_code", "warehouse", "qty", "voucher_type", "voucher_no"]
+BALANCE_PRECISION = 1e-6
+
+# Entries are picked up by their balance_settled flag rather than a position in
+# the ledger: creation is set before the posting commits, so a late commit can
+# land behind any watermark but is still unsettled when the next run looks.
+SETTLED_INDEX = ["balance_settled", "creation", "name"]
+SETTLE_CHUNK = 50000
+MAX_ROWS_PER_RUN = 2000000
+STOCK_BALANCE_LOCK = "hm_update_stock_balances"
+
+class StockBalance(Document):
+    pass
+
+class InsufficientStockError(frappe.ValidationError):
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Stock Balance", ["item_code", "warehouse"])
+
+def get_balance_name(item_code, warehouse, batch_no=None):
+    return make_row_name(item_code, warehouse, batch_no or "")
+
+def get_balance_deltas(entries):
+    """``{(item_code, warehouse, batch_no): qty}`` summed over ledger ``entries``"""
+    deltas = {}
+    for sle in entries:
+        for batch_no in {"", sle.batch_no or ""}:
+            key = (sle.item_code, sle.warehouse, batch_no)
+            deltas[key] = deltas.get(key, 0) + flt(sle.actual_qty)
+    return deltas
+
+def update_stock_balance(doc, method=None):
+    """doc_events handler: add a ledger entry to the running balances.
+
+    The increment runs in the posting transaction and never reads the stored
+    balance, so concurrent postings of the same item cannot overwrite each other.
+    Cancellation reversals are ledger entries of their own and net out here.
+    """
+    upsert("Stock Balance", BALANCE_FIELDS,
+        [[get_balance_name(*key), *key, qty] for key, qty in get_balance_deltas([doc]).items()],
+        increment=("actual_qty",))
+
+def get_available_qty(item_codes, warehouse=None):
+    """``{item_code: qty}`` over all warehouses, or one ``warehouse``, in a single query"""
+    available = dict.fromkeys(item_codes, 0)
+    if not available:
+        return available
+
+    conditions, values = "", {"item_codes": tuple(available)}
+    if warehouse:
+        conditions = "AND warehouse = %(warehouse)s"
+        values["warehouse"] = warehouse
+
+    for item_code, qty in frappe.db.sql(f"""
+        SELECT item_code, SUM(actual_qty)
+        FROM `tabStock Balance`
+        WHERE item_code IN %(item_codes)s AND batch_no = '' {conditions}
+        GROUP BY item_code
+    """, values):
+        available[item_code] = flt(qty)
+
+    return available
+
+def get_batch_qty(batch_nos, warehouse=None):
+    """``{batch_no: qty}`` over all warehouses, or one ``warehouse``, in a single query"""
+    available = dict.fromkeys(batch_nos, 0)
+    if not available:
+        return available
+
+    conditions, values = "", {"batch_nos": tuple(available)}
+    if warehouse:
+        conditions = "AND warehouse = %(warehouse)s"
+        values["warehouse"] = warehouse
+
+    for batch_no, qty in frappe.db.sql(f"""
+        SELECT batch_no, SUM(actual_qty)
+        FROM `tabStock Balance`
+        WHERE batch_no IN %(batch_nos)s {conditions}
+        GROUP BY batch_no
+    """, values):
+        available[batch_no] = flt(qty)
+
+    return available
+
+def reserve_stock(voucher_type, voucher_no, items, warehouse):
+    """Reserve ``(item_code, qty)`` pairs in ``warehouse`` for a voucher, all of them or none.
+
+    The balances of all items are locked in name order and compared against
+    their actual minus reserved qty in the caller's transaction, so concurrent
+    reservations of the same stock queue up instead of both passing the check.
+    Every shortage is reported in one error.
+    """
+    required = {}
+    for item_code, qty in items:
+        required[item_code] = required.get(item_code, 0) + flt(qty)
+    if not required:
+        return
+
+    names = {get_balance_name(item_code, warehouse): item_code for item_code in required}
+    balances = {row.name: row for row in frappe.db.sql("""
+        SELECT name, actual_qty, reserved_qty
+        FROM `tabStock Balance`
+        WHERE name IN %s
+        ORDER BY name
+        FOR UPDATE
+    """, [tuple(sorted(names))], as_dict=True)}
+
+    shortages = []
+    for name, item_code in names.items():
+        balance = balances.get(name)
+        available = flt(balance.actual_qty) - flt(balance.reserved_qty) if balance else 0
+        if required[item_code] > available + BALANCE_PRECISION:
+            shortages.append(_("{0}: {1} required, {2} available in {3}").format(
+                item_code, required[item_code], max(available, 0), warehouse))
+
+    if shortages:
+        frappe.throw(shortages, InsufficientStockError, title=_("Insufficient Stock"), as_list=True)
+
+    upsert("Stock Balance", RESERVED_FIELDS,
+        [[name, names[name], warehouse, "", required[names[name]]] for name in sorted(names)],
+        increment=("reserved_qty",))
+
+    timestamp, user = now(), frappe.session.user
+    frappe.db.bulk_insert("Stock Reservation", RESERVATION_FIELDS, [
+        [frappe.generate_hash(length=10), timestamp, timestamp, user, user,
+            item_code, warehouse, qty, voucher_type, voucher_no]
+        for item_code, qty in required.items()
+    ])
+
+def release_stock(voucher_type, voucher_no):
+    """Give back everything reserved for a voucher"""
+    reserved = frappe.db.sql("""
+        SELECT item_code, warehouse, SUM(qty)
+        FROM `tabStock Reservation`
+        WHERE voucher_type = %s AND voucher_no = %s
+        GROUP BY item_code, warehouse
+    """, (voucher_type, voucher_no))
+    if not reserved:
+        return
+
+    upsert("Stock Balance", RESERVED_FIELDS,
+        sorted([get_balance_name(item_code, warehouse), item_code, warehouse, "", -flt(qty)]
+            for item_code, warehouse, qty in reserved),
+        increment=("reserved_qty",))
+
+    frappe.db.delete("Stock Reservation", {"voucher_type": voucher_type, "voucher_no": voucher_no})
+
+def get_ledger_balances(item_codes):
+    """``{key: [total, settled total]}`` for ``item_codes`` summed from the ledger itself.
+
+    Cancelled vouchers post reversing entries, so summing every entry equals
+    summing the uncancelled ones and stays right for any prefix of the ledger.
+    """
+    rows = frappe.db.sql("""
+        SELECT item_code, warehouse, batch_no, SUM(actual_qty),
+            SUM(CASE WHEN balance_settled = 1 THEN actual_qty ELSE 0 END)
+        FROM `tabStock Ledger Entry`
+        WHERE item_code IN %s
+        GROUP BY item_code, warehouse, batch_no
+    """, [tuple(item_codes)])
+
+    balances = {}
+    for item_code, warehouse, batch_no, total, settled in rows:
+        for key in {(item_code, warehouse, ""), (item_code, warehouse, batch_no or "")}:
+            balance = balances.setdefault(key, [0, 0])
+            balance[0] += flt(total)
+            balance[1] += flt(settled)
+    return balances
+
+def get_stored_balances(item_codes, for_update=False):
+    rows = frappe.db.sql(f"""
+        SELECT item_code, warehouse, batch_no, actual_qty, settled_qty
+        FROM `tabStock Balance`
+        WHERE item_code IN %s
+        {"FOR UPDATE" if for_update else ""}
+    """, [tuple(item_codes)])
+    return {(item_code, warehouse, batch_no or ""): [flt(actual), flt(settled)]
+        for item_code, warehouse, batch_no, actual, settled in rows}
+
+def get_drift(expected, stored):
+    drift = {}
+    for key in expected.keys() | stored.keys():
+        difference = [e - s for e, s in zip(expected.get(key, (0, 0)), stored.get(key, (0, 0)))]
+        if any(abs(d) > BALANCE_PRECISION for d in difference):
+            drift[key] = difference
+    return drift
+
+def reconcile_stock_balances(fix=False, chunk_size=500, item_codes=None):
+    """Verify the running balances of ``item_codes`` (default all items) against the stock ledger.
+
+    Items are verified ``chunk_size`` at a time and the drifted balances are
+    returned. With ``fix``, drifted items are checked again with their balance
+    rows locked, so postings made meanwhile are not lost, and overwritten with
+    the ledger totals.
+    """
+    if fix and not acquire_lock(timeout=600):
+        frappe.throw("Stock balances are being updated, try again later")
+
+    try:
+        mismatches = []
+        if item_codes is None:
+            item_codes = frappe.db.sql_list("SELECT name FROM `tabItem` ORDER BY name")
+
+        for chunk in chunked(item_codes, chunk_size):
+            drift = get_drift(get_ledger_balances(chunk), get_stored_balances(chunk))
+            if drift and fix:
+                drifted = list({item_code for item_code, warehouse, batch_no in drift})
+                frappe.db.commit()
+                # lock first so the ledger is read after every posting to these items has committed
+                stored = get_stored_balances(drifted, for_update=True)
+                expected = get_ledger_balances(drifted)
+                drift = get_drift(expected, stored)
+                upsert("Stock Balance", BALANCE_FIELDS + ["settled_qty"],
+                    [[get_balance_name(*key), *key, *expected.get(key, (0, 0))] for key in drift])
+                frappe.db.commit()
+
+            mismatches.extend({"item_code": item_code, "warehouse": warehouse, "batch_no": batch_no,
+                "actual_difference": actual, "settled_difference": settled}
+                for (item_code, warehouse, batch_no), (actual, settled) in drift.items())
+    finally:
+        if fix:
+            release_lock()
+
+    if mismatches:
+        frappe.log_error(title=f"Stock balance drift on {len(mismatches)} balances",
+            message=frappe.as_json(mismatches[:100]))
+
+    return mismatches
+
+def verify_stock_balances():
+    """Weekly scheduler job reporting balances that drifted from the ledger"""
+    reconcile_stock_balances()
+
+def acquire_lock(timeout=0):
+    """Database lock keeping one writer of the settled balances across workers"""
+    return frappe.db.sql("SELECT GET_LOCK(%s, %s)", (STOCK_BALANCE_LOCK, timeout))[0][0] == 1
+
+def release_lock():
+    frappe.db.sql("SELECT RELEASE_LOCK(%s)", STOCK_BALANCE_LOCK)
+
+def get_unsettled_entries(chunk_size):
+    return frappe.db.sql("""
+        SELECT name, creation, item_code, warehouse, batch_no, actual_qty
+        FROM `tabStock Ledger Entry`
+        WHERE balance_settled = 0
+        ORDER BY creation, name
+        LIMIT %s
+    """, chunk_size, as_dict=True)
+
+def update_stock_balances(chunk_size=SETTLE_CHUNK, max_rows=MAX_ROWS_PER_RUN):
+    """Hourly job folding the ledger entries not yet settled into the settled balances.
+
+    Unsettled entries are read from the ``balance_settled`` index in chunks,
+    summed per balance and applied as bulk increments. Each chunk commits
+    together with the flags of its entries, so every entry is folded exactly
+    once, whenever its posting commits, and a failed run resumes where it
+    stopped. A run processes at most ``max_rows`` entries; a larger backlog,
+    such as the first run over an existing ledger, is finished by the next runs.
+    ``watermark_creation`` and ``watermark_name`` of the run record the last
+    entry folded.
+    """
+    if not acquire_lock():
+        return
+
+    started = time.monotonic()
+    run = frappe.get_doc({
+        "doctype": "Stock Balance Run",
+        "status": "Running",
+        "rows_processed": 0,
+        "balances_updated": 0,
+        "drifted_balances": 0
+    })
+    run.insert(ignore_permissions=True)
+    frappe.db.commit()
+
+    touched = set()
+    try:
+        while run.rows_processed < max_rows:
+            entries = get_unsettled_entries(min(chunk_size, max_rows - run.rows_processed))
+            if not entries:
+                break
+
+            deltas = get_balance_deltas(entries)
+            upsert("Stock Balance", SETTLED_FIELDS,
+                [[get_balance_name(*key), *key, qty] for key, qty in deltas.items()],
+                increment=("settled_qty",))
+            frappe.db.sql("""
+                UPDATE `tabStock Ledger Entry` SET balance_settled = 1 WHERE name IN %s
+            """, [tuple(entry.name for entry in entries)])
+
+            run.watermark_creation, run.watermark_name = entries[-1].creation, entries[-1].name
+            run.rows_processed += len(entries)
+            run.balances_updated += len(deltas)
+            run.db_update()
+            frappe.db.commit()
+            touched.update(deltas)
+
+        drifted = get_drifted_balances(touched)
+        if drifted:
+            frappe.log_error(title=f"Stock balance drift on {len(drifted)} balances",
+                message=frappe.as_json(drifted[:100]))
+        run.drifted_balances = len(drifted)
+        run.status = "Success"
+    except Exception:
+        frappe.db.rollback()
+        run.reload()
+        run.status = "Failed"
+        run.error = frappe.get_traceback()
+        frappe.log_error(title="Stock balance update failed")
+    finally:
+        run.duration = round(time.monotonic() - started, 3)
+        run.db_update()
+        frappe.db.commit()
+        release_lock()
+
+    return run
+
+def get_drifted_balances(keys, chunk_size=500):
+    """Balances among ``keys`` whose running qty is not the settled qty plus the unsettled ledger"""
+    drifted = []
+    for item_codes in chunked(list({key[0] for key in keys}), chunk_size):
+        frappe.db.commit()
+        # lock first so the tail is read after every posting to these balances has committed
+        stored = get_stored_balances(item_codes, for_update=True)
+        tail = get_balance_deltas(frappe.db.sql("""
+            SELECT item_code, warehouse, batch_no, SUM(actual_qty) AS actual_qty
+            FROM `tabStock Ledger Entry`
+            WHERE balance_settled = 0 AND item_code IN %s
+            GROUP BY item_code, warehouse, batch_no
+        """, [tuple(item_codes)], as_dict=True))
+        frappe.db.commit()
+
+        for key, (actual, settled) in stored.items():
+            difference = settled + tail.get(key, 0) - actual
+            if key in keys and abs(difference) > BALANCE_PRECISION:
+                drifted.append({"item_code": key[0], "warehouse": key[1], "batch_no": key[2],
+                    "difference": difference})
+
+    return drifted
@@ -0,0 +1,8 @@
+import frappe
+from frappe.model.document import Document
+
+class StockReservation(Document):
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Stock Reservation", ["voucher_type", "voucher_no"])
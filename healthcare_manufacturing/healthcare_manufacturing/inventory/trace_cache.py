@@ -0,0 +1,135 @@
+import pickle
+
+import frappe
+
+from healthcare_manufacturing.inventory.doctype.serial_no_movement.serial_no_movement import parse_serial_nos
+
+# Traces are stored per serial or batch in Redis next to a version counter that
+# every change touching that serial or batch increments. A trace is only served
+# when it was computed under the current version, so invalidation is exact and
+# a trace computed concurrently with a change can never be served after it.
+TRACE_PREFIX = "hm_trace"
+TRACE_VERSIONS = "hm_trace:version"
+TRACE_STATS = "hm_trace:stats"
+TRACE_TTL = 6 * 60 * 60
+
+
+def get_entry_key(kind, name):
+    return frappe.cache().make_key(f"{TRACE_PREFIX}:{kind}:{name}")
+
+
+def get_cached_traces(kind, names, get_traces):
+    """``get_traces(names)`` served from the trace cache wherever the cached trace is current"""
+    if not names:
+        return {}
+
+    cache = frappe.cache()
+    fields = [f"{kind}:{name}" for name in names]
+    versions = cache.hmget(cache.make_key(TRACE_VERSIONS), fields)
+    entries = cache.mget([get_entry_key(kind, name) for name in names])
+
+    traces, missing = {}, []
+    for name, version, entry in zip(names, versions, entries):
+        if entry:
+            entry_version, trace = pickle.loads(entry)
+            if entry_version == version:
+                traces[name] = trace
+                continue
+        missing.append(name)
+
+    record_stats(hits=len(traces), misses=len(missing))
+    if not missing:
+        return traces
+
+    computed = get_traces(missing)
+    pipeline = cache.pipeline()
+    for name, version in zip(names, versions):
+        if name in computed and name not in traces:
+            # stored under the version read before querying, so a change made
+            # meanwhile leaves it outdated
+            pipeline.setex(get_entry_key(kind, name), TRACE_TTL, pickle.dumps((version, computed[name])))
+    pipeline.execute()
+
+    traces.update(computed)
+    return traces
+
+
+def invalidate_traces(kind, names):
+    """Outdate cached traces now and again once the transaction ends.
+
+    The first bump hides them from the rest of this transaction, the second one
+    drops traces computed meanwhile, from the old data by other workers or from
+    data of this transaction that was rolled back.
+    """
+    fields = list({f"{kind}:{name}" for name in names if name})
+    if not fields:
+        return
+
+    bump_versions(fields)
+    record_stats(invalidations=len(fields))
+    frappe.db.after_commit.add(lambda: bump_versions(fields))
+    frappe.db.after_rollback.add(lambda: bump_versions(fields))
+
+
+def bump_versions(fields):
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+    for field in fields:
+        pipeline.hincrby(cache.make_key(TRACE_VERSIONS), field, 1)
+    pipeline.execute()
+
+
+def invalidate_batch_traces(batch_nos):
+    """Outdate traces of ``batch_nos`` and of every batch they were made from.
+
+    Upstream traces list the serials and deliveries of their descendants.
+    """
+    batch_nos = {batch_no for batch_no in batch_nos if batch_no}
+    if not batch_nos:
+        return
+
+    ancestors = frappe.db.sql_list("""
+        SELECT DISTINCT ancestor_batch FROM `tabBatch Genealogy`
+        WHERE descendant_batch IN %s
+    """, [tuple(batch_nos)])
+    invalidate_traces("batch", batch_nos.union(ancestors))
+
+
+def invalidate_trace_cache(doc, method=None):
+    """doc_events handler for ledger entries, inspections and deliveries touching serials or batches"""
+    rows = doc.get("items") or [doc]
+    serial_nos, batch_nos = set(), set()
+    for row in rows:
+        serial_nos.update(parse_serial_nos(row.get("serial_no") or row.get("item_serial_no")))
+        batch_nos.add(row.get("batch_no"))
+
+    invalidate_traces("serial", serial_nos)
+    invalidate_batch_traces(batch_nos)
+
+
+def record_stats(**counts):
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+    for field, count in counts.items():
+        if count:
+            pipeline.hincrby(cache.make_key(TRACE_STATS), field, count)
+    pipeline.execute()
+
+
+def clear_trace_cache():
+    """Drop every cached trace, version and counter of this site"""
+    frappe.cache().delete_keys(TRACE_PREFIX)
+
+
+@frappe.whitelist()
+def get_trace_cache_stats():
+    """Hit, miss and invalidation counts of the trace cache, shared by all workers"""
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+    fields = ["hits", "misses", "invalidations"]
+    counts = cache.hmget(cache.make_key(TRACE_STATS), fields)
+    stats = {field: int(count or 0) for field, count in zip(fields, counts)}
+
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0
+    return stats
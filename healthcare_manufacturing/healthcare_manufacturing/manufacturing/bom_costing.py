@@ -0,0 +1,179 @@
+import frappe
+from frappe import _
+from frappe.utils import flt
+
+from healthcare_manufacturing.manufacturing.bom_explosion import get_default_boms
+from healthcare_manufacturing.utils.cache import get_cache, get_generations, invalidate_doctype
+from healthcare_manufacturing.utils.db import bulk_update, chunked
+
+# Item prices by price list, stamped with the Item Price generation so a
+# price change is picked up by every worker on its next lookup.
+_prices = get_cache("bom_costing_prices", maxsize=50000, ttl=60 * 60)
+
+
+def get_stock_uoms(item_codes):
+    """``{item_code: stock_uom}`` of the items that exist, in one query"""
+    uoms = {}
+    for chunk in chunked(list(set(item_codes)), 1000):
+        uoms.update(frappe.db.sql("SELECT name, stock_uom FROM `tabItem` WHERE name IN %s", [tuple(chunk)]))
+    return uoms
+
+
+def get_item_prices(item_codes, price_list=None):
+    """``{item_code: rate}`` from Item Price, the latest one per item, with one query for uncached items"""
+    version = get_generations(["Item Price"])
+    prices, missing = {}, []
+    for item_code in set(item_codes):
+        found, rate, fresh = _prices.lookup((price_list, item_code), version)
+        if found and fresh:
+            prices[item_code] = rate
+        else:
+            missing.append(item_code)
+
+    conditions = "AND price_list = %(price_list)s" if price_list else ""
+    for chunk in chunked(missing, 1000):
+        loaded = dict.fromkeys(chunk, 0)
+        for item_code, rate in frappe.db.sql(f"""
+            SELECT item_code, price_list_rate
+            FROM `tabItem Price`
+            WHERE item_code IN %(item_codes)s {conditions}
+            ORDER BY item_code, modified
+        """, {"item_codes": tuple(chunk), "price_list": price_list}):
+            loaded[item_code] = flt(rate)
+        for item_code, rate in loaded.items():
+            _prices.set((price_list, item_code), rate, version=version)
+        prices.update(loaded)
+
+    return prices
+
+
+def roll_up_costs(quantities, lines, defaults, prices):
+    """Unit cost of every BOM and rate of every line, bottom-up.
+
+    ``quantities`` maps BOMs to the qty they make, ``lines`` BOMs to their
+    ``(row, item_code, qty)`` and ``defaults`` sub-assemblies to their default
+    BOM. A line of a sub-assembly whose default BOM is in ``quantities`` is
+    costed at that BOM's unit cost, any other line at its item price. Each BOM
+    is costed once. Returns ``({bom: cost per unit}, {row: rate})``.
+    """
+    unit_costs, rates = {}, {}
+    for bom_no in quantities:
+        if bom_no in unit_costs:
+            continue
+
+        # depth first without recursion, a BOM is costed once all its sub-BOMs are
+        stack, path = [bom_no], set()
+        while stack:
+            current = stack[-1]
+            if current not in path:
+                path.add(current)
+                pending = [defaults[item_code] for row, item_code, qty in lines.get(current, ())
+                    if defaults.get(item_code) in quantities and defaults[item_code] not in unit_costs]
+                for sub_bom in pending:
+                    if sub_bom in path:
+                        frappe.throw(_("BOM recursion: {0} is used in its own tree").format(sub_bom))
+                stack.extend(pending)
+                continue
+
+            stack.pop()
+            path.discard(current)
+            if current in unit_costs:
+                continue
+
+            cost = 0
+            for row, item_code, qty in lines.get(current, ()):
+                sub_bom = defaults.get(item_code)
+                rates[row] = unit_costs[sub_bom] if sub_bom in unit_costs else flt(prices.get(item_code))
+                cost += rates[row] * flt(qty)
+            unit_costs[current] = cost / (flt(quantities[current]) or 1)
+
+    return unit_costs, rates
+
+
+def load_bom_lines(bom_nos):
+    """``(quantities, lines)`` of ``bom_nos`` and every default sub-assembly BOM below them"""
+    quantities, lines, frontier = {}, {}, set(bom_nos)
+    while frontier:
+        frontier = list(frontier)
+        quantities.update(frappe.db.sql("SELECT name, quantity FROM `tabBOM` WHERE name IN %s",
+            [tuple(frontier)]))
+        for parent, row, item_code, qty in frappe.db.sql("""
+            SELECT parent, name, item_code, qty
+            FROM `tabBOM Item`
+            WHERE parent IN %s AND parenttype = 'BOM'
+            ORDER BY parent, idx
+        """, [tuple(frontier)]):
+            lines.setdefault(parent, []).append((row, item_code, qty))
+
+        item_codes = {item_code for bom_no in frontier for row, item_code, qty in lines.get(bom_no, ())}
+        frontier = {bom_no for bom_no in get_default_boms(item_codes).values()
+            if bom_no and bom_no not in quantities}
+
+    return quantities, lines
+
+
+def get_bom_unit_costs(bom_nos, price_list=None):
+    """``{bom: raw material cost per unit}`` rolled up through all levels"""
+    if not bom_nos:
+        return {}
+
+    quantities, lines = load_bom_lines(bom_nos)
+    item_codes = {item_code for rows in lines.values() for row, item_code, qty in rows}
+    defaults = get_default_boms(item_codes)
+    unit_costs, rates = roll_up_costs(quantities, lines, defaults, get_item_prices(item_codes, price_list))
+    return {bom_no: unit_costs.get(bom_no, 0) for bom_no in bom_nos}
+
+
+def recost_all_boms(price_list=None, chunk_size=1000):
+    """Recost every draft and submitted BOM from current prices in one pass.
+
+    All BOM lines are read at once, every BOM is costed once bottom-up and the
+    line rates and BOM costs are written with bulk updates, without saving
+    the documents. Returns the number of BOMs recosted.
+    """
+    quantities, defaults, lines = {}, {}, {}
+    for name, item, quantity, is_default in frappe.db.sql("""
+        SELECT name, item, quantity, is_active = 1 AND is_default = 1 AND docstatus = 1
+        FROM `tabBOM`
+        WHERE docstatus < 2
+        ORDER BY modified
+    """):
+        quantities[name] = quantity
+        if is_default:
+            defaults[item] = name
+
+    for parent, row, item_code, qty in frappe.db.sql("""
+        SELECT bi.parent, bi.name, bi.item_code, bi.qty
+        FROM `tabBOM Item` bi
+        INNER JOIN `tabBOM` bom ON bom.name = bi.parent
+        WHERE bi.parenttype = 'BOM' AND bom.docstatus < 2
+        ORDER BY bi.parent, bi.idx
+    """):
+        lines.setdefault(parent, []).append((row, item_code, qty))
+
+    item_codes = {item_code for rows in lines.values() for row, item_code, qty in rows}
+    unit_costs, rates = roll_up_costs(quantities, lines, defaults, get_item_prices(item_codes, price_list))
+
+    bulk_update("BOM Item", ["rate", "amount"],
+        [(row, rates[row], rates[row] * flt(qty)) for rows in lines.values() for row, item_code, qty in rows],
+        chunk_size)
+    bulk_update("BOM", ["raw_material_cost"],
+        [(bom_no, unit_cost * (flt(quantities[bom_no]) or 1)) for bom_no, unit_cost in unit_costs.items()],
+        chunk_size)
+
+    return len(unit_costs)
+
+
+@frappe.whitelist()
+def enqueue_bom_recost(price_list=None):
+    """Recost all BOMs in the background, e.g. after a price list update"""
+    frappe.only_for("Manufacturing Manager")
+    frappe.enqueue("healthcare_manufacturing.manufacturing.bom_costing.recost_all_boms",
+        queue="long", timeout=3600, price_list=price_list)
+
+
+def invalidate_item_prices(doc=None, method=None):
+    """doc_events handler for Item Price: outdate cached prices now and when the transaction ends"""
+    invalidate_doctype("Item Price")
+    frappe.db.after_commit.add(lambda: invalidate_doctype("Item Price"))
+    frappe.db.after_rollback.add(lambda: invalidate_doctype("Item Price"))
@@ -0,0 +1,204 @@
+import frappe
+from frappe import _
+from frappe.utils import flt
+
+from healthcare_manufacturing.utils.cache import get_cache, get_generations, invalidate_doctype
+
+# Per-unit structure of BOMs, the default BOM of items and exploded per-unit
+# raw material vectors, shared by every caller in the process. All entries are
+# stamped with the BOM generation, which changes whenever a BOM is submitted,
+# cancelled or updated after submit.
+_cache = get_cache("bom_explosion", maxsize=8192, ttl=60 * 60)
+
+
+class BOMNode:
+    """One BOM with its components per unit of the finished item.
+
+    ``components`` holds ``(item_code, qty_per_unit, uom, sub_bom)`` where
+    ``sub_bom`` is the default BOM of a sub-assembly, or ``None`` for bought
+    or raw material.
+    """
+
+    __slots__ = ("name", "item", "components")
+
+    def __init__(self, name, item, components):
+        self.name = name
+        self.item = item
+        self.components = components
+
+
+def get_version():
+    return get_generations(["BOM"])
+
+
+def get_default_boms(item_codes, version=None):
+    """``{item_code: default BOM or None}`` with one query for the items not cached yet"""
+    version = version or get_version()
+    defaults, missing = {}, []
+    for item_code in set(item_codes):
+        found, bom, fresh = _cache.lookup(("default", item_code), version)
+        if found and fresh:
+            defaults[item_code] = bom
+        else:
+            missing.append(item_code)
+
+    if missing:
+        loaded = dict.fromkeys(missing)
+        for item, name in frappe.db.sql("""
+            SELECT item, name
+            FROM `tabBOM`
+            WHERE item IN %s AND is_active = 1 AND is_default = 1 AND docstatus = 1
+            ORDER BY modified
+        """, [tuple(missing)]):
+            loaded[item] = name
+        for item_code, bom in loaded.items():
+            _cache.set(("default", item_code), bom, version=version)
+        defaults.update(loaded)
+
+    return defaults
+
+
+def get_bom_nodes(bom_nos, version=None):
+    """``{bom: BOMNode}`` for ``bom_nos`` and every sub-assembly BOM below them.
+
+    Uncached BOMs are loaded one level at a time, with a fixed number of
+    queries per level whatever the number of BOMs on it.
+    """
+    version = version or get_version()
+    nodes, frontier = {}, set(bom_nos)
+    while frontier:
+        missing = []
+        for bom in frontier:
+            found, node, fresh = _cache.lookup(("node", bom), version)
+            if found and fresh:
+                nodes[bom] = node
+            else:
+                missing.append(bom)
+
+        if missing:
+            nodes.update(load_bom_nodes(missing, version))
+
+        frontier = {sub_bom for bom in frontier if bom in nodes
+            for item_code, qty, uom, sub_bom in nodes[bom].components
+            if sub_bom and sub_bom not in nodes}
+
+    return nodes
+
+
+def load_bom_nodes(bom_nos, version):
+    headers = frappe.db.sql("""
+        SELECT name, item, quantity FROM `tabBOM` WHERE name IN %s
+    """, [tuple(bom_nos)], as_dict=True)
+    rows = frappe.db.sql("""
+        SELECT parent, item_code, qty, uom
+        FROM `tabBOM Item`
+        WHERE parent IN %s
+        ORDER BY parent, idx
+    """, [tuple(bom_nos)], as_dict=True)
+    defaults = get_default_boms({row.item_code for row in rows}, version)
+
+    quantities = {header.name: flt(header.quantity) or 1 for header in headers}
+    components = {header.name: [] for header in headers}
+    for row in rows:
+        if row.parent in components:
+            components[row.parent].append((row.item_code, flt(row.qty) / quantities[row.parent],
+                row.uom, defaults.get(row.item_code)))
+
+    nodes = {}
+    for header in headers:
+        nodes[header.name] = BOMNode(header.name, header.item, components[header.name])
+        _cache.set(("node", header.name), nodes[header.name], version=version)
+    return nodes
+
+
+def get_bom_items(bom_no, version=None, nodes=None):
+    """``({item_code: qty per unit}, {item_code: uom})`` of the first-level components of ``bom_no``.
+
+    Sub-assemblies stay items of their own, as a Work Order consumes them; see
+    :func:`get_exploded_items` for the raw materials of every level.
+    """
+    version = version or get_version()
+    node = nodes.get(bom_no) if nodes is not None else None
+    if node is None:
+        found, node, fresh = _cache.lookup(("node", bom_no), version)
+        if not (found and fresh):
+            node = load_bom_nodes([bom_no], version).get(bom_no)
+    if node is None:
+        frappe.throw(_("BOM {0} does not exist").format(bom_no), frappe.DoesNotExistError)
+
+    quantities, uoms = {}, {}
+    for item_code, qty, uom, sub_bom in node.components:
+        quantities[item_code] = quantities.get(item_code, 0) + qty
+        uoms.setdefault(item_code, uom)
+    return quantities, uoms
+
+
+def get_exploded_items(bom_no, version=None, nodes=None):
+    """``({item_code: qty per unit}, {item_code: uom})`` of the raw materials of ``bom_no`` at all levels"""
+    version = version or get_version()
+    found, exploded, fresh = _cache.lookup(("exploded", bom_no), version)
+    if found and fresh:
+        return exploded
+
+    nodes = nodes if nodes is not None else get_bom_nodes([bom_no], version)
+    return explode_node(bom_no, nodes, version, ())
+
+
+def explode_node(bom_no, nodes, version, path):
+    found, exploded, fresh = _cache.lookup(("exploded", bom_no), version)
+    if found and fresh:
+        return exploded
+
+    if bom_no in path:
+        frappe.throw(_("BOM recursion: {0}").format(" > ".join(path + (bom_no,))))
+    if bom_no not in nodes:
+        frappe.throw(_("BOM {0} does not exist").format(bom_no), frappe.DoesNotExistError)
+
+    quantities, uoms = {}, {}
+    for item_code, qty, uom, sub_bom in nodes[bom_no].components:
+        if sub_bom:
+            sub_quantities, sub_uoms = explode_node(sub_bom, nodes, version, path + (bom_no,))
+            for sub_item, sub_qty in sub_quantities.items():
+                quantities[sub_item] = quantities.get(sub_item, 0) + qty * sub_qty
+            uoms.update(sub_uoms)
+        else:
+            quantities[item_code] = quantities.get(item_code, 0) + qty
+            uoms.setdefault(item_code, uom)
+
+    exploded = (quantities, uoms)
+    _cache.set(("exploded", bom_no), exploded, version=version)
+    return exploded
+
+
+def explode_bom(bom_no, qty):
+    """Raw materials needed for ``qty`` units of ``bom_no``: ``{item_code: (qty, uom)}``"""
+    quantities, uoms = get_exploded_items(bom_no)
+    return {item_code: (per_unit * flt(qty), uoms.get(item_code))
+        for item_code, per_unit in quantities.items()}
+
+
+def explode_boms(requirements):
+    """Raw materials for many ``(bom_no, qty)`` pairs in one pass: ``{item_code: (qty, uom)}``
+
+    All BOMs are loaded together and each distinct BOM is exploded once; the
+    quantities are its cached per-unit vector scaled by the required qty.
+    """
+    version = get_version()
+    requirements = [(bom_no, flt(qty)) for bom_no, qty in requirements if bom_no]
+    nodes = get_bom_nodes({bom_no for bom_no, qty in requirements}, version)
+
+    totals, uoms = {}, {}
+    for bom_no, qty in requirements:
+        quantities, bom_uoms = get_exploded_items(bom_no, version, nodes)
+        for item_code, per_unit in quantities.items():
+            totals[item_code] = totals.get(item_code, 0) + per_unit * qty
+        uoms.update(bom_uoms)
+
+    return {item_code: (qty, uoms.get(item_code)) for item_code, qty in totals.items()}
+
+
+def invalidate_bom_explosions(doc=None, method=None):
+    """doc_events handler for BOM: outdate cached structures now and when the transaction ends"""
+    invalidate_doctype("BOM")
+    frappe.db.after_commit.add(lambda: invalidate_doctype("BOM"))
+    frappe.db.after_rollback.add(lambda: invalidate_doctype("BOM"))
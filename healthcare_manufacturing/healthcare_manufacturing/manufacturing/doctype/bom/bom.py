@@ -1,5 +1,12 @@
 import frappe
 from frappe.model.document import Document
+from frappe.utils import flt
+
+from healthcare_manufacturing.manufacturing.bom_costing import (
+    get_bom_unit_costs, get_item_prices, get_stock_uoms)
+from healthcare_manufacturing.manufacturing.bom_explosion import get_default_boms
+from healthcare_manufacturing.manufacturing.doctype.bom_where_used.bom_where_used import (
+    get_where_used as get_where_used_index, update_bom_where_used)
 
 class BOM(Document):
     def validate(self):
@@ -14,21 +21,34 @@ class BOM(Document):
     def validate_bom_items(self):
         if not self.items:
             frappe.throw("BOM must have at least one item")
-        
-        for item in self.items:
-            if not frappe.db.exists("Item", item.item_code):
-                frappe.throw(f"Item {item.item_code} does not exist")
 
     def set_bom_material_details(self):
+        """Stock UOM and rate of every line: sub-assemblies at the rolled-up cost of their default BOM"""
+        item_codes = [item.item_code for item in self.items]
+        uoms = get_stock_uoms(item_codes)
+        prices = get_item_prices(item_codes)
+        defaults = get_default_boms(item_codes)
+        sub_assembly_costs = get_bom_unit_costs(
+            list({bom for bom in defaults.values() if bom and bom != self.name}))
+        
+        self.raw_material_cost = 0
         for item in self.items:
-            item_doc = frappe.get_doc("Item", item.item_code)
-            item.uom = item_doc.stock_uom
-            item.rate = frappe.db.get_value("Item Price", 
-                {"item_code": item.item_code}, "price_list_rate") or 0
+            if item.item_code not in uoms:
+                frappe.throw(f"Item {item.item_code} does not exist")
+            
+            item.uom = uoms[item.item_code]
+            item.rate = sub_assembly_costs.get(defaults[item.item_code], prices[item.item_code])
+            item.amount = flt(item.rate) * flt(item.qty)
+            self.raw_material_cost += item.amount
 
     def on_submit(self):
         if self.is_default:
             self.set_as_default_bom()
+        else:
+            update_bom_where_used(self)
+
+    def on_cancel(self):
+        update_bom_where_used(self)
 
     def set_as_default_bom(self):
         frappe.db.sql("""
@@ -36,9 +56,18 @@ class BOM(Document):
             SET is_default = 0 
             WHERE item = %s AND name != %s
         """, (self.item, self.name))
+        
+        # every assembly using this item now consumes this BOM's components
+        update_bom_where_used(self)
 
 @frappe.whitelist()
 def get_bom_items(bom):
     return frappe.get_all("BOM Item", 
         filters={"parent": bom},
-        fields=["item_code", "qty", "rate", "amount"])
\ No newline at end of file
+        fields=["item_code", "qty", "rate", "amount"])
+
+@frappe.whitelist()
+def get_where_used(item_code):
+    """All BOMs consuming ``item_code`` directly or through sub-assemblies, with their open work orders"""
+    frappe.has_permission("BOM", "read", throw=True)
+    return get_where_used_index([item_code])[item_code]
@@ -0,0 +1,110 @@
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import flt
+
+from healthcare_manufacturing.manufacturing.bom_explosion import get_bom_nodes, invalidate_bom_explosions
+from healthcare_manufacturing.utils.db import chunked, make_row_name, upsert
+
+# Reverse index of submitted BOMs: one row per (component, BOM) for every item
+# the BOM consumes at any level, following the default BOM of each
+# sub-assembly, with the shallowest depth and the total qty per unit made.
+WHERE_USED_FIELDS = ["name", "component", "bom", "item", "depth", "qty_per_unit"]
+OPEN_WORK_ORDER_STATUSES = ("Not Started", "In Process")
+
+class BOMWhereUsed(Document):
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("BOM Where Used", ["component", "depth"])
+
+def get_bom_closure(bom_no, nodes, closures, path=()):
+    """``{component: (depth, qty per unit)}`` of ``bom_no``, memoized in ``closures``"""
+    if bom_no in closures:
+        return closures[bom_no]
+    if bom_no in path:
+        frappe.throw(_("BOM recursion: {0}").format(" > ".join(path + (bom_no,))))
+
+    closure = {}
+    def add(component, depth, qty):
+        current = closure.get(component)
+        closure[component] = (min(depth, current[0]), current[1] + qty) if current else (depth, qty)
+
+    for item_code, qty, uom, sub_bom in nodes[bom_no].components:
+        add(item_code, 1, qty)
+        if sub_bom in nodes:
+            for component, (depth, sub_qty) in get_bom_closure(sub_bom, nodes, closures, path + (bom_no,)).items():
+                add(component, depth + 1, qty * sub_qty)
+
+    closures[bom_no] = closure
+    return closure
+
+def rebuild_where_used(bom_nos):
+    """Recompute the index rows of ``bom_nos``; cancelled or missing BOMs just lose theirs"""
+    bom_nos = list(set(bom_nos))
+    for chunk in chunked(bom_nos, 1000):
+        frappe.db.sql("DELETE FROM `tabBOM Where Used` WHERE bom IN %s", [tuple(chunk)])
+
+    submitted = frappe.get_all("BOM", filters={"name": ["in", bom_nos], "docstatus": 1}, pluck="name")
+    if not submitted:
+        return
+
+    nodes, closures, rows = get_bom_nodes(submitted), {}, []
+    for bom_no in submitted:
+        for component, (depth, qty) in get_bom_closure(bom_no, nodes, closures).items():
+            rows.append([make_row_name(component, bom_no), component, bom_no, nodes[bom_no].item, depth, qty])
+    upsert("BOM Where Used", WHERE_USED_FIELDS, rows)
+
+def update_bom_where_used(doc):
+    """Reindex a BOM that was submitted, cancelled or made default, and every BOM above its item.
+
+    Whether ``doc`` is its item's default BOM changes what all the assemblies
+    using that item consume, so they are all recomputed.
+    """
+    # the default BOMs were just changed directly in the database
+    invalidate_bom_explosions()
+    rebuild_where_used([doc.name] + get_where_used_boms([doc.item]))
+
+def get_where_used_boms(item_codes):
+    return frappe.db.sql_list("""
+        SELECT DISTINCT bom FROM `tabBOM Where Used` WHERE component IN %s
+    """, [tuple(item_codes)])
+
+def get_where_used(item_codes):
+    """Every BOM consuming ``item_codes`` at any level, with its open work orders, in one query.
+
+    Returns ``{component: [{bom, item, depth, qty_per_unit, work_orders}]}``,
+    shallowest first.
+    """
+    where_used = {item_code: [] for item_code in item_codes}
+    if not where_used:
+        return where_used
+
+    last = None
+    for row in frappe.db.sql("""
+        SELECT wu.component, wu.bom, wu.item, wu.depth, wu.qty_per_unit,
+            wo.name AS work_order, wo.status, wo.qty
+        FROM `tabBOM Where Used` wu
+        LEFT JOIN `tabWork Order` wo
+            ON wo.bom_no = wu.bom AND wo.docstatus = 1 AND wo.status IN %(statuses)s
+        WHERE wu.component IN %(item_codes)s
+        ORDER BY wu.component, wu.depth, wu.bom, wo.name
+    """, {"item_codes": tuple(where_used), "statuses": OPEN_WORK_ORDER_STATUSES}, as_dict=True):
+        if (row.component, row.bom) != last:
+            last = (row.component, row.bom)
+            where_used[row.component].append({"bom": row.bom, "item": row.item, "depth": row.depth,
+                "qty_per_unit": flt(row.qty_per_unit), "work_orders": []})
+        if row.work_order:
+            where_used[row.component][-1]["work_orders"].append(
+                {"name": row.work_order, "status": row.status, "qty": flt(row.qty)})
+
+    return where_used
+
+def rebuild_bom_where_used(chunk_size=1000):
+    """Rebuild the index for every submitted BOM"""
+    frappe.db.delete("BOM Where Used")
+    bom_nos = frappe.get_all("BOM", filters={"docstatus": 1}, pluck="name", order_by="name")
+    for chunk in chunked(bom_nos, chunk_size):
+        rebuild_where_used(chunk)
+        frappe.db.commit()
+    return len(bom_nos)
@@ -2,6 +2,9 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import now
 
+from healthcare_manufacturing.inventory.doctype.batch_genealogy.batch_genealogy import (
+    add_batch_links, get_batch_ancestors, get_forward_trace, remove_batch_links)
+
 class ProductionBatchTracking(Document):
     def validate(self):
         if not self.traceability_code:
@@ -12,6 +15,14 @@ class ProductionBatchTracking(Document):
     
     def on_submit(self):
         self.update_batch_details()
+        self.update_batch_genealogy()
+    
+    def on_cancel(self):
+        remove_batch_links(self.doctype, self.name)
+    
+    def update_batch_genealogy(self):
+        add_batch_links(self.doctype, self.name,
+            [(rm.batch_no, self.batch_no) for rm in self.raw_materials])
     
     def update_batch_details(self):
         if self.batch_no:
@@ -36,4 +47,10 @@ class ProductionBatchTracking(Document):
                 "supplier": rm.supplier
             })
         
+        if self.batch_no:
+            # Every level of the genealogy, not only the direct raw materials
+            traceability["ancestors"] = get_batch_ancestors(self.batch_no)
+            traceability.update(get_forward_trace(self.batch_no))
+        
         return traceability
+
@@ -2,6 +2,10 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import now_datetime, add_days
 
+from healthcare_manufacturing.manufacturing.bom_explosion import get_default_boms
+from healthcare_manufacturing.manufacturing.mrp import run_mrp
+from healthcare_manufacturing.manufacturing.scheduling import schedule_work_orders
+
 class ProductionPlan(Document):
     def validate(self):
         self.validate_items()
@@ -12,42 +16,45 @@ class ProductionPlan(Document):
             frappe.throw("Production Plan must have at least one item")
 
     def calculate_material_requirements(self):
-        """Calculate material requirements based on BOMs"""
+        """Net material requirements of all BOM levels against stock and open supply"""
+        boms = get_default_boms([item.item_code for item in self.po_items])
+        warehouse = self.get("for_warehouse")
+        purchases, sub_assemblies = run_mrp([
+            (item.item_code, item.bom_no or boms[item.item_code], item.planned_qty,
+                item.planned_start_date or self.posting_date)
+            for item in self.po_items], warehouse)
+        
         self.mr_items = []
+        for row in purchases:
+            self.append("mr_items", {
+                "item_code": row.item_code,
+                "quantity": row.qty,
+                "uom": row.uom,
+                "warehouse": warehouse or "Stores - HC",
+                "schedule_date": row.schedule_date,
+                "material_request_type": "Purchase"
+            })
         
-        for item in self.po_items:
-            bom = frappe.db.get_value("BOM", {"item": item.item_code, "is_default": 1})
-            if bom:
-                bom_items = frappe.get_all("BOM Item",
-                    filters={"parent": bom},
-                    fields=["item_code", "qty"])
-                
-                for bom_item in bom_items:
-                    required_qty = bom_item.qty * item.planned_qty
-                    
-                    # Check if item already exists in material requirements
-                    existing_item = None
-                    for mr_item in self.mr_items:
-                        if mr_item.item_code == bom_item.item_code:
-                            existing_item = mr_item
-                            break
-                    
-                    if existing_item:
-                        existing_item.quantity += required_qty
-                    else:
-                        self.append("mr_items", {
-                            "item_code": bom_item.item_code,
-                            "quantity": required_qty,
-                            "warehouse": "Stores - HC"
-                        })
+        if self.meta.get_field("sub_assembly_items"):
+            self.sub_assembly_items = []
+            for row in sub_assemblies:
+                self.append("sub_assembly_items", {
+                    "production_item": row.item_code,
+                    "bom_no": row.bom_no,
+                    "qty": row.qty,
+                    "stock_uom": row.uom,
+                    "schedule_date": row.release_date,
+                    "bom_level": row.bom_level
+                })
 
     def on_submit(self):
         self.create_work_orders()
 
     def create_work_orders(self):
         """Create work orders for all items in the production plan"""
+        boms = get_default_boms([item.item_code for item in self.po_items])
         for item in self.po_items:
-            bom = frappe.db.get_value("BOM", {"item": item.item_code, "is_default": 1})
+            bom = boms[item.item_code]
             if bom:
                 work_order = frappe.get_doc({
                     "doctype": "Work Order",
@@ -78,9 +85,10 @@ def create_production_plan_from_sales_order(doc, method):
                 "po_items": []
             })
             
+            boms = get_default_boms([item.item_code for item in doc.items])
             for item in doc.items:
                 # Check if item has BOM
-                bom = frappe.db.get_value("BOM", {"item": item.item_code, "is_default": 1})
+                bom = boms[item.item_code]
                 if bom:
                     production_plan.append("po_items", {
                         "item_code": item.item_code,
@@ -97,13 +105,6 @@ def create_production_plan_from_sales_order(doc, method):
 
 @frappe.whitelist()
 def update_production_schedules():
-    """Scheduled task to update production schedules"""
-    # Get all open work orders
-    work_orders = frappe.get_all("Work Order",
-        filters={"status": ["in", ["Not Started", "In Process"]]},
-        fields=["name", "planned_start_date", "planned_end_date"])
-    
-    for wo in work_orders:
-        # Update schedules based on capacity and dependencies
-        # This is a simplified version - real implementation would be more complex
-        pass
\ No newline at end of file
+    """Scheduled task to update production schedules on finite workstation capacity"""
+    frappe.only_for("Manufacturing Manager")
+    return schedule_work_orders()
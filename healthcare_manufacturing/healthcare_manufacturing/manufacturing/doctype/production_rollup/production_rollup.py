@@ -0,0 +1,144 @@
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, flt, get_time, getdate, today
+
+from healthcare_manufacturing.utils.cache import invalidate_doctype
+from healthcare_manufacturing.utils.db import make_row_name, upsert
+
+ROLLUP_FIELDS = ["name", "posting_date", "posting_hour", "item_code", "workstation",
+    "qty_produced", "entry_count"]
+
+class ProductionRollup(Document):
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Production Rollup", ["posting_date", "item_code"])
+    frappe.db.add_index("Production Rollup", ["workstation", "posting_date"])
+    frappe.db.add_index("Stock Entry", ["stock_entry_type", "posting_date"])
+
+def get_rollup_row(posting_date, posting_hour, item_code, workstation, qty, entries):
+    return [make_row_name(posting_date, posting_hour, item_code, workstation),
+        posting_date, posting_hour, item_code, workstation or None, qty, entries]
+
+def get_finishing_workstation(work_order):
+    """Workstation of the last operation, where the finished goods come off the line"""
+    if not work_order:
+        return None
+    return frappe.db.get_value("Work Order Operation", {"parent": work_order},
+        "workstation", order_by="idx desc")
+
+def update_production_rollup(doc, method=None):
+    """Apply a Manufacture Stock Entry to the rollup on submit, reverse it on cancel"""
+    if doc.stock_entry_type != "Manufacture":
+        return
+
+    sign = -1 if method == "on_cancel" else 1
+    posting_date = getdate(doc.posting_date or today())
+    posting_hour = get_time(doc.posting_time).hour if doc.get("posting_time") else 0
+    workstation = get_finishing_workstation(doc.work_order)
+
+    produced = {}
+    for item in doc.items:
+        if item.t_warehouse and not item.s_warehouse:
+            produced[item.item_code] = produced.get(item.item_code, 0) + flt(item.qty)
+
+    if not produced:
+        return
+
+    upsert("Production Rollup", ROLLUP_FIELDS,
+        [get_rollup_row(posting_date, posting_hour, item_code, workstation, sign * qty, sign)
+            for item_code, qty in produced.items()],
+        increment=("qty_produced", "entry_count"))
+
+    frappe.db.after_commit.add(lambda: invalidate_doctype("Production Rollup"))
+
+def get_daily_production(from_date, to_date, item_code=None, workstation=None):
+    """Units produced per day between two dates, read from the rollup"""
+    conditions, values = "", {"from_date": from_date, "to_date": to_date}
+    if item_code:
+        conditions += " AND item_code = %(item_code)s"
+        values["item_code"] = item_code
+    if workstation:
+        conditions += " AND workstation = %(workstation)s"
+        values["workstation"] = workstation
+
+    rows = frappe.db.sql(f"""
+        SELECT posting_date, SUM(qty_produced)
+        FROM `tabProduction Rollup`
+        WHERE posting_date BETWEEN %(from_date)s AND %(to_date)s {conditions}
+        GROUP BY posting_date
+    """, values)
+
+    return {getdate(posting_date): flt(qty) for posting_date, qty in rows}
+
+def get_hourly_production(posting_date, item_code=None, workstation=None):
+    """Units produced per hour of a day, read from the rollup"""
+    filters = {"posting_date": posting_date}
+    if item_code:
+        filters["item_code"] = item_code
+    if workstation:
+        filters["workstation"] = workstation
+
+    rows = frappe.get_all("Production Rollup", filters=filters,
+        fields=["posting_hour", "sum(qty_produced) as qty"], group_by="posting_hour")
+
+    return {row.posting_hour: flt(row.qty) for row in rows}
+
+def rebuild_rollup_window(from_date, to_date):
+    """Recompute the rollup for ``[from_date, to_date]`` from submitted Stock Entries.
+
+    The source read is a plain consistent SELECT, so InnoDB takes no locks on
+    Stock Entry or Stock Entry Detail while the window is aggregated.
+    """
+    # Clear the window first: the delete locks its rollup rows and gaps, so a
+    # Manufacture entry posted meanwhile queues its increment behind this
+    # transaction and applies it to the rebuilt rows instead of being lost
+    frappe.db.sql("""
+        DELETE FROM `tabProduction Rollup`
+        WHERE posting_date BETWEEN %s AND %s
+    """, (from_date, to_date))
+
+    rows = frappe.db.sql("""
+        SELECT se.posting_date, IFNULL(HOUR(se.posting_time), 0), sed.item_code,
+            (SELECT op.workstation FROM `tabWork Order Operation` op
+                WHERE op.parent = se.work_order ORDER BY op.idx DESC LIMIT 1),
+            SUM(sed.qty), COUNT(DISTINCT se.name)
+        FROM `tabStock Entry` se
+        INNER JOIN `tabStock Entry Detail` sed ON sed.parent = se.name
+        WHERE se.stock_entry_type = 'Manufacture'
+            AND se.docstatus = 1
+            AND se.posting_date BETWEEN %s AND %s
+            AND IFNULL(sed.t_warehouse, '') != ''
+            AND IFNULL(sed.s_warehouse, '') = ''
+        GROUP BY se.posting_date, IFNULL(HOUR(se.posting_time), 0), sed.item_code, se.work_order
+    """, (from_date, to_date))
+
+    upsert("Production Rollup", ROLLUP_FIELDS,
+        [get_rollup_row(*row) for row in rows],
+        increment=("qty_produced", "entry_count"))
+
+    return len(rows)
+
+def backfill_production_rollup(from_date=None, to_date=None, chunk_days=7):
+    """Rebuild the rollup over history in windows of ``chunk_days``, committing each window"""
+    if not from_date or not to_date:
+        first, last = frappe.db.sql("""
+            SELECT MIN(posting_date), MAX(posting_date)
+            FROM `tabStock Entry`
+            WHERE stock_entry_type = 'Manufacture' AND docstatus = 1
+        """)[0]
+        from_date, to_date = from_date or first, to_date or last
+
+    if not from_date or not to_date:
+        return 0
+
+    start, end = getdate(from_date), getdate(to_date)
+    rows = 0
+    while start <= end:
+        window_end = min(add_days(start, chunk_days - 1), end)
+        rows += rebuild_rollup_window(start, window_end)
+        frappe.db.commit()
+        start = add_days(window_end, 1)
+
+    invalidate_doctype("Production Rollup")
+    return rows
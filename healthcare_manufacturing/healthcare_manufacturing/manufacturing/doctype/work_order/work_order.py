@@ -1,6 +1,16 @@
 import frappe
 from frappe.model.document import Document
-from frappe.utils import now_datetime, add_days
+from frappe.utils import flt, now_datetime, add_days
+
+from healthcare_manufacturing.inventory.doctype.stock_balance.stock_balance import (
+    get_available_qty, release_stock, reserve_stock)
+
+from healthcare_manufacturing.manufacturing.bom_explosion import (
+    get_bom_items, get_bom_nodes, get_version)
+from healthcare_manufacturing.utils.cache import invalidate_dashboard_cache
+from healthcare_manufacturing.utils.db import bulk_insert_docs, reserve_series_names
+
+DEFAULT_SOURCE_WAREHOUSE = "Stores - HC"
 
 class WorkOrder(Document):
     def validate(self):
@@ -18,25 +28,22 @@ class WorkOrder(Document):
 
     def set_required_items(self):
         if not self.required_items:
-            bom_items = frappe.get_all("BOM Item",
-                filters={"parent": self.bom_no},
-                fields=["item_code", "qty", "uom"])
+            # First-level components from the cached BOM structure
+            quantities, uoms = get_bom_items(self.bom_no)
             
-            for item in bom_items:
+            # One lookup in the running balances for all required items
+            available = get_available_qty(list(quantities))
+            for item_code, per_unit in quantities.items():
                 self.append("required_items", {
-                    "item_code": item.item_code,
-                    "required_qty": item.qty * self.qty,
-                    "uom": item.uom,
-                    "available_qty": self.get_available_qty(item.item_code)
+                    "item_code": item_code,
+                    "required_qty": per_unit * flt(self.qty),
+                    "uom": uoms.get(item_code),
+                    "available_qty": available[item_code]
                 })
 
     def set_operations(self):
         if not self.operations:
-            bom_operations = frappe.get_all("BOM Operation",
-                filters={"parent": self.bom_no},
-                fields=["operation", "time_in_mins", "workstation"])
-            
-            for op in bom_operations:
+            for op in get_bom_operations([self.bom_no]).get(self.bom_no, []):
                 self.append("operations", {
                     "operation": op.operation,
                     "time_in_mins": op.time_in_mins,
@@ -45,30 +52,92 @@ class WorkOrder(Document):
                 })
 
     def get_available_qty(self, item_code):
-        return frappe.db.sql("""
-            SELECT SUM(actual_qty) 
-            FROM `tabStock Ledger Entry` 
-            WHERE item_code = %s AND is_cancelled = 0
-        """, item_code)[0][0] or 0
+        return get_available_qty([item_code])[item_code]
 
     def on_submit(self):
         self.status = "Not Started"
         self.reserve_materials()
 
     def reserve_materials(self):
-        for item in self.required_items:
-            if item.available_qty < item.required_qty:
-                frappe.throw(f"Insufficient stock for {item.item_code}")
-            
-            # Create stock reservation
-            frappe.get_doc({
-                "doctype": "Stock Reservation",
-                "item_code": item.item_code,
-                "warehouse": "Stores - HC",  # Default warehouse
-                "qty": item.required_qty,
-                "voucher_type": "Work Order",
-                "voucher_no": self.name
-            }).insert()
+        # Checked against the locked current balances, not available_qty from validate
+        reserve_stock(self.doctype, self.name,
+            [(item.item_code, item.required_qty) for item in self.required_items],
+            DEFAULT_SOURCE_WAREHOUSE)
+
+    def on_cancel(self):
+        release_stock(self.doctype, self.name)
+
+def on_doctype_update():
+    frappe.db.add_index("Work Order", ["planned_start_date", "name"])
+    frappe.db.add_index("Work Order", ["bom_no", "status"])
+    frappe.db.add_index("Stock Entry", ["work_order"])
+
+def get_bom_operations(bom_nos):
+    """``{bom: [operations]}`` of ``bom_nos`` in sequence, in one query"""
+    operations = {}
+    for op in frappe.get_all("BOM Operation",
+        filters={"parent": ["in", list(bom_nos)], "parenttype": "BOM"},
+        fields=["parent", "operation", "time_in_mins", "workstation"],
+        order_by="parent, idx"):
+        operations.setdefault(op.parent, []).append(op)
+    return operations
+
+def insert_work_orders(orders):
+    """Insert draft Work Orders for many ``orders`` (dicts of Work Order fields) at once.
+
+    Sets what ``validate`` would, from BOM structures, operations
+    and balances read once for all orders, takes the names from the naming
+    series in one step and writes every table with batched inserts. Returns
+    the new names in the order given.
+    """
+    if not orders:
+        return []
+
+    version = get_version()
+    bom_nos = {order["bom_no"] for order in orders}
+    nodes = get_bom_nodes(bom_nos, version)
+    for order in orders:
+        node = nodes.get(order["bom_no"])
+        if not node:
+            frappe.throw(f"BOM {order['bom_no']} does not exist")
+        if node.item != order["production_item"]:
+            frappe.throw("BOM item does not match production item")
+
+    bom_items = {bom_no: get_bom_items(bom_no, version, nodes) for bom_no in bom_nos}
+    available = get_available_qty(list({item_code for quantities, uoms in bom_items.values()
+        for item_code in quantities}))
+    operations = get_bom_operations(bom_nos)
+
+    naming_series = frappe.get_meta("Work Order").get_field("naming_series").options.split("\n")[0]
+    names = reserve_series_names(naming_series, len(orders))
+
+    docs = []
+    for name, order in zip(names, orders):
+        doc = frappe.new_doc("Work Order")
+        doc.update(order)
+        doc.name = name
+        doc.naming_series = naming_series
+
+        quantities, uoms = bom_items[doc.bom_no]
+        for item_code, per_unit in quantities.items():
+            doc.append("required_items", {
+                "item_code": item_code,
+                "required_qty": per_unit * flt(doc.qty),
+                "uom": uoms.get(item_code),
+                "available_qty": available[item_code]
+            })
+        for op in operations.get(doc.bom_no, []):
+            doc.append("operations", {
+                "operation": op.operation,
+                "time_in_mins": op.time_in_mins,
+                "workstation": op.workstation,
+                "status": "Pending"
+            })
+        docs.append(doc)
+
+    bulk_insert_docs(docs)
+    invalidate_dashboard_cache(docs[0])
+    return names
 
 @frappe.whitelist()
 def start_work_order(work_order):
@@ -85,6 +154,9 @@ def complete_work_order(work_order):
     doc.actual_end_date = now_datetime()
     doc.save()
     
+    # The production entry consumes what was reserved
+    release_stock(doc.doctype, doc.name)
+    
     # Create stock entry for finished goods
     create_production_entry(doc)
     return doc
@@ -108,7 +180,7 @@ def create_production_entry(work_order):
         stock_entry.append("items", {
             "item_code": item.item_code,
             "qty": item.required_qty,
-            "s_warehouse": "Stores - HC"
+            "s_warehouse": DEFAULT_SOURCE_WAREHOUSE
         })
     
     stock_entry.insert()
@@ -0,0 +1,156 @@
+from collections import defaultdict
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, cint, flt, getdate
+
+from healthcare_manufacturing.manufacturing.bom_explosion import get_bom_nodes, get_version
+from healthcare_manufacturing.utils.db import chunked
+
+MRP_PRECISION = 1e-6
+MAX_BOM_LEVELS = 50
+
+
+def run_mrp(lines, warehouse=None):
+    """Gross-to-net requirements of production ``lines`` across every BOM level.
+
+    ``lines`` are ``(item_code, bom_no, qty, start_date)``: the plan produces
+    them, so their components are the gross demand, due on the start date.
+    Components are netted against stock on hand less reservations (in
+    ``warehouse``, or all warehouses), open purchase orders and open work
+    orders, in low-level-code order so every item is netted once with all of
+    its demand. Returns ``(purchases, sub_assemblies)`` suggestions.
+    """
+    lines = [(item_code, bom_no, flt(qty), getdate(start_date))
+        for item_code, bom_no, qty, start_date in lines if bom_no and flt(qty) > 0]
+    nodes = get_bom_nodes({bom_no for item_code, bom_no, qty, start_date in lines}, get_version())
+    levels = get_low_level_codes([bom_no for item_code, bom_no, qty, start_date in lines], nodes)
+
+    items = list(levels)
+    return net_requirements(lines, nodes, levels,
+        get_on_hand(items, warehouse), get_scheduled_receipts(items), get_lead_times(items))
+
+
+def get_low_level_codes(bom_nos, nodes):
+    """``{item_code: deepest level}`` of every component below ``bom_nos`` (plan lines are level 0)"""
+    levels = {}
+    stack = [(bom_no, 1) for bom_no in set(bom_nos)]
+    while stack:
+        bom_no, level = stack.pop()
+        if level > MAX_BOM_LEVELS:
+            frappe.throw(_("BOM {0} is nested more than {1} levels deep, check it for recursion")
+                .format(bom_no, MAX_BOM_LEVELS))
+
+        for item_code, qty, uom, sub_bom in nodes[bom_no].components:
+            if levels.get(item_code, 0) < level:
+                levels[item_code] = level
+                if sub_bom:
+                    stack.append((sub_bom, level + 1))
+
+    return levels
+
+
+def net_requirements(lines, nodes, levels, on_hand, receipts, lead_times):
+    """Net time-phased gross demand level by level.
+
+    ``on_hand`` maps items to free stock, ``receipts`` to ``[(date, qty)]`` of
+    open supply and ``lead_times`` to days. A shortage becomes a planned order
+    due when it occurs and released its lead time earlier; a sub-assembly's
+    planned order adds its components' demand on its release date.
+    """
+    gross = defaultdict(lambda: defaultdict(float))
+    sub_boms, uoms = {}, {}
+
+    def add_components(bom_no, qty, need_date):
+        for item_code, per_unit, uom, sub_bom in nodes[bom_no].components:
+            gross[item_code][need_date] += per_unit * qty
+            uoms.setdefault(item_code, uom)
+            if sub_bom:
+                sub_boms[item_code] = sub_bom
+
+    for item_code, bom_no, qty, start_date in lines:
+        add_components(bom_no, qty, start_date)
+
+    purchases, sub_assemblies = [], []
+    for item_code in sorted(levels, key=lambda item_code: (levels[item_code], item_code)):
+        available = flt(on_hand.get(item_code))
+        supply = sorted(receipts.get(item_code, ()))
+        received = 0
+
+        for need_date in sorted(gross[item_code]):
+            while received < len(supply) and supply[received][0] <= need_date:
+                available += supply[received][1]
+                received += 1
+
+            required = gross[item_code][need_date]
+            shortage = required - available
+            available = max(available - required, 0)
+            if shortage <= MRP_PRECISION:
+                continue
+
+            release_date = add_days(need_date, -cint(lead_times.get(item_code)))
+            suggestion = frappe._dict({
+                "item_code": item_code,
+                "qty": shortage,
+                "uom": uoms.get(item_code),
+                "schedule_date": need_date,
+                "release_date": release_date,
+                "bom_level": levels[item_code]
+            })
+
+            if item_code in sub_boms:
+                suggestion.bom_no = sub_boms[item_code]
+                sub_assemblies.append(suggestion)
+                add_components(suggestion.bom_no, shortage, release_date)
+            else:
+                purchases.append(suggestion)
+
+    return purchases, sub_assemblies
+
+
+def get_on_hand(item_codes, warehouse=None):
+    """Actual less reserved qty per item from the running stock balances"""
+    on_hand = {}
+    conditions = "AND warehouse = %(warehouse)s" if warehouse else ""
+    for chunk in chunked(item_codes, 1000):
+        on_hand.update(frappe.db.sql(f"""
+            SELECT item_code, SUM(actual_qty - reserved_qty)
+            FROM `tabStock Balance`
+            WHERE item_code IN %(item_codes)s AND batch_no = '' {conditions}
+            GROUP BY item_code
+        """, {"item_codes": tuple(chunk), "warehouse": warehouse}))
+    return on_hand
+
+
+def get_scheduled_receipts(item_codes):
+    """``{item_code: [(date, qty)]}`` still to be received on purchase orders or produced by work orders"""
+    receipts = defaultdict(list)
+    for chunk in chunked(item_codes, 1000):
+        for item_code, receipt_date, qty in frappe.db.sql("""
+            SELECT poi.item_code, poi.schedule_date, SUM(poi.qty - poi.received_qty)
+            FROM `tabPurchase Order Item` poi
+            INNER JOIN `tabPurchase Order` po ON po.name = poi.parent
+            WHERE poi.item_code IN %(item_codes)s
+                AND po.docstatus = 1
+                AND po.status NOT IN ('Closed', 'Completed', 'On Hold')
+                AND poi.qty > poi.received_qty
+            GROUP BY poi.item_code, poi.schedule_date
+            UNION ALL
+            SELECT production_item, DATE(planned_end_date), SUM(qty)
+            FROM `tabWork Order`
+            WHERE production_item IN %(item_codes)s
+                AND docstatus = 1
+                AND status IN ('Not Started', 'In Process')
+            GROUP BY production_item, DATE(planned_end_date)
+        """, {"item_codes": tuple(chunk)}):
+            receipts[item_code].append((getdate(receipt_date), flt(qty)))
+    return receipts
+
+
+def get_lead_times(item_codes):
+    lead_times = {}
+    for chunk in chunked(item_codes, 1000):
+        lead_times.update(frappe.db.sql("""
+            SELECT name, lead_time_days FROM `tabItem` WHERE name IN %s
+        """, [tuple(chunk)]))
+    return lead_times
@@ -0,0 +1,187 @@
+from collections import namedtuple
+
+import frappe
+from frappe.utils import add_days, cint, date_diff, flt, get_datetime, getdate, today
+
+# Shift windows as (name, start hour, end hour); the night shift wraps past midnight
+SHIFTS = (("Morning", 6, 14), ("Afternoon", 14, 22), ("Night", 22, 6))
+SHIFT_NAMES = [shift[0] for shift in SHIFTS]
+
+Operation = namedtuple("Operation", ["workstation", "start_hour", "planned_mins", "actual_mins",
+    "completed_qty", "qty", "accepted", "rejected", "is_last"])
+
+# Totals kept per workstation and shift while the operations are aggregated
+PLANNED, RUN, IDEAL, ACCEPTED, REJECTED, ACCEPTED_LAST, REJECTED_LAST = range(7)
+
+def get_shift_index(hour):
+    """Position in :data:`SHIFTS` of the shift a start hour falls into"""
+    if 6 <= hour < 14:
+        return 0
+    if 14 <= hour < 22:
+        return 1
+    return 2
+
+def load_operations(from_date, to_date):
+    """Every operation started in the period as :class:`Operation` rows, in one query.
+
+    Work order inspection counts are attached to each operation; ``is_last``
+    marks the finishing operation so plant-wide quality counts each order once.
+    """
+    rows = frappe.db.sql("""
+        SELECT IFNULL(op.workstation, ''),
+            HOUR(op.actual_start_time),
+            IFNULL(op.time_in_mins, 0),
+            IFNULL(op.actual_operation_time, 0),
+            IFNULL(op.completed_qty, 0),
+            IFNULL(wo.qty, 0),
+            IFNULL(qi.accepted, 0),
+            IFNULL(qi.rejected, 0),
+            op.idx = last_op.idx
+        FROM `tabWork Order Operation` op
+        INNER JOIN `tabWork Order` wo ON wo.name = op.parent
+        INNER JOIN (
+            SELECT parent, MAX(idx) AS idx
+            FROM `tabWork Order Operation`
+            GROUP BY parent
+        ) last_op ON last_op.parent = op.parent
+        LEFT JOIN (
+            SELECT reference_name,
+                SUM(status = 'Accepted') AS accepted,
+                SUM(status = 'Rejected') AS rejected
+            FROM `tabQuality Inspection`
+            WHERE reference_type = 'Work Order' AND docstatus = 1
+            GROUP BY reference_name
+        ) qi ON qi.reference_name = wo.name
+        WHERE wo.docstatus = 1
+            AND op.actual_start_time >= %s AND op.actual_start_time < %s
+    """, (get_datetime(from_date), get_datetime(add_days(to_date, 1))))
+
+    return [Operation(workstation, cint(hour), flt(planned), flt(actual), flt(completed), flt(qty),
+            flt(accepted), flt(rejected), bool(is_last))
+        for workstation, hour, planned, actual, completed, qty, accepted, rejected, is_last in rows]
+
+def get_shift_overlap(start_hour, end_hour):
+    """Minutes of a daily working window falling into each shift"""
+    minutes = [0] * len(SHIFTS)
+    window_end = end_hour if end_hour > start_hour else end_hour + 24
+
+    for i, (name, shift_start, shift_end) in enumerate(SHIFTS):
+        shift_end = shift_end if shift_end > shift_start else shift_end + 24
+        for offset in (-24, 0, 24):
+            overlap = min(window_end, shift_end + offset) - max(start_hour, shift_start + offset)
+            minutes[i] += max(overlap, 0) * 60
+
+    return minutes
+
+def load_planned_minutes(workstations, from_date, to_date):
+    """``{workstation: [planned minutes per shift]}`` from workstation calendars.
+
+    Workstations without working hours are left out and are not penalised for
+    availability.
+    """
+    planned = {}
+    if not workstations:
+        return planned
+
+    rows = frappe.db.sql("""
+        SELECT w.name, wh.start_time, wh.end_time,
+            (SELECT COUNT(*) FROM `tabHoliday` h
+                WHERE h.parent = w.holiday_list
+                AND h.holiday_date BETWEEN %(from_date)s AND %(to_date)s) AS holidays
+        FROM `tabWorkstation` w
+        INNER JOIN `tabWorkstation Working Hour` wh ON wh.parent = w.name
+        WHERE w.name IN %(workstations)s
+    """, {"from_date": from_date, "to_date": to_date, "workstations": tuple(workstations)})
+
+    days = date_diff(to_date, from_date) + 1
+    for workstation, start_time, end_time, holidays in rows:
+        start_hour = start_time.total_seconds() / 3600
+        end_hour = end_time.total_seconds() / 3600
+        minutes = planned.setdefault(workstation, [0] * len(SHIFTS))
+        for i, overlap in enumerate(get_shift_overlap(start_hour, end_hour)):
+            minutes[i] += overlap * max(days - holidays, 0)
+
+    return planned
+
+def ratio(numerator, denominator):
+    return numerator / denominator if denominator > 0 else 0.0
+
+def percent(value):
+    return round(value * 1000) / 10
+
+def summarize(planned, run, ideal, accepted, rejected):
+    """Availability, performance, quality and OEE percentages of a set of totals"""
+    availability = min(max(ratio(run, planned), 0), 1)
+    performance = min(max(ratio(ideal, run), 0), 1)
+    inspected = accepted + rejected
+    quality = ratio(accepted, inspected) if inspected > 0 else 1.0
+
+    return {
+        "availability": percent(availability),
+        "performance": percent(performance),
+        "quality": percent(quality),
+        "oee": percent(availability * performance * quality),
+    }
+
+def add_totals(totals, other):
+    for i, value in enumerate(other):
+        totals[i] += value
+    return totals
+
+def compute_oee(operations, planned):
+    """Aggregate operations into OEE per workstation, shift and plant in one pass.
+
+    ``planned`` maps workstations to their planned minutes per shift; shifts
+    without calendar hours are not penalised for availability.
+    """
+    cells = {}
+    for op in operations:
+        shifts = cells.get(op.workstation)
+        if shifts is None:
+            shifts = cells[op.workstation] = [[0.0] * 7 for shift in SHIFTS]
+        cell = shifts[get_shift_index(op.start_hour)]
+        cell[RUN] += op.actual_mins
+        cell[IDEAL] += op.planned_mins * ratio(op.completed_qty, op.qty)
+        cell[ACCEPTED] += op.accepted
+        cell[REJECTED] += op.rejected
+        if op.is_last:
+            # plant and shift level quality counts every work order once, at its finishing operation
+            cell[ACCEPTED_LAST] += op.accepted
+            cell[REJECTED_LAST] += op.rejected
+
+    plant, per_shift, workstations = [0.0] * 7, [[0.0] * 7 for shift in SHIFTS], {}
+    for workstation in sorted(cells):
+        shifts, totals = cells[workstation], [0.0] * 7
+        calendar = planned.get(workstation) or [0] * len(SHIFTS)
+        for j, cell in enumerate(shifts):
+            cell[PLANNED] = calendar[j] if calendar[j] > 0 else cell[RUN]
+            add_totals(totals, cell)
+            add_totals(per_shift[j], cell)
+        add_totals(plant, totals)
+
+        workstations[workstation] = dict(
+            summarize(*totals[PLANNED:REJECTED + 1]),
+            shifts={name: summarize(*shifts[j][PLANNED:REJECTED + 1]) for j, name in enumerate(SHIFT_NAMES)})
+
+    def quality_once(totals):
+        return totals[PLANNED:ACCEPTED] + totals[ACCEPTED_LAST:]
+
+    return {
+        "plant": summarize(*quality_once(plant)),
+        "shifts": {name: summarize(*quality_once(per_shift[j])) for j, name in enumerate(SHIFT_NAMES)},
+        "workstations": workstations,
+    }
+
+@frappe.whitelist()
+def get_oee_rollup(from_date=None, to_date=None):
+    """OEE (availability x performance x quality) per workstation, per shift and plant-wide"""
+    to_date = getdate(to_date or today())
+    from_date = getdate(from_date or add_days(to_date, -29))
+
+    operations = load_operations(from_date, to_date)
+    workstations = {op.workstation for op in operations if op.workstation}
+    planned = load_planned_minutes(list(workstations), from_date, to_date)
+
+    rollup = compute_oee(operations, planned)
+    rollup.update({"from_date": from_date, "to_date": to_date})
+    return rollup
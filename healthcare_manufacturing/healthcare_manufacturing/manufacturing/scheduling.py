@@ -0,0 +1,266 @@
+import heapq
+from datetime import datetime, timedelta
+from itertools import count, groupby
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, cint, flt, get_datetime, getdate, now_datetime, to_timedelta
+
+from healthcare_manufacturing.utils.db import bulk_update, chunked
+
+MINUTES_PER_DAY = 24 * 60
+MAX_IDLE_DAYS = 366
+OPEN_STATUSES = ("Not Started", "In Process")
+
+# Event kinds of the forward pass
+ARRIVE, FREE, WAKE = 0, 1, 2
+
+
+class WorkstationCalendar:
+    """Working time of a workstation on a timeline of minutes from the schedule origin.
+
+    ``windows`` are ``(start, end)`` minutes of the day and ``holidays`` the day
+    numbers, counted from the origin, without working time. A workstation
+    without working hours is available around the clock.
+    """
+
+    __slots__ = ("name", "windows", "holidays")
+
+    def __init__(self, name=None, windows=None, holidays=()):
+        self.name = name
+        self.windows = sorted(windows) if windows else [(0, MINUTES_PER_DAY)]
+        self.holidays = set(holidays)
+
+    def next_window(self, t):
+        """``(start, end)`` of the first working time at or after ``t``"""
+        day, minute = divmod(t, MINUTES_PER_DAY)
+        for i in range(MAX_IDLE_DAYS):
+            if day not in self.holidays:
+                for start, end in self.windows:
+                    if minute < end:
+                        offset = day * MINUTES_PER_DAY
+                        return offset + max(minute, start), offset + end
+            day, minute = day + 1, 0
+        self.throw_no_working_time()
+
+    def previous_window(self, t):
+        """``(start, end)`` of the last working time at or before ``t``"""
+        day, minute = divmod(t, MINUTES_PER_DAY)
+        for i in range(MAX_IDLE_DAYS):
+            if day not in self.holidays:
+                for start, end in reversed(self.windows):
+                    if minute > start:
+                        offset = day * MINUTES_PER_DAY
+                        return offset + start, offset + min(minute, end)
+            day, minute = day - 1, MINUTES_PER_DAY
+        self.throw_no_working_time()
+
+    def forward(self, t, minutes):
+        """``(start, end)`` of ``minutes`` of work begun as early as possible from ``t``"""
+        start, end = self.next_window(t)
+        begin = start
+        while minutes > end - start:
+            minutes -= end - start
+            start, end = self.next_window(end)
+        return begin, start + minutes
+
+    def backward(self, t, minutes):
+        """Latest start of ``minutes`` of work that has to end by ``t``"""
+        start, end = self.previous_window(t)
+        while minutes > end - start:
+            minutes -= end - start
+            start, end = self.previous_window(start)
+        return end - minutes
+
+    def throw_no_working_time(self):
+        frappe.throw(_("Workstation {0} has no working time for a year").format(self.name))
+
+
+def schedule_operations(orders, calendars, capacities, origin=0):
+    """Finite-capacity schedule of the remaining operations of ``orders``.
+
+    ``orders`` are ``(name, due, operations)`` with ``due`` in minutes from the
+    origin, or ``None``, and ``operations`` the ``(name, workstation, minutes,
+    in_progress)`` still to run, in sequence. ``capacities`` holds the number
+    of parallel slots of each workstation; others have unlimited capacity.
+    Returns ``{operation: (start, end)}``.
+
+    A backward pass over the calendars gives each operation the latest start
+    that still meets the due date. The forward pass then simulates the shop
+    from ``origin``: whenever a workstation has a free slot during working
+    time, it starts the waiting operation with the earliest latest start,
+    operations already in progress first, and an operation arrives at its
+    workstation when the previous one of its order ends.
+    """
+    default = WorkstationCalendar()
+    get_calendar = lambda workstation: calendars.get(workstation) or default
+
+    latest_starts = {}
+    for name, due, operations in orders:
+        latest = float("inf") if due is None else due
+        for op_name, workstation, minutes, in_progress in reversed(operations):
+            if latest != float("inf"):
+                latest = get_calendar(workstation).backward(latest, minutes)
+            latest_starts[op_name] = latest
+
+    sequence = count()
+    events, queues, waking, schedule = [], {}, set(), {}
+    free = dict(capacities)
+    for position, (name, due, operations) in enumerate(orders):
+        if operations:
+            events.append((origin, next(sequence), ARRIVE, position, 0))
+    heapq.heapify(events)
+
+    def dispatch(workstation, now):
+        queue, calendar = queues.get(workstation), get_calendar(workstation)
+        while queue and free.get(workstation, 1) > 0:
+            start, end = calendar.next_window(now)
+            if start > now:
+                # idle until the next shift, so operations arriving meanwhile compete too
+                if workstation not in waking:
+                    waking.add(workstation)
+                    heapq.heappush(events, (start, next(sequence), WAKE, workstation, None))
+                return
+
+            position, index = heapq.heappop(queue)[-2:]
+            operations = orders[position][2]
+            op_name, minutes = operations[index][0], operations[index][2]
+            start, end = calendar.forward(now, minutes)
+            schedule[op_name] = (start, end)
+
+            if workstation in free:
+                free[workstation] -= 1
+                heapq.heappush(events, (end, next(sequence), FREE, workstation, None))
+            if index + 1 < len(operations):
+                heapq.heappush(events, (end, next(sequence), ARRIVE, position, index + 1))
+
+    while events:
+        now, touched = events[0][0], set()
+        while events and events[0][0] == now:
+            time, seq, kind, key, index = heapq.heappop(events)
+            if kind == ARRIVE:
+                op_name, workstation, minutes, in_progress = orders[key][2][index]
+                heapq.heappush(queues.setdefault(workstation, []),
+                    (not in_progress, latest_starts[op_name], seq, key, index))
+                touched.add(workstation)
+            else:
+                if kind == FREE:
+                    free[key] += 1
+                else:
+                    waking.discard(key)
+                touched.add(key)
+
+        for workstation in touched:
+            dispatch(workstation, now)
+
+    return schedule
+
+
+def load_open_work_orders():
+    """``(work_orders, operations)``: open work orders and the operations each has left, in sequence"""
+    rows = frappe.db.sql("""
+        SELECT wo.name, wo.status, wo.planned_start_date, so.delivery_date,
+            op.name, IFNULL(op.workstation, ''), IFNULL(op.time_in_mins, 0),
+            IFNULL(op.actual_operation_time, 0), op.status = 'Work in Progress'
+        FROM `tabWork Order` wo
+        INNER JOIN `tabWork Order Operation` op
+            ON op.parent = wo.name AND op.parenttype = 'Work Order'
+        LEFT JOIN `tabSales Order` so ON so.name = wo.sales_order
+        WHERE wo.docstatus = 1 AND wo.status IN %s
+            AND IFNULL(op.status, '') != 'Completed'
+        ORDER BY wo.name, op.idx
+    """, [OPEN_STATUSES])
+
+    work_orders, operations = [], []
+    for name, group in groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        work_orders.append(tuple(group[0][:4]))
+
+        remaining = []
+        for row in group:
+            op_name, workstation, planned, actual, in_progress = row[4:]
+            # an operation in progress only has its unfinished time left
+            minutes = max(flt(planned) - flt(actual), 0) if in_progress else flt(planned)
+            remaining.append((op_name, workstation, minutes, bool(in_progress)))
+        operations.append(remaining)
+
+    return work_orders, operations
+
+
+def load_calendars(workstations, origin):
+    """``(calendars, capacities)`` of ``workstations`` from their working hours and holiday lists"""
+    calendars, capacities = {}, {}
+    workstations = [workstation for workstation in workstations if workstation]
+    if not workstations:
+        return calendars, capacities
+
+    fields = ["name", "holiday_list"]
+    if frappe.get_meta("Workstation").has_field("production_capacity"):
+        fields.append("production_capacity")
+
+    windows, holidays, holiday_lists = {}, {}, {}
+    for chunk in chunked(workstations, 1000):
+        for workstation in frappe.get_all("Workstation", filters={"name": ["in", chunk]}, fields=fields):
+            capacities[workstation.name] = max(cint(workstation.get("production_capacity")), 1)
+            if workstation.holiday_list:
+                holiday_lists.setdefault(workstation.holiday_list, []).append(workstation.name)
+
+        for workstation, start_time, end_time in frappe.db.sql("""
+            SELECT parent, start_time, end_time
+            FROM `tabWorkstation Working Hour`
+            WHERE parent IN %s AND parenttype = 'Workstation'
+        """, [tuple(chunk)]):
+            start = to_timedelta(start_time).total_seconds() / 60
+            end = to_timedelta(end_time).total_seconds() / 60
+            # a shift running past midnight is split at midnight
+            shifts = [(start, end)] if end > start else [(start, MINUTES_PER_DAY), (0, end)]
+            windows.setdefault(workstation, []).extend(shifts)
+
+    if holiday_lists:
+        for holiday_list, holiday_date in frappe.db.sql("""
+            SELECT parent, holiday_date FROM `tabHoliday`
+            WHERE parent IN %s AND holiday_date >= %s
+        """, [tuple(holiday_lists), add_days(origin.date(), -MAX_IDLE_DAYS)]):
+            day = (getdate(holiday_date) - origin.date()).days
+            for workstation in holiday_lists[holiday_list]:
+                holidays.setdefault(workstation, set()).add(day)
+
+    for workstation in capacities:
+        calendars[workstation] = WorkstationCalendar(workstation, windows.get(workstation),
+            holidays.get(workstation, ()))
+
+    return calendars, capacities
+
+
+def schedule_work_orders():
+    """Reschedule every open work order on finite workstation capacity.
+
+    Writes the planned times of the remaining operations and the planned dates
+    of their work orders in bulk; the planned start of a work order already in
+    process is kept. Returns counts of the run.
+    """
+    current = now_datetime()
+    origin = datetime.combine(current.date(), datetime.min.time())
+    to_minutes = lambda value: (get_datetime(value) - origin).total_seconds() / 60
+    to_datetime = lambda minutes: origin + timedelta(seconds=round(minutes * 60))
+
+    work_orders, operations = load_open_work_orders()
+    orders = [(name, to_minutes(delivery_date) if delivery_date else None, ops)
+        for (name, status, planned_start, delivery_date), ops in zip(work_orders, operations)]
+    calendars, capacities = load_calendars({op[1] for ops in operations for op in ops}, origin)
+
+    schedule = schedule_operations(orders, calendars, capacities, to_minutes(current))
+
+    operation_rows, order_rows, late = [], [], 0
+    for (name, status, planned_start, delivery_date), (_name, due, ops) in zip(work_orders, orders):
+        start, end = schedule[ops[0][0]][0], schedule[ops[-1][0]][1]
+        for op_name, workstation, minutes, in_progress in ops:
+            operation_rows.append((op_name, to_datetime(schedule[op_name][0]), to_datetime(schedule[op_name][1])))
+        order_rows.append((name, planned_start if status == "In Process" and planned_start else to_datetime(start),
+            to_datetime(end)))
+        late += due is not None and end > due
+
+    bulk_update("Work Order Operation", ["planned_start_time", "planned_end_time"], operation_rows)
+    bulk_update("Work Order", ["planned_start_date", "planned_end_date"], order_rows)
+
+    return {"work_orders": len(order_rows), "operations": len(operation_rows), "late": late}
@@ -0,0 +1,6 @@
+from healthcare_manufacturing.api.traceability import set_stock_ledger_trace_keys
+from healthcare_manufacturing.install import setup_custom_fields
+
+def execute():
+    setup_custom_fields()
+    set_stock_ledger_trace_keys()
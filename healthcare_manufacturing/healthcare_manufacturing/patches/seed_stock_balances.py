@@ -0,0 +1,4 @@
+from healthcare_manufacturing.install import seed_stock_balances
+
+def execute():
+    seed_stock_balances()
@@ -8,19 +8,53 @@ healthcare_manufacturing.gantt = {
     },
 
     setup_gantt: function() {
+        // Load the visible window one page at a time; scrolling fetches the next page
+        this.tasks = [];
+        this.after = null;
+        this.from_date = frappe.datetime.add_days(frappe.datetime.get_today(), -7);
+        this.to_date = frappe.datetime.add_days(frappe.datetime.get_today(), 30);
+        this.gantt_chart = null;
+        this.load_page();
+    },
+
+    load_page: function() {
         const me = this;
+        if (this.loading) return;
+        this.loading = true;
         
-        // Fetch work orders data
         frappe.call({
             method: 'healthcare_manufacturing.api.manufacturing.get_production_schedule',
+            args: {
+                from_date: this.from_date,
+                to_date: this.to_date,
+                workstation: this.workstation,
+                after: this.after
+            },
             callback: function(r) {
-                if (r.message) {
-                    me.render_gantt(r.message);
+                me.loading = false;
+                if (!r.message) return;
+                
+                me.tasks = me.tasks.concat(r.message.tasks);
+                me.after = r.message.after;
+                if (!me.gantt_chart) {
+                    me.render_gantt(me.tasks);
+                } else {
+                    me.gantt_chart.refresh(me.tasks);
                 }
+            },
+            error: function() {
+                me.loading = false;
             }
         });
     },
 
+    on_scroll: function(container) {
+        const near_end = container.scrollTop + container.clientHeight >= container.scrollHeight - 100;
+        if (near_end && this.after) {
+            this.load_page();
+        }
+    },
+
     render_gantt: function(data) {
         const gantt_html = `
             <div class="gantt-container">
@@ -35,6 +69,7 @@ healthcare_manufacturing.gantt = {
         `;
         
         $(this.wrapper).html(gantt_html);
+        $(this.wrapper).find('.gantt-chart').on('scroll', (e) => this.on_scroll(e.currentTarget));
         
         // Initialize Gantt chart using Frappe's built-in Gantt
         this.gantt_chart = new frappe.Gantt('#gantt-chart', data, {
@@ -0,0 +1,129 @@
+import functools
+import math
+import re
+from collections import namedtuple
+
+# Acceptance criteria are compiled once per distinct text into a predicate:
+#   ranges        "10-20", "10 to 20 mm", "10..20", "between 10 and 20"
+#   tolerances    "25 ± 0.5", "25 +/- 2%", "25 +0.2/-0.1"
+#   limits        "<= 5", "> 3", "max 5", "min 3", "= 7"
+#   enumerations  "Pass | OK", "one of: A, B, C", "= Pass"
+# Anything else ("Within tolerance") cannot be checked automatically and the
+# reading keeps the status the inspector set, as does a reading left blank or
+# one a numeric criterion cannot read as a number. Readings may carry a unit.
+ACCEPTED, REJECTED, MANUAL = 1, 0, -1
+
+NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+# a unit never starts with a range separator word, so "-20 to -10" keeps its signs
+UNIT = r"\s*(?!(?:to|and)\b)[a-zA-Zµ°%/²³]*\.?\s*"
+
+RANGE = re.compile(rf"^(?:between\s+)?({NUMBER}){UNIT}(?:-|–|\.\.|to|and){UNIT}?\s*({NUMBER}){UNIT}$", re.I)
+TOLERANCE = re.compile(rf"^({NUMBER}){UNIT}(?:±|\+/-|\+-)\s*({NUMBER})\s*(%?){UNIT}$", re.I)
+ASYMMETRIC = re.compile(rf"^({NUMBER}){UNIT}\+\s*({NUMBER})\s*/\s*-\s*({NUMBER}){UNIT}$", re.I)
+LIMIT = re.compile(rf"^(<=|>=|<|>|≤|≥|=|max\.?|min\.?|maximum|minimum)\s*({NUMBER}){UNIT}$", re.I)
+READING = re.compile(rf"^({NUMBER}){UNIT}$", re.I)
+ENUMERATION = re.compile(r"^(?:one\s+of\b:?|in\s*(?=\())\s*\(?(.+?)\)?$", re.I)
+
+LIMITS = {
+    "<": (None, False), "<=": (None, True), "≤": (None, True), "max": (None, True), "max.": (None, True),
+    "maximum": (None, True), ">": (False, None), ">=": (True, None), "≥": (True, None), "min": (True, None),
+    "min.": (True, None), "minimum": (True, None)
+}
+
+Criterion = namedtuple("Criterion", ["low", "high", "low_inclusive", "high_inclusive", "allowed"])
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_criteria(text):
+    """The :class:`Criterion` of an acceptance criteria text, or ``None`` if it is not checkable"""
+    text = (text or "").strip()
+    if not text:
+        return None
+
+    if match := TOLERANCE.match(text):
+        nominal, tolerance, percent = float(match[1]), float(match[2]), match[3]
+        tolerance = abs(nominal) * tolerance / 100 if percent else tolerance
+        return Criterion(nominal - tolerance, nominal + tolerance, True, True, None)
+    if match := ASYMMETRIC.match(text):
+        nominal = float(match[1])
+        return Criterion(nominal - float(match[3]), nominal + float(match[2]), True, True, None)
+    if match := RANGE.match(text):
+        low, high = sorted((float(match[1]), float(match[2])))
+        return Criterion(low, high, True, True, None)
+    if match := LIMIT.match(text):
+        operator, value = match[1].lower(), float(match[2])
+        if operator == "=":
+            return Criterion(value, value, True, True, None)
+        low_inclusive, high_inclusive = LIMITS[operator]
+        if low_inclusive is None:
+            return Criterion(-math.inf, value, True, high_inclusive, None)
+        return Criterion(value, math.inf, low_inclusive, True, None)
+
+    if text.startswith("="):
+        return Criterion(None, None, None, None, frozenset([text[1:].strip().lower()]))
+    if "|" in text or ENUMERATION.match(text):
+        match = ENUMERATION.match(text)
+        values = match[1] if match else text
+        allowed = frozenset(value.strip().lower() for value in re.split(r"[|,]", values) if value.strip())
+        return Criterion(None, None, None, None, allowed) if allowed else None
+
+    return None
+
+
+def to_number(value):
+    """Float of a reading value with an optional trailing unit, ``None`` if it is not a finite number"""
+    match = READING.match(str(value).strip())
+    if not match:
+        return None
+    number = float(match[1])
+    return number if math.isfinite(number) else None
+
+
+def in_bounds(criterion, number):
+    # inclusive bounds allow for floating point noise in measured values
+    margin = 1e-9 * max(abs(number), 1)
+    above = number >= criterion.low - margin if criterion.low_inclusive else number > criterion.low
+    below = number <= criterion.high + margin if criterion.high_inclusive else number < criterion.high
+    return above and below
+
+
+def check(criterion, values):
+    """ACCEPTED/REJECTED of each of ``values`` against one compiled criterion.
+
+    Blank values, and values a numeric criterion cannot read as a number, are
+    MANUAL and keep the status the inspector set.
+    """
+    results = []
+    for value in values:
+        text = "" if value is None else str(value).strip()
+        if not text:
+            results.append(MANUAL)
+        elif criterion.allowed is not None:
+            results.append(ACCEPTED if text.lower() in criterion.allowed else REJECTED)
+        else:
+            number = to_number(text)
+            if number is None:
+                results.append(MANUAL)
+            else:
+                results.append(ACCEPTED if in_bounds(criterion, number) else REJECTED)
+    return results
+
+
+def evaluate_readings(values, criteria):
+    """ACCEPTED, REJECTED or MANUAL for each reading ``value`` against its ``criteria`` text.
+
+    Readings are grouped by criteria so each distinct criteria is compiled once
+    and checked over all its values in one pass.
+    """
+    results = [MANUAL] * len(values)
+    groups = {}
+    for i, text in enumerate(criteria):
+        groups.setdefault(text, []).append(i)
+
+    for text, positions in groups.items():
+        criterion = compile_criteria(text)
+        if criterion is not None:
+            for i, result in zip(positions, check(criterion, [values[i] for i in positions])):
+                results[i] = result
+
+    return results
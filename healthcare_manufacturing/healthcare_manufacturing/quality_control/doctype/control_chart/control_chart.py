@@ -0,0 +1,164 @@
+from itertools import groupby
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import cint, flt
+
+from healthcare_manufacturing.quality_control.spc import (
+    C_CHART, CHART_STATE, P_CHART, RULES, XBAR_R, add_defects, add_subgroup, get_inspection_subgroups
+)
+from healthcare_manufacturing.utils.db import chunked, make_row_name, upsert
+
+# One row per (item, specification, chart type) holding the running SPC
+# statistics, updated in place as each inspection is submitted; p charts
+# cover the whole item and have no specification.
+CHART_FIELDS = ["name", "item_code", "specification", "chart_type", "last_inspection"] + list(CHART_STATE)
+SIGNAL_FIELDS = ["name", "control_chart", "item_code", "specification", "chart_type", "rule", "description",
+    "value", "quality_inspection"]
+INT_FIELDS = ("subgroups", "range_count", "violations")
+
+class ControlChart(Document):
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Control Chart", ["item_code", "specification"])
+    frappe.db.add_index("Control Chart", ["chart_type", "specification"])
+
+def new_chart(name, item_code, specification, chart_type):
+    return frappe._dict(CHART_STATE, name=name, item_code=item_code, specification=specification,
+        chart_type=chart_type, last_inspection=None)
+
+def get_chart_names(item_code, subgroups):
+    """Names of every chart an inspection of ``item_code`` with ``subgroups`` can touch"""
+    names = [make_row_name(item_code, "", P_CHART)]
+    for specification in subgroups:
+        names += [make_row_name(item_code, specification, XBAR_R), make_row_name(item_code, specification, C_CHART)]
+    return names
+
+def load_control_charts(names, for_update=False):
+    """``{name: chart}`` of the existing charts among ``names``, locked with ``for_update``"""
+    charts = {}
+    lock = "FOR UPDATE" if for_update else ""
+    for chunk in chunked(sorted(set(names)), 1000):
+        for chart in frappe.db.sql(f"""
+            SELECT {", ".join(f"`{field}`" for field in CHART_FIELDS)}
+            FROM `tabControl Chart`
+            WHERE name IN %s
+            {lock}
+        """, [tuple(chunk)], as_dict=True):
+            for field, default in CHART_STATE.items():
+                if field in INT_FIELDS:
+                    chart[field] = cint(chart[field])
+                elif isinstance(default, float) or field == "last_value" and chart[field] is not None:
+                    chart[field] = flt(chart[field])
+            chart.recent = chart.recent or "[]"
+            charts[chart.name] = chart
+    return charts
+
+def apply_inspection(charts, inspection, item_code, subgroups, readings):
+    """Add one inspection to the charts of its item, creating missing charts in ``charts``.
+
+    ``subgroups`` are from :func:`get_inspection_subgroups` and ``readings`` is
+    the number of readings of the inspection. Returns the signal rows raised.
+    """
+    signals = []
+    def add(specification, chart_type, update, *args):
+        name = make_row_name(item_code, specification, chart_type)
+        chart = charts.get(name) or new_chart(name, item_code, specification, chart_type)
+        point, rules = update(chart, *args)
+        if point is None:
+            return
+        charts[name] = chart
+        chart.last_inspection = inspection
+        for rule in rules:
+            signals.append([make_row_name(name, inspection, rule), name, item_code, specification, chart_type,
+                rule, RULES[rule], point, inspection])
+
+    for specification, (numbers, rejected) in subgroups.items():
+        if numbers:
+            add(specification, XBAR_R, add_subgroup, numbers)
+        add(specification, C_CHART, add_defects, rejected)
+    add("", P_CHART, add_defects, sum(rejected for numbers, rejected in subgroups.values()), readings)
+
+    return signals
+
+def save_control_charts(charts, signals=()):
+    upsert("Control Chart", CHART_FIELDS, [[chart[field] for field in CHART_FIELDS] for chart in charts])
+    upsert("Control Chart Signal", SIGNAL_FIELDS, signals)
+
+def update_control_charts(doc, method=None):
+    """doc_events handler for Quality Inspection.
+
+    A submitted inspection is added to the locked charts of its item in O(1)
+    per chart; a cancelled one cannot be taken back out of the run rules, so
+    the item's charts are replayed from its remaining inspections.
+    """
+    if not doc.item_code:
+        return
+    if method == "on_cancel":
+        rebuild_control_charts([doc.item_code])
+        return
+
+    readings = [(reading.specification, reading.value, reading.status) for reading in doc.readings]
+    if not readings:
+        return
+
+    subgroups = get_inspection_subgroups(readings)
+    charts = load_control_charts(get_chart_names(doc.item_code, subgroups), for_update=True)
+    signals = apply_inspection(charts, doc.name, doc.item_code, subgroups, len(readings))
+    save_control_charts(charts.values(), signals)
+
+def rebuild_control_charts(item_codes):
+    """Recompute the charts and signals of ``item_codes`` from their submitted inspections, in order"""
+    item_codes = tuple(set(item_codes))
+    frappe.db.sql("DELETE FROM `tabControl Chart` WHERE item_code IN %s", [item_codes])
+    frappe.db.sql("DELETE FROM `tabControl Chart Signal` WHERE item_code IN %s", [item_codes])
+
+    rows = frappe.db.sql("""
+        SELECT qi.name, qi.item_code, r.specification, r.value, r.status
+        FROM `tabQuality Inspection` qi
+        INNER JOIN `tabQuality Inspection Reading` r
+            ON r.parent = qi.name AND r.parenttype = 'Quality Inspection'
+        WHERE qi.docstatus = 1 AND qi.item_code IN %s
+        ORDER BY qi.inspection_date, qi.modified, qi.name, r.idx
+    """, [item_codes])
+
+    charts, signals = {}, []
+    for (inspection, item_code), group in groupby(rows, key=lambda row: row[:2]):
+        readings = [row[2:] for row in group]
+        signals += apply_inspection(charts, inspection, item_code, get_inspection_subgroups(readings),
+            len(readings))
+    save_control_charts(charts.values(), signals)
+
+def rebuild_all_control_charts(chunk_size=100):
+    """Rebuild the charts of every item with submitted inspections"""
+    item_codes = frappe.db.sql_list("""
+        SELECT DISTINCT item_code FROM `tabQuality Inspection`
+        WHERE docstatus = 1 AND IFNULL(item_code, '') != ''
+        ORDER BY item_code
+    """)
+    for chunk in chunked(item_codes, chunk_size):
+        rebuild_control_charts(chunk)
+        frappe.db.commit()
+    return len(item_codes)
+
+@frappe.whitelist()
+def get_control_charts(item_code, specification=None):
+    """Limits and statistics of the control charts of an item, with its latest signals"""
+    frappe.has_permission("Control Chart", throw=True)
+
+    filters = {"item_code": item_code}
+    if specification is not None:
+        filters["specification"] = specification
+
+    return {
+        "charts": frappe.get_all("Control Chart", filters=filters,
+            fields=["name", "specification", "chart_type", "subgroups", "center_line", "ucl", "lcl",
+                "range_center", "range_ucl", "range_lcl", "std_dev", "violations", "last_signal",
+                "last_inspection"],
+            order_by="specification, chart_type"),
+        "signals": frappe.get_all("Control Chart Signal", filters=filters,
+            fields=["specification", "chart_type", "rule", "description", "value", "quality_inspection",
+                "creation"],
+            order_by="creation desc", limit_page_length=50)
+    }
@@ -0,0 +1,8 @@
+import frappe
+from frappe.model.document import Document
+
+class ControlChartSignal(Document):
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Control Chart Signal", ["item_code", "creation"])
@@ -2,6 +2,17 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import now_datetime
 
+from healthcare_manufacturing.inventory.trace_cache import invalidate_batch_traces
+from healthcare_manufacturing.quality_control.acceptance_criteria import ACCEPTED, MANUAL, evaluate_readings
+from healthcare_manufacturing.quality_control.inspection_templates import (
+    get_item_inspection_settings, get_template_readings
+)
+from healthcare_manufacturing.utils.cache import invalidate_dashboard_cache
+from healthcare_manufacturing.utils.db import bulk_insert_docs, reserve_series_names
+
+# Receipts with more lines to inspect get their inspections from a background job
+BACKGROUND_INSPECTION_LINES = 50
+
 class QualityInspection(Document):
     def validate(self):
         self.validate_readings()
@@ -12,21 +23,23 @@ class QualityInspection(Document):
             # Get inspection plan readings
             inspection_plan = self.get_inspection_plan()
             if inspection_plan:
-                for reading in inspection_plan.quality_inspection_template:
-                    self.append("readings", {
-                        "specification": reading.specification,
-                        "value": reading.value,
-                        "acceptance_criteria": reading.acceptance_criteria,
-                        "status": "Accepted"
-                    })
+                for reading in get_template_readings([inspection_plan])[inspection_plan]:
+                    self.append("readings", reading)
 
     def get_inspection_plan(self):
         if self.reference_type == "Purchase Receipt":
-            return frappe.db.get_value("Item", self.item_code, "quality_inspection_template")
+            return get_item_inspection_settings([self.item_code])[self.item_code][1]
         return None
 
     def set_inspection_status(self):
         if self.readings:
+            # Readings with checkable acceptance criteria are evaluated, the others keep their status
+            results = evaluate_readings([r.value for r in self.readings],
+                [r.acceptance_criteria for r in self.readings])
+            for reading, result in zip(self.readings, results):
+                if result != MANUAL:
+                    reading.status = "Accepted" if result == ACCEPTED else "Rejected"
+            
             failed_readings = [r for r in self.readings if r.status == "Rejected"]
             if failed_readings:
                 self.status = "Rejected"
@@ -34,8 +47,8 @@ class QualityInspection(Document):
                 self.status = "Accepted"
 
     def on_submit(self):
-        self.inspected_by = frappe.session.user
-        self.inspection_date = now_datetime()
+        # the document is already written, so persist who and when directly
+        self.db_set({"inspected_by": frappe.session.user, "inspection_date": now_datetime()})
         
         if self.status == "Rejected":
             self.create_ncr()
@@ -63,24 +76,86 @@ class QualityInspection(Document):
 
 @frappe.whitelist()
 def create_quality_inspection(doc, method):
-    """Auto-create quality inspection for Purchase Receipt"""
+    """Auto-create quality inspection for Purchase Receipt.
+
+    Large receipts are handed to a background job once the submit commits, so
+    the submit returns immediately. Both paths create the same inspections.
+    """
     if doc.doctype == "Purchase Receipt":
-        for item in doc.items:
-            item_doc = frappe.get_doc("Item", item.item_code)
-            if item_doc.inspection_required_before_purchase:
-                qi = frappe.get_doc({
-                    "doctype": "Quality Inspection",
-                    "inspection_type": "Incoming",
-                    "reference_type": "Purchase Receipt",
-                    "reference_name": doc.name,
-                    "item_code": item.item_code,
-                    "batch_no": item.batch_no,
-                    "sample_size": 1
-                })
-                qi.insert()
+        if len(doc.items) > BACKGROUND_INSPECTION_LINES:
+            frappe.enqueue("healthcare_manufacturing.quality_control.doctype.quality_inspection"
+                ".quality_inspection.create_receipt_inspections",
+                queue="short", enqueue_after_commit=True, purchase_receipt=doc.name)
+        else:
+            create_receipt_inspections(doc.name)
+
+def create_receipt_inspections(purchase_receipt):
+    """Inspections for the lines of a submitted receipt that have none yet.
+
+    Runs in the submit for small receipts and as a background job for large
+    ones; a receipt cancelled before the job runs gets none.
+    """
+    if frappe.db.get_value("Purchase Receipt", purchase_receipt, "docstatus") != 1:
+        return []
+
+    lines = frappe.db.sql("""
+        SELECT item_code, batch_no FROM `tabPurchase Receipt Item`
+        WHERE parent = %s AND parenttype = 'Purchase Receipt'
+        ORDER BY idx
+    """, purchase_receipt)
+    existing = set(frappe.db.sql("""
+        SELECT item_code, batch_no FROM `tabQuality Inspection`
+        WHERE reference_type = 'Purchase Receipt' AND reference_name = %s
+    """, purchase_receipt))
+    return insert_receipt_inspections(purchase_receipt,
+        [(item_code, batch_no) for item_code, batch_no in lines if (item_code, batch_no) not in existing])
+
+def insert_receipt_inspections(purchase_receipt, lines):
+    """Insert the Incoming inspections of ``(item_code, batch_no)`` receipt lines in bulk.
+
+    Inspection flags, templates and template readings of all items come from
+    the inspection template cache, with at most one query each, and the
+    inspections are written with batched inserts. Returns the new names.
+    """
+    settings = get_item_inspection_settings([item_code for item_code, batch_no in lines])
+    items = {item_code: template for item_code, (required, template) in settings.items() if required}
+
+    lines = [(item_code, batch_no) for item_code, batch_no in lines if item_code in items]
+    if not lines:
+        return []
+
+    readings = get_template_readings({template for template in items.values() if template})
+    naming_series = frappe.get_meta("Quality Inspection").get_field("naming_series").options.split("\n")[0]
+    names = reserve_series_names(naming_series, len(lines))
+
+    docs = []
+    for name, (item_code, batch_no) in zip(names, lines):
+        qi = frappe.new_doc("Quality Inspection")
+        qi.update({
+            "name": name,
+            "naming_series": naming_series,
+            "inspection_type": "Incoming",
+            "reference_type": "Purchase Receipt",
+            "reference_name": purchase_receipt,
+            "item_code": item_code,
+            "batch_no": batch_no,
+            "sample_size": 1
+        })
+        for reading in readings.get(items[item_code], []):
+            qi.append("readings", reading)
+        qi.set_inspection_status()
+        docs.append(qi)
+
+    bulk_insert_docs(docs)
+    invalidate_dashboard_cache(docs[0])
+    invalidate_batch_traces({batch_no for item_code, batch_no in lines})
+    return names
 
 @frappe.whitelist()
 def get_quality_inspection_template(item_code):
-    return frappe.get_all("Quality Inspection Parameter",
-        filters={"parent": item_code},
-        fields=["specification", "value", "acceptance_criteria"])
\ No newline at end of file
+    """Parameters of the inspection template of an item, from the inspection template cache"""
+    template = get_item_inspection_settings([item_code])[item_code][1]
+    if not template:
+        return []
+    return [{field: reading[field] for field in ("specification", "value", "acceptance_criteria")}
+        for reading in get_template_readings([template])[template]]
\ No newline at end of file
@@ -0,0 +1,96 @@
+import frappe
+
+from healthcare_manufacturing.utils.cache import get_cache, get_generations, invalidate_doctype
+from healthcare_manufacturing.utils.db import chunked
+
+# Inspection settings of items and readings of templates are read for every
+# new inspection, so they are kept per worker and stamped with a generation
+# that is bumped, for all workers, when an item's inspection settings or a
+# template change. Item saves that leave those fields alone keep the cache.
+ITEM_SETTINGS = "Item Inspection Settings"
+TEMPLATE = "Quality Inspection Template"
+ITEM_FIELDS = ("inspection_required_before_purchase", "quality_inspection_template")
+
+_item_settings = get_cache("inspection_item_settings", maxsize=20000, ttl=60 * 60)
+_template_readings = get_cache("inspection_template_readings", maxsize=2048, ttl=60 * 60)
+
+
+def get_item_inspection_settings(item_codes):
+    """``{item_code: (inspection required, template)}`` with one query for uncached items"""
+    version = get_generations([ITEM_SETTINGS])
+    settings, missing = {}, []
+    for item_code in set(item_codes):
+        found, value, fresh = _item_settings.lookup(item_code, version)
+        if found and fresh:
+            settings[item_code] = value
+        else:
+            missing.append(item_code)
+
+    for chunk in chunked(missing, 1000):
+        loaded = dict.fromkeys(chunk, (0, None))
+        for item_code, required, template in frappe.db.sql("""
+            SELECT name, inspection_required_before_purchase, quality_inspection_template
+            FROM `tabItem` WHERE name IN %s
+        """, [tuple(chunk)]):
+            loaded[item_code] = (required, template)
+        for item_code, value in loaded.items():
+            _item_settings.set(item_code, value, version=version)
+        settings.update(loaded)
+
+    return settings
+
+
+def get_template_readings(templates):
+    """``{template: [reading]}``: the readings a new inspection starts with, with one query for uncached templates"""
+    version = get_generations([TEMPLATE])
+    readings, missing = {}, []
+    for template in set(templates):
+        found, value, fresh = _template_readings.lookup(template, version)
+        if found and fresh:
+            readings[template] = value
+        else:
+            missing.append(template)
+
+    if missing:
+        loaded = {template: [] for template in missing}
+        for parameter in frappe.get_all("Quality Inspection Parameter",
+            filters={"parent": ["in", missing]},
+            fields=["parent", "specification", "value", "acceptance_criteria"],
+            order_by="parent, idx"):
+            loaded[parameter.parent].append({
+                "specification": parameter.specification,
+                "value": parameter.value,
+                "acceptance_criteria": parameter.acceptance_criteria,
+                "status": "Accepted"
+            })
+        for template, value in loaded.items():
+            _template_readings.set(template, value, version=version)
+        readings.update(loaded)
+
+    # cached readings are shared, callers get their own copies
+    return {template: [dict(reading) for reading in value] for template, value in readings.items()}
+
+
+def invalidate_inspection_templates(doc, method=None):
+    """doc_events handler for Item and Quality Inspection Template.
+
+    Outdates the cached entries now and when the transaction ends, like the
+    other version stamped caches.
+    """
+    if doc.doctype == "Item":
+        if method != "on_trash" and not any(doc.has_value_changed(field) for field in ITEM_FIELDS):
+            return
+        doctype = ITEM_SETTINGS
+    else:
+        doctype = TEMPLATE
+
+    invalidate_doctype(doctype)
+    frappe.db.after_commit.add(lambda: invalidate_doctype(doctype))
+    frappe.db.after_rollback.add(lambda: invalidate_doctype(doctype))
+
+
+@frappe.whitelist()
+def get_inspection_template_cache_stats():
+    """Hit/miss statistics of the item settings and template caches of this worker"""
+    frappe.only_for(["System Manager", "Quality Manager"])
+    return [_item_settings.stats(), _template_readings.stats()]
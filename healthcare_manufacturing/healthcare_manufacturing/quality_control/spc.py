@@ -0,0 +1,187 @@
+import json
+import math
+
+# Statistical process control of inspection readings. Every chart keeps
+# running statistics (Welford's mean and sum of squared deviations, range and
+# sample totals) so a new subgroup updates its limits in O(1):
+#   X-bar R  mean and range of the numeric readings of one specification in an
+#            inspection; a single reading is charted against its moving range
+#   p        fraction of an inspection's readings of the item that are rejected
+#   c        rejected readings of one specification in an inspection
+XBAR_R, P_CHART, C_CHART = "X-bar R", "p", "c"
+
+# Shewhart constants by subgroup size: (A2, D3, D4)
+CONTROL_CONSTANTS = {
+    2: (1.880, 0, 3.267), 3: (1.023, 0, 2.574), 4: (0.729, 0, 2.282), 5: (0.577, 0, 2.114),
+    6: (0.483, 0, 2.004), 7: (0.419, 0.076, 1.924), 8: (0.373, 0.136, 1.864), 9: (0.337, 0.184, 1.816),
+    10: (0.308, 0.223, 1.777), 11: (0.285, 0.256, 1.744), 12: (0.266, 0.283, 1.717),
+    13: (0.249, 0.307, 1.693), 14: (0.235, 0.328, 1.672), 15: (0.223, 0.347, 1.653),
+    16: (0.212, 0.363, 1.637), 17: (0.203, 0.378, 1.622), 18: (0.194, 0.391, 1.608),
+    19: (0.187, 0.403, 1.597), 20: (0.180, 0.415, 1.585), 21: (0.173, 0.425, 1.575),
+    22: (0.167, 0.434, 1.566), 23: (0.162, 0.443, 1.557), 24: (0.157, 0.451, 1.548),
+    25: (0.153, 0.459, 1.541)
+}
+MOVING_RANGE_CONSTANTS = (2.660, 0, 3.267)
+
+# Subgroups that estimate the limits before points are judged against them
+MIN_SUBGROUPS = 5
+# z-scores kept per chart for the run rules, the longest of which spans 8 points
+RUN_LENGTH = 8
+# z-score recorded for a point off a center line without spread
+MAX_Z = 10
+
+RANGE_RULE = 5
+RULES = {
+    1: "One point beyond 3 sigma",
+    2: "Two of three points beyond 2 sigma on one side",
+    3: "Four of five points beyond 1 sigma on one side",
+    4: "Eight points in a row on one side of the center line",
+    RANGE_RULE: "Subgroup range above its upper control limit"
+}
+
+CHART_STATE = {
+    "subgroups": 0, "mean": 0.0, "m2": 0.0, "std_dev": 0.0, "size_sum": 0.0, "defect_sum": 0.0,
+    "range_sum": 0.0, "range_count": 0, "last_value": None, "center_line": 0.0, "ucl": 0.0, "lcl": 0.0,
+    "range_center": 0.0, "range_ucl": 0.0, "range_lcl": 0.0, "recent": "[]", "violations": 0,
+    "last_signal": None
+}
+
+
+def western_electric_violations(scores):
+    """Western Electric rules broken by the last of ``scores``, the chart's recent z-scores.
+
+    A run only counts when its newest point is part of it, so a run is
+    signalled when it forms and not again for each point that follows.
+    """
+    z = scores[-1]
+    side = (z > 0) - (z < 0)
+    beyond = lambda window, limit: sum(1 for score in window if score * side > limit)
+
+    rules = []
+    if abs(z) > 3:
+        rules.append(1)
+    if side:
+        if z * side > 2 and beyond(scores[-3:], 2) >= 2:
+            rules.append(2)
+        if z * side > 1 and beyond(scores[-5:], 1) >= 4:
+            rules.append(3)
+        if len(scores) >= RUN_LENGTH and beyond(scores[-RUN_LENGTH:], 0) == RUN_LENGTH:
+            rules.append(4)
+    return rules
+
+
+def add_observation(chart, x):
+    """Welford update of the running mean and variance of the charted points"""
+    chart.subgroups += 1
+    delta = x - chart.mean
+    chart.mean += delta / chart.subgroups
+    chart.m2 += delta * (x - chart.mean)
+    chart.std_dev = math.sqrt(chart.m2 / (chart.subgroups - 1)) if chart.subgroups > 1 else 0.0
+
+
+def get_sigma(chart, size=None):
+    """Standard deviation of a point of the chart, for a subgroup of ``size`` on a p chart"""
+    if chart.chart_type == XBAR_R:
+        return (chart.ucl - chart.center_line) / 3
+    if chart.chart_type == P_CHART:
+        p = chart.center_line
+        return math.sqrt(p * (1 - p) / (size or chart.size_sum / chart.subgroups))
+    return math.sqrt(chart.center_line)
+
+
+def set_limits(chart):
+    """Center line and control limits from the running statistics"""
+    if not chart.subgroups:
+        return
+
+    if chart.chart_type == XBAR_R:
+        size = round(chart.size_sum / chart.subgroups)
+        a2, d3, d4 = CONTROL_CONSTANTS[min(size, 25)] if size > 1 else MOVING_RANGE_CONSTANTS
+        mean_range = chart.range_sum / chart.range_count if chart.range_count else 0.0
+        chart.center_line = chart.mean
+        chart.ucl, chart.lcl = chart.mean + a2 * mean_range, chart.mean - a2 * mean_range
+        chart.range_center, chart.range_ucl, chart.range_lcl = mean_range, d4 * mean_range, d3 * mean_range
+        return
+
+    chart.center_line = chart.defect_sum / (chart.size_sum if chart.chart_type == P_CHART else chart.subgroups)
+    sigma = get_sigma(chart)
+    chart.ucl = chart.center_line + 3 * sigma
+    chart.lcl = max(chart.center_line - 3 * sigma, 0.0)
+    if chart.chart_type == P_CHART:
+        chart.ucl = min(chart.ucl, 1.0)
+
+
+def judge_point(chart, point, size=None, spread=None):
+    """Rules the point breaks against the current limits, recording its z-score"""
+    if chart.subgroups < MIN_SUBGROUPS:
+        return []
+
+    sigma, offset = get_sigma(chart, size), point - chart.center_line
+    if sigma > 0:
+        z = offset / sigma
+    else:
+        z = 0.0 if math.isclose(offset, 0, abs_tol=1e-12) else math.copysign(MAX_Z, offset)
+
+    scores = (json.loads(chart.recent or "[]") + [round(max(min(z, MAX_Z), -MAX_Z), 4)])[-RUN_LENGTH:]
+    chart.recent = json.dumps(scores)
+
+    rules = western_electric_violations(scores)
+    if spread is not None and chart.range_ucl and spread > chart.range_ucl:
+        rules.append(RANGE_RULE)
+    if rules:
+        chart.violations += len(rules)
+        chart.last_signal = RULES[rules[0]]
+    return rules
+
+
+def add_subgroup(chart, values):
+    """Add the numeric readings of one inspection to an X-bar R chart, returning ``(point, rules)``"""
+    values = [float(value) for value in values]
+    if not values:
+        return None, []
+
+    point = math.fsum(values) / len(values)
+    if len(values) > 1:
+        spread = max(values) - min(values)
+    else:
+        spread = abs(point - chart.last_value) if chart.last_value is not None else None
+
+    rules = judge_point(chart, point, spread=spread)
+    add_observation(chart, point)
+    chart.size_sum += len(values)
+    chart.last_value = point
+    if spread is not None:
+        chart.range_sum += spread
+        chart.range_count += 1
+    set_limits(chart)
+    return point, rules
+
+
+def add_defects(chart, defects, size=1):
+    """Add ``defects`` out of ``size`` inspected to a p or c chart, returning ``(point, rules)``"""
+    if chart.chart_type == P_CHART and not size:
+        return None, []
+
+    point = defects / size if chart.chart_type == P_CHART else float(defects)
+    rules = judge_point(chart, point, size=size)
+    add_observation(chart, point)
+    chart.size_sum += size
+    chart.defect_sum += defects
+    chart.last_value = point
+    set_limits(chart)
+    return point, rules
+
+
+def get_inspection_subgroups(readings):
+    """``{specification: (numbers, rejected)}`` of an inspection's ``(specification, value, status)`` readings"""
+    subgroups = {}
+    for specification, value, status in readings:
+        numbers, rejected = subgroups.setdefault(specification or "", ([], [0]))
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = None
+        if number is not None and math.isfinite(number):
+            numbers.append(number)
+        rejected[0] += status == "Rejected"
+    return {specification: (numbers, rejected[0]) for specification, (numbers, rejected) in subgroups.items()}
@@ -0,0 +1,71 @@
+import frappe
+import random
+import unittest
+
+from healthcare_manufacturing.quality_control.acceptance_criteria import (
+    ACCEPTED, MANUAL, REJECTED, compile_criteria, evaluate_readings)
+
+class TestAcceptanceCriteria(unittest.TestCase):
+    def assertReadings(self, criteria, accepted, rejected):
+        values = accepted + rejected
+        results = evaluate_readings(values, [criteria] * len(values))
+        self.assertEqual(list(results), [ACCEPTED] * len(accepted) + [REJECTED] * len(rejected), criteria)
+
+    def test_numeric_criteria(self):
+        """Test ranges, tolerances and limits, with units and floating point noise"""
+        self.assertReadings("10-20", ["10", "15.5", 20], ["9.99", "20.01"])
+        self.assertReadings("-5 to 5 mm", ["-5", "0"], ["-5.1", "6"])
+        self.assertReadings("-20 to -10 °C", ["-20", "-15"], ["-21", "-9", "5"])
+        self.assertReadings("between -3 and -1", ["-3", "-1"], ["-0.5", "1"])
+        self.assertReadings("0 to -5", ["-5", "0"], ["5", "-6"])
+        self.assertReadings("between 1.5 and 2", ["1.5", "2"], ["1.4"])
+        self.assertReadings("25 ± 0.5", ["24.5", "25.5", "25.3 mm"], ["24.4", "25.6", "25.6mm"])
+        self.assertReadings("25 +/- 2%", ["24.5", "25.5"], ["24.4"])
+        self.assertReadings("25 +0.2/-0.1 mm", ["24.9", "25.2"], ["24.8", "25.3"])
+        self.assertReadings("<= 5", ["5", "-1"], ["5.01"])
+        self.assertReadings("< 5", ["4.99"], ["5"])
+        self.assertReadings("min 3", ["3", "100"], ["2.9"])
+        self.assertReadings("= 7", ["7", "7.0"], ["7.1"])
+        self.assertReadings("0.1-0.3", [0.1 + 0.2], [0.31])
+
+    def test_enumerations(self):
+        """Test enumerations are case-insensitive and free text stays manual"""
+        self.assertReadings("Pass | OK", ["pass", " OK "], ["Fail"])
+        self.assertReadings("one of: A, B, C", ["b"], ["D"])
+        self.assertReadings("= Pass", ["PASS"], ["Passed"])
+
+        for text in ("Within tolerance", "No defects", "Inspect visually", "", None):
+            self.assertIsNone(compile_criteria(text))
+        self.assertEqual(list(evaluate_readings(["Fail"], ["Within tolerance"])), [MANUAL])
+
+    def test_blank_readings_stay_manual(self):
+        """Test readings not taken yet keep the inspector's status instead of being rejected"""
+        for criteria in ("10-20", "Pass | OK"):
+            self.assertEqual(list(evaluate_readings([None, "", "  "], [criteria] * 3)), [MANUAL] * 3)
+
+    def test_unreadable_numbers_stay_manual(self):
+        """Test text and non-finite values are left to the inspector by numeric criteria"""
+        values = ["abc", "inf", "nan", "-Infinity", "approx 5"]
+        self.assertEqual(list(evaluate_readings(values, ["min 3"] * len(values))), [MANUAL] * len(values))
+
+    def test_evaluation_throughput(self):
+        """Test 100,000 mixed readings compile each distinct criteria once"""
+        rng = random.Random(0)
+        criteria = ["10-20", "25 ± 0.5", "<= 5", "Pass | Fail", "Within tolerance"] + \
+            [f"{i} ± 0.1" for i in range(50)]
+        picked = [rng.choice(criteria) for i in range(100000)]
+        values = [f"{rng.gauss(15, 5):.3f}" for i in range(100000)]
+
+        compile_criteria.cache_clear()
+        results = evaluate_readings(values, picked)
+
+        self.assertEqual(compile_criteria.cache_info().misses, len(set(picked)))
+        self.assertEqual(len(results), 100000)
+        for value, text, result in zip(values, picked, results):
+            if text == "10-20":
+                self.assertEqual(result, ACCEPTED if 10 <= float(value) <= 20 else REJECTED)
+            elif text == "Within tolerance":
+                self.assertEqual(result, MANUAL)
+
+    def tearDown(self):
+        frappe.db.rollback()
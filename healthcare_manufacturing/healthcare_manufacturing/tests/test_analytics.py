@@ -0,0 +1,155 @@
+import frappe
+import re
+import time
+import unittest
+from unittest.mock import patch
+from frappe.utils import add_days, getdate, today
+
+from healthcare_manufacturing.api import analytics
+from healthcare_manufacturing.analytics import metrics
+from healthcare_manufacturing.utils.cache import TTLCache, clear_dashboard_cache, invalidate_doctype
+from healthcare_manufacturing.utils.concurrency import fan_out
+
+class TestAnalytics(unittest.TestCase):
+    def setUp(self):
+        clear_dashboard_cache()
+
+    def main_table(self, query):
+        match = re.search(r"FROM\s+`tab([^`]+)`", query)
+        return match.group(1) if match else None
+
+    def count_queries(self, method, doctype=None):
+        """Run ``method`` and count its queries, optionally only those whose main table is ``doctype``"""
+        with patch.object(frappe.db, "sql", wraps=frappe.db.sql) as sql:
+            result = method()
+
+        queries = [call.args[0] for call in sql.call_args_list]
+        if doctype:
+            queries = [query for query in queries if self.main_table(query) == doctype]
+        return result, len(queries)
+
+    def test_work_order_counters_single_query(self):
+        """Test all work order counters are computed in one query"""
+        counters, queries = self.count_queries(metrics.get_work_order_counters)
+
+        self.assertEqual(queries, 1)
+        self.assertEqual(counters["total_work_orders"], frappe.db.count("Work Order"))
+        self.assertEqual(counters["open_work_orders"], frappe.db.count("Work Order",
+            {"status": ["in", ["Not Started", "In Process"]]}))
+
+    def test_production_metrics_query_count(self):
+        """Test production dashboard issues a single Work Order query"""
+        data, queries = self.count_queries(analytics.get_production_metrics, "Work Order")
+
+        self.assertEqual(queries, 1)
+        self.assertEqual(sum(data["work_order_status"]["datasets"][0]["values"]),
+            frappe.db.count("Work Order"))
+
+    def test_quality_metrics_query_count(self):
+        """Test quality dashboard issues one query each for QI, NCR, CAPA, the trend and the defect chart"""
+        data, queries = self.count_queries(analytics.get_quality_metrics)
+
+        self.assertEqual(queries, 5)
+        self.assertEqual(data["pending_inspections"],
+            frappe.db.count("Quality Inspection", {"status": "Draft"}))
+
+    def test_quality_trend_counts_submitted_inspections(self):
+        """Test a submitted inspection is dated and shows up in this week's pass rate"""
+        if not frappe.db.exists("Item", "QC-TREND-001"):
+            frappe.get_doc({
+                "doctype": "Item",
+                "item_code": "QC-TREND-001",
+                "item_name": "QC Trend Item",
+                "item_group": "Medical Equipment",
+                "stock_uom": "Nos"
+            }).insert()
+
+        qi = frappe.get_doc({
+            "doctype": "Quality Inspection",
+            "inspection_type": "Incoming",
+            "item_code": "QC-TREND-001",
+            "sample_size": 1,
+            "readings": [{"specification": "Length", "value": "95", "acceptance_criteria": "90-100 mm"}]
+        })
+        qi.insert()
+        qi.submit()
+
+        self.assertIsNotNone(frappe.db.get_value("Quality Inspection", qi.name, "inspection_date"))
+        week = getdate(today())
+        week = add_days(week, -week.weekday())
+        trend = analytics.get_quality_trend_data()
+        self.assertEqual(trend["labels"][-1], f"Week of {week.strftime('%d %b')}")
+        self.assertGreater(trend["datasets"][0]["values"][-1], 0)
+
+    def test_finance_and_inventory_metrics_query_count(self):
+        """Test finance and inventory dashboards issue one query per doctype"""
+        _, queries = self.count_queries(analytics.get_finance_metrics)
+        self.assertEqual(queries, 2)
+
+        _, queries = self.count_queries(analytics.get_inventory_metrics)
+        self.assertEqual(queries, 1)
+
+    def test_executive_summary_query_count(self):
+        """Test executive summary issues one query per source doctype"""
+        summary, _ = self.count_queries(analytics.get_executive_summary)
+
+        for doctype in ("Work Order", "Quality Inspection", "NCR", "Sales Invoice", "Item"):
+            clear_dashboard_cache()
+            _, queries = self.count_queries(analytics.get_executive_summary, doctype)
+            self.assertEqual(queries, 1, doctype)
+
+        self.assertEqual(summary["production"]["total_work_orders"], frappe.db.count("Work Order"))
+
+    def test_dashboard_cache_hit(self):
+        """Test repeated dashboard calls are served without queries"""
+        first, _ = self.count_queries(analytics.get_production_metrics)
+        second, queries = self.count_queries(analytics.get_production_metrics)
+
+        self.assertEqual(queries, 0)
+        self.assertEqual(first, second)
+
+    def test_dashboard_cache_serves_stale_after_invalidation(self):
+        """Test an invalidated result is still served while it is recomputed"""
+        analytics.get_production_metrics()
+        invalidate_doctype("Work Order")
+
+        with patch("healthcare_manufacturing.utils.cache.refresh_in_background") as refresh:
+            _, queries = self.count_queries(analytics.get_production_metrics)
+
+        self.assertEqual(queries, 0)
+        refresh.assert_called_once()
+
+    def test_ttl_cache_eviction_and_versions(self):
+        """Test LRU eviction and version-stamped staleness"""
+        cache = TTLCache("test", maxsize=2, ttl=60, stale_ttl=60)
+        cache.set("a", 1, version=1)
+        cache.set("b", 2, version=1)
+        cache.get("a", version=1)
+        cache.set("c", 3, version=1)
+
+        self.assertEqual(cache.lookup("b", version=1), (False, None, False))
+        self.assertEqual(cache.lookup("a", version=2), (True, 1, False))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_fan_out_latency_is_max_of_providers(self):
+        """Test providers run concurrently and slow ones fall back to their last value"""
+        def slow(value, seconds):
+            def provider():
+                time.sleep(seconds)
+                return value
+            return provider
+
+        with patch.object(frappe.flags, "in_test", False):
+            start = time.monotonic()
+            results, stale, errors = fan_out({"a": slow(1, 0.5), "b": slow(2, 0.5), "c": slow(3, 0.5)})
+            self.assertLess(time.monotonic() - start, 1.2)
+            self.assertEqual(results, {"a": 1, "b": 2, "c": 3})
+
+            results, stale, errors = fan_out({"a": slow(10, 0), "c": slow(30, 2)}, timeout=0.5)
+
+        self.assertEqual(results, {"a": 10, "c": 3})
+        self.assertEqual(stale, ["c"])
+        self.assertIn("c", errors)
+
+    def tearDown(self):
+        frappe.db.rollback()
@@ -0,0 +1,52 @@
+import frappe
+import unittest
+
+from healthcare_manufacturing.manufacturing.bom_costing import roll_up_costs
+
+class TestBOMCosting(unittest.TestCase):
+    def test_multi_level_rollup(self):
+        """Test sub-assemblies are costed at their own BOM's unit cost, raw materials at their price"""
+        quantities = {"BOM-FG": 1, "BOM-SUB": 4}
+        lines = {
+            "BOM-FG": [("fg-1", "SUB", 2), ("fg-2", "RAW-A", 1)],
+            "BOM-SUB": [("sub-1", "RAW-A", 4), ("sub-2", "RAW-B", 8)]
+        }
+        prices = {"RAW-A": 10, "RAW-B": 2.5, "SUB": 999}
+
+        unit_costs, rates = roll_up_costs(quantities, lines, {"SUB": "BOM-SUB"}, prices)
+        # 4 units of SUB cost 4 * 10 + 8 * 2.5 = 60
+        self.assertEqual(unit_costs["BOM-SUB"], 15)
+        self.assertEqual(rates["fg-1"], 15)
+        self.assertEqual(unit_costs["BOM-FG"], 40)
+
+    def test_recursive_bom(self):
+        """Test a BOM used inside its own tree is rejected"""
+        lines = {"BOM-A": [("a-1", "B", 1)], "BOM-B": [("b-1", "A", 1)]}
+        with self.assertRaises(frappe.ValidationError):
+            roll_up_costs({"BOM-A": 1, "BOM-B": 1}, lines, {"A": "BOM-A", "B": "BOM-B"}, {})
+
+    def test_recost_scaling(self):
+        """Test 5,000 BOMs sharing 200 sub-assemblies are costed from the sub-assembly costs"""
+        quantities, lines, defaults = {}, {}, {}
+        for i in range(200):
+            quantities[f"BOM-SUB-{i}"] = 1
+            defaults[f"SUB-{i}"] = f"BOM-SUB-{i}"
+            lines[f"BOM-SUB-{i}"] = [(f"sub-{i}-{j}", f"RAW-{(i + j) % 3000}", 1) for j in range(30)]
+        for i in range(4800):
+            quantities[f"BOM-FG-{i}"] = 1
+            lines[f"BOM-FG-{i}"] = [(f"fg-{i}-{j}", f"SUB-{(i * 7 + j) % 200}", 2) for j in range(10)] + \
+                [(f"fg-{i}-raw-{j}", f"RAW-{(i + j) % 3000}", 1) for j in range(20)]
+        prices = {f"RAW-{i}": 1 + i % 10 for i in range(3000)}
+
+        unit_costs, rates = roll_up_costs(quantities, lines, defaults, prices)
+
+        self.assertEqual(len(unit_costs), 5000)
+        self.assertEqual(len(rates), 200 * 30 + 4800 * 30)
+        for i in range(4800):
+            subs = sum(2 * sum(prices[item_code] for name, item_code, qty in lines[f"BOM-SUB-{(i * 7 + j) % 200}"])
+                for j in range(10))
+            raws = sum(prices[f"RAW-{(i + j) % 3000}"] for j in range(20))
+            self.assertEqual(unit_costs[f"BOM-FG-{i}"], subs + raws)
+
+    def tearDown(self):
+        frappe.db.rollback()
@@ -0,0 +1,48 @@
+import frappe
+import unittest
+from unittest.mock import patch
+
+from healthcare_manufacturing.manufacturing import bom_explosion
+from healthcare_manufacturing.manufacturing.bom_explosion import BOMNode, explode_node, get_bom_items
+
+class TestBOMExplosion(unittest.TestCase):
+    def setUp(self):
+        bom_explosion._cache.clear()
+        # FG needs 2 SUB and 1 RAW-A; SUB makes 2 units from 1 RAW-A and 4 RAW-B
+        self.nodes = {
+            "BOM-FG": BOMNode("BOM-FG", "FG", [("SUB", 2, "Nos", "BOM-SUB"), ("RAW-A", 1, "Kg", None)]),
+            "BOM-SUB": BOMNode("BOM-SUB", "SUB", [("RAW-A", 0.5, "Kg", None), ("RAW-B", 2, "Nos", None)])
+        }
+
+    def test_multi_level_explosion(self):
+        """Test sub-assemblies are exploded down to raw materials per unit"""
+        quantities, uoms = explode_node("BOM-FG", self.nodes, ("v1",), ())
+        self.assertEqual(quantities, {"RAW-A": 2, "RAW-B": 4})
+        self.assertEqual(uoms, {"RAW-A": "Kg", "RAW-B": "Nos"})
+
+    def test_work_order_items_are_first_level(self):
+        """Test Work Orders consume sub-assemblies instead of their raw materials"""
+        quantities, uoms = get_bom_items("BOM-FG", ("v1",), self.nodes)
+        self.assertEqual(quantities, {"SUB": 2, "RAW-A": 1})
+        self.assertEqual(uoms, {"SUB": "Nos", "RAW-A": "Kg"})
+
+    def test_recursive_bom_is_rejected(self):
+        """Test a BOM containing itself through a sub-assembly raises instead of looping"""
+        self.nodes["BOM-SUB"].components.append(("FG", 1, "Nos", "BOM-FG"))
+        with self.assertRaises(frappe.ValidationError):
+            explode_node("BOM-FG", self.nodes, ("v1",), ())
+
+    def test_explosion_scales_without_queries(self):
+        """Test 500 plan lines reuse one cached explosion without touching the database"""
+        explode_node("BOM-FG", self.nodes, ("v1",), ())
+        with patch.object(bom_explosion, "get_version", return_value=("v1",)), \
+                patch.object(bom_explosion, "get_bom_nodes", return_value=self.nodes), \
+                patch.object(frappe.db, "sql") as sql:
+            requirements = bom_explosion.explode_boms([("BOM-FG", qty) for qty in range(1, 501)])
+
+        self.assertEqual(sql.call_count, 0)
+        self.assertEqual(requirements["RAW-B"], (4 * sum(range(1, 501)), "Nos"))
+
+    def tearDown(self):
+        bom_explosion._cache.clear()
+        frappe.db.rollback()
@@ -0,0 +1,34 @@
+import frappe
+import unittest
+
+from healthcare_manufacturing.manufacturing.bom_explosion import BOMNode
+from healthcare_manufacturing.manufacturing.doctype.bom_where_used.bom_where_used import get_bom_closure
+
+class TestBOMWhereUsed(unittest.TestCase):
+    def test_closure_through_sub_assemblies(self):
+        """Test components are indexed at every level with their shallowest depth and total qty"""
+        nodes = {
+            "BOM-FG": BOMNode("BOM-FG", "FG", [("SUB", 2, "Nos", "BOM-SUB"), ("SCREW", 4, "Nos", None)]),
+            "BOM-SUB": BOMNode("BOM-SUB", "SUB", [("SCREW", 3, "Nos", None), ("LENS", 1, "Nos", None)])
+        }
+        closures = {}
+
+        self.assertEqual(get_bom_closure("BOM-FG", nodes, closures), {
+            "SUB": (1, 2),
+            "SCREW": (1, 4 + 2 * 3),
+            "LENS": (2, 2)
+        })
+        # the sub-assembly was indexed once on the way
+        self.assertEqual(closures["BOM-SUB"], {"SCREW": (1, 3), "LENS": (1, 1)})
+
+    def test_recursive_bom(self):
+        """Test a BOM containing itself through a sub-assembly is rejected"""
+        nodes = {
+            "BOM-A": BOMNode("BOM-A", "A", [("B", 1, "Nos", "BOM-B")]),
+            "BOM-B": BOMNode("BOM-B", "B", [("A", 1, "Nos", "BOM-A")])
+        }
+        with self.assertRaises(frappe.ValidationError):
+            get_bom_closure("BOM-A", nodes, {})
+
+    def tearDown(self):
+        frappe.db.rollback()
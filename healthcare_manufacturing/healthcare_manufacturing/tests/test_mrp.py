@@ -0,0 +1,78 @@
+import datetime
+import frappe
+import unittest
+
+from healthcare_manufacturing.manufacturing.bom_explosion import BOMNode
+from healthcare_manufacturing.manufacturing.mrp import get_low_level_codes, net_requirements
+
+DAY_1 = datetime.date(2025, 3, 1)
+DAY_5 = datetime.date(2025, 3, 5)
+DAY_10 = datetime.date(2025, 3, 10)
+
+class TestMRP(unittest.TestCase):
+    def setUp(self):
+        # FG: 2 SUB + 1 RAW-A; SUB: 3 RAW-A + 1 RAW-B. RAW-A is on two levels.
+        self.nodes = {
+            "BOM-FG": BOMNode("BOM-FG", "FG", [("SUB", 2, "Nos", "BOM-SUB"), ("RAW-A", 1, "Kg", None)]),
+            "BOM-SUB": BOMNode("BOM-SUB", "SUB", [("RAW-A", 3, "Kg", None), ("RAW-B", 1, "Nos", None)])
+        }
+
+    def test_low_level_codes(self):
+        """Test an item used on several levels is netted at its deepest one"""
+        self.assertEqual(get_low_level_codes(["BOM-FG"], self.nodes), {"SUB": 1, "RAW-A": 2, "RAW-B": 2})
+
+    def test_gross_to_net_across_levels(self):
+        """Test stock, receipts and lead times are applied level by level"""
+        lines = [("FG", "BOM-FG", 10, DAY_10), ("FG", "BOM-FG", 5, DAY_1)]
+        levels = get_low_level_codes(["BOM-FG"], self.nodes)
+        purchases, sub_assemblies = net_requirements(lines, self.nodes, levels,
+            on_hand={"SUB": 10, "RAW-A": 40},
+            receipts={"RAW-B": [(DAY_5, 100)]},
+            lead_times={"SUB": 4, "RAW-A": 2})
+
+        # SUB: 10 needed on day 1 covered by stock, 20 on day 10 short, released on day 6
+        self.assertEqual([(s.item_code, s.qty, s.schedule_date, s.release_date) for s in sub_assemblies],
+            [("SUB", 20, DAY_10, datetime.date(2025, 3, 6))])
+
+        # RAW-A: 5 (day 1) + 60 for SUB (day 6) + 10 (day 10) against 40 on hand
+        raw_a = [(p.qty, p.schedule_date) for p in purchases if p.item_code == "RAW-A"]
+        self.assertEqual(raw_a, [(25, datetime.date(2025, 3, 6)), (10, DAY_10)])
+
+        # RAW-B: 20 for SUB on day 6, after the receipt of 100 on day 5
+        self.assertFalse([p for p in purchases if p.item_code == "RAW-B"])
+
+    def test_mrp_scales_to_large_plans(self):
+        """Test 2,000 plan lines over 20,000 components net to their gross requirements"""
+        nodes = {}
+        for i in range(200):
+            components = [(f"RAW-{(i * 37 + j) % 20000:05d}", 1 + j % 3, "Nos", None) for j in range(100)]
+            components.append((f"SUB-{i % 50:02d}", 1, "Nos", f"BOM-SUB-{i % 50:02d}"))
+            nodes[f"BOM-FG-{i:03d}"] = BOMNode(f"BOM-FG-{i:03d}", f"FG-{i:03d}", components)
+        for i in range(50):
+            nodes[f"BOM-SUB-{i:02d}"] = BOMNode(f"BOM-SUB-{i:02d}", f"SUB-{i:02d}",
+                [(f"RAW-{(i * 401 + j) % 20000:05d}", 2, "Nos", None) for j in range(400)])
+
+        lines = [(f"FG-{i % 200:03d}", f"BOM-FG-{i % 200:03d}", 1 + i % 7,
+            DAY_1 + datetime.timedelta(days=i % 30)) for i in range(2000)]
+
+        levels = get_low_level_codes({line[1] for line in lines}, nodes)
+        purchases, sub_assemblies = net_requirements(lines, nodes, levels, {}, {}, {})
+
+        # without stock every gross requirement is bought or made in full
+        gross = {}
+        for item_code, bom_no, qty, schedule_date in lines:
+            for component, per_unit, uom, sub_bom in nodes[bom_no].components:
+                gross[component] = gross.get(component, 0) + qty * per_unit
+                for raw, raw_per_unit, raw_uom, raw_bom in nodes[sub_bom].components if sub_bom else []:
+                    gross[raw] = gross.get(raw, 0) + qty * per_unit * raw_per_unit
+
+        netted = {}
+        for suggestion in purchases + sub_assemblies:
+            netted[suggestion.item_code] = netted.get(suggestion.item_code, 0) + suggestion.qty
+
+        self.assertGreater(len(levels), 10000)
+        self.assertEqual(netted, gross)
+        self.assertEqual({s.item_code for s in sub_assemblies}, {f"SUB-{i:02d}" for i in range(50)})
+
+    def tearDown(self):
+        frappe.db.rollback()
@@ -0,0 +1,46 @@
+import frappe
+import random
+import unittest
+
+from healthcare_manufacturing.manufacturing import oee
+from healthcare_manufacturing.manufacturing.oee import Operation
+
+class TestOEE(unittest.TestCase):
+    def make_operations(self, count, workstations, seed=0):
+        rng = random.Random(seed)
+        return [Operation(f"WS-{rng.randrange(workstations):03d}", rng.randrange(24), rng.uniform(10, 60),
+                rng.uniform(10, 70), float(rng.randint(1, 9)), 10.0, float(rng.randrange(3)),
+                float(rng.randrange(2)), rng.random() < 0.2)
+            for i in range(count)]
+
+    def test_oee_components(self):
+        """Test availability, performance and quality on a hand-checked workstation"""
+        operations = [
+            Operation("WS-1", 8, 60.0, 100.0, 10.0, 10.0, 3.0, 1.0, True),
+            Operation("WS-1", 9, 60.0, 100.0, 5.0, 10.0, 3.0, 1.0, False),
+        ]
+
+        rollup = oee.compute_oee(operations, {"WS-1": [400.0, 0.0, 0.0]})
+
+        # 200 of 400 planned minutes run, 90 ideal minutes over 200 run, 3 of 4 accepted
+        self.assertEqual(rollup["plant"], {"availability": 50.0, "performance": 45.0,
+            "quality": 75.0, "oee": 16.9})
+        self.assertEqual(rollup["workstations"]["WS-1"]["shifts"]["Morning"]["availability"], 50.0)
+
+    def test_shift_overlap(self):
+        """Test working hours are split across shifts, including overnight windows"""
+        self.assertEqual(oee.get_shift_overlap(8, 16), [360, 120, 0])
+        self.assertEqual(oee.get_shift_overlap(20, 4), [0, 120, 360])
+
+    def test_oee_rollup_of_many_workstations(self):
+        """Test a year of operations for hundreds of workstations rolls up into every level"""
+        operations = self.make_operations(50000, 300)
+        planned = {f"WS-{i:03d}": [minutes * 365 for minutes in oee.get_shift_overlap(8, 16)]
+            for i in range(300)}
+
+        rollup = oee.compute_oee(operations, planned)
+
+        self.assertEqual(len(rollup["workstations"]), 300)
+        self.assertEqual(set(rollup["shifts"]), set(oee.SHIFT_NAMES))
+        for summary in [rollup["plant"]] + list(rollup["shifts"].values()):
+            self.assertTrue(0 <= summary["oee"] <= 100)
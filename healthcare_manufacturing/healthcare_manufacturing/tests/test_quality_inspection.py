@@ -36,6 +36,23 @@ class TestQualityInspection(unittest.TestCase):
         # Validate status is set correctly
         self.assertEqual(qi.status, "Accepted")
 
+    def test_readings_checked_against_acceptance_criteria(self):
+        """Test numeric readings outside their criteria reject the inspection whatever was typed"""
+        qi = frappe.get_doc({
+            "doctype": "Quality Inspection",
+            "inspection_type": "Incoming",
+            "item_code": "QC-TEST-001",
+            "readings": [
+                {"specification": "Diameter", "value": "25.3", "acceptance_criteria": "25 ± 0.5", "status": "Rejected"},
+                {"specification": "Length", "value": "101", "acceptance_criteria": "90-100 mm", "status": "Accepted"},
+                {"specification": "Finish", "value": "Fine", "acceptance_criteria": "Within tolerance", "status": "Accepted"}
+            ]
+        })
+        qi.insert()
+        
+        self.assertEqual([r.status for r in qi.readings], ["Accepted", "Rejected", "Accepted"])
+        self.assertEqual(qi.status, "Rejected")
+
     def test_quality_inspection_failure_ncr_creation(self):
         """Test NCR creation when quality inspection fails"""
         qi = frappe.get_doc({
@@ -120,5 +137,90 @@ class TestQualityInspection(unittest.TestCase):
         self.assertEqual(trace_data["batch_no"], "BATCH-001")
         self.assertTrue(len(trace_data["quality_inspections"]) > 0)
 
+    def test_bulk_inspections_for_large_receipt(self):
+        """Test a 300-line receipt gets one inspection per inspected line, written in bulk"""
+        from healthcare_manufacturing.quality_control.doctype.quality_inspection.quality_inspection import (
+            insert_receipt_inspections)
+        
+        from unittest.mock import patch
+        
+        lines = [("QC-TEST-001", None)] * 300 + [("TEST-ITEM-NO-QC", None)]
+        # warm the caches, then count the queries of a small and a large receipt
+        insert_receipt_inspections("PR-BULK-WARM", lines[:1] + lines[-1:])
+        with patch.object(frappe.db, "sql", wraps=frappe.db.sql) as sql:
+            insert_receipt_inspections("PR-BULK-FEW", lines[:10] + lines[-1:])
+        few = sql.call_count
+        with patch.object(frappe.db, "sql", wraps=frappe.db.sql) as sql:
+            names = insert_receipt_inspections("PR-BULK-TEST", lines)
+        
+        self.assertEqual(sql.call_count, few)
+        self.assertEqual(len(names), 300)
+        self.assertEqual(frappe.db.count("Quality Inspection",
+            {"reference_name": "PR-BULK-TEST", "item_code": "QC-TEST-001", "inspection_type": "Incoming"}), 300)
+
+    def test_large_receipt_inspections_run_in_background(self):
+        """Test a large receipt is enqueued and the job inspects it once, only while it is submitted"""
+        from unittest.mock import patch
+        from healthcare_manufacturing.quality_control.doctype.quality_inspection.quality_inspection import (
+            BACKGROUND_INSPECTION_LINES, create_quality_inspection, create_receipt_inspections)
+        
+        count = BACKGROUND_INSPECTION_LINES + 1
+        for i in range(count):
+            frappe.get_doc({
+                "doctype": "Purchase Receipt Item",
+                "parent": "PR-JOB-TEST",
+                "parenttype": "Purchase Receipt",
+                "parentfield": "items",
+                "idx": i + 1,
+                "item_code": "QC-TEST-001",
+                "qty": 1
+            }).db_insert()
+        receipt = frappe._dict(doctype="Purchase Receipt", name="PR-JOB-TEST",
+            items=[frappe._dict(item_code="QC-TEST-001", batch_no=None)] * count)
+        
+        with patch.object(frappe, "enqueue") as enqueue:
+            create_quality_inspection(receipt, "on_submit")
+        enqueue.assert_called_once()
+        self.assertEqual(enqueue.call_args.kwargs["purchase_receipt"], "PR-JOB-TEST")
+        self.assertEqual(frappe.db.count("Quality Inspection", {"reference_name": "PR-JOB-TEST"}), 0)
+        
+        # the receipt is not submitted (here: does not exist), as if cancelled before the job ran
+        self.assertEqual(create_receipt_inspections("PR-JOB-TEST"), [])
+        
+        get_value = frappe.db.get_value
+        submitted = lambda doctype, *args, **kwargs: 1 if doctype == "Purchase Receipt" \
+            else get_value(doctype, *args, **kwargs)
+        with patch.object(frappe.db, "get_value", side_effect=submitted):
+            self.assertEqual(len(create_receipt_inspections("PR-JOB-TEST")), count)
+            # a retried job finds every line inspected
+            self.assertEqual(create_receipt_inspections("PR-JOB-TEST"), [])
+        self.assertEqual(frappe.db.count("Quality Inspection", {"reference_name": "PR-JOB-TEST"}), count)
+
+    def test_inspection_template_cache(self):
+        """Test item inspection settings are served from cache until the item's inspection fields change"""
+        from unittest.mock import patch
+        from healthcare_manufacturing.quality_control.inspection_templates import (
+            get_inspection_template_cache_stats, get_item_inspection_settings)
+        
+        def count_queries():
+            with patch.object(frappe.db, "sql", wraps=frappe.db.sql) as sql:
+                settings = get_item_inspection_settings(["QC-TEST-001"])["QC-TEST-001"]
+            return settings, sql.call_count
+        
+        count_queries()
+        self.assertEqual(count_queries(), ((1, None), 0))
+        
+        item = frappe.get_doc("Item", "QC-TEST-001")
+        item.item_name = "QC Test Item (renamed)"
+        item.save()
+        self.assertEqual(count_queries()[1], 0)
+        
+        item.inspection_required_before_purchase = 0
+        item.save()
+        self.assertEqual(count_queries(), ((0, None), 1))
+        
+        stats = {cache["name"]: cache for cache in get_inspection_template_cache_stats()}
+        self.assertGreater(stats["inspection_item_settings"]["hits"], 0)
+
     def tearDown(self):
         frappe.db.rollback()
\ No newline at end of file
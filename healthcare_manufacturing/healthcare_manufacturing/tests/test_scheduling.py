@@ -0,0 +1,80 @@
+import frappe
+import random
+import unittest
+
+from healthcare_manufacturing.manufacturing.scheduling import (
+    MINUTES_PER_DAY, WorkstationCalendar, schedule_operations)
+
+DAY = MINUTES_PER_DAY
+SHIFT = [(8 * 60, 16 * 60)]
+
+class TestScheduling(unittest.TestCase):
+    def test_calendar_skips_nights_and_holidays(self):
+        """Test work spills over into the next working day, past holidays"""
+        calendar = WorkstationCalendar("WS-1", SHIFT, holidays={1})
+        self.assertEqual(calendar.forward(7 * 60, 600), (8 * 60, 2 * DAY + 10 * 60))
+        self.assertEqual(calendar.backward(2 * DAY + 10 * 60, 600), 8 * 60)
+
+    def test_capacity_sequence_and_due_dates(self):
+        """Test urgent orders go first, capacity is respected and operations run in sequence"""
+        calendars = {"CUT": WorkstationCalendar("CUT", SHIFT), "PACK": WorkstationCalendar("PACK", SHIFT)}
+        orders = [
+            ("WO-LATE", 10 * DAY, [("L1", "CUT", 240, False), ("L2", "PACK", 60, False)]),
+            ("WO-URGENT", DAY, [("U1", "CUT", 240, False), ("U2", "PACK", 60, False)]),
+            ("WO-OPEN", None, [("O1", "CUT", 120, False)])
+        ]
+
+        schedule = schedule_operations(orders, calendars, {"CUT": 1, "PACK": 1})
+        self.assertEqual(schedule["U1"], (8 * 60, 12 * 60))
+        self.assertEqual(schedule["L1"], (12 * 60, 16 * 60))
+        self.assertEqual(schedule["O1"], (DAY + 8 * 60, DAY + 10 * 60))
+        self.assertEqual(schedule["U2"], (12 * 60, 13 * 60))
+        self.assertEqual(schedule["L2"], (DAY + 8 * 60, DAY + 9 * 60))
+
+        # a second cutting slot runs both orders at once
+        schedule = schedule_operations(orders, calendars, {"CUT": 2, "PACK": 1})
+        self.assertEqual(schedule["L1"], (8 * 60, 12 * 60))
+        self.assertEqual(schedule["L2"], (13 * 60, 14 * 60))
+
+    def test_operation_in_progress_keeps_its_workstation(self):
+        """Test an operation already running is not preempted by a more urgent one"""
+        orders = [
+            ("WO-URGENT", 0, [("U1", "CUT", 60, False)]),
+            ("WO-RUNNING", None, [("R1", "CUT", 30, True)])
+        ]
+        schedule = schedule_operations(orders, {}, {"CUT": 1})
+        self.assertEqual(schedule["R1"], (0, 30))
+        self.assertEqual(schedule["U1"], (30, 90))
+
+    def test_scheduler_performance(self):
+        """Test 10,000 open work orders with 5 operations each on 40 workstations keep sequence and capacity"""
+        rng = random.Random(0)
+        workstations = [f"WS-{i:02d}" for i in range(40)]
+        calendars = {workstation: WorkstationCalendar(workstation, [(6 * 60, 14 * 60), (14 * 60, 22 * 60)],
+            holidays={day for day in range(400) if day % 7 in (5, 6)}) for workstation in workstations}
+        capacities = {workstation: rng.randint(1, 3) for workstation in workstations}
+        orders = [(f"WO-{i:05d}", rng.randint(1, 120) * DAY if i % 10 else None,
+            [(f"WO-{i:05d}-{j}", rng.choice(workstations), rng.uniform(10, 240), False) for j in range(5)])
+            for i in range(10000)]
+
+        schedule = schedule_operations(orders, calendars, capacities, origin=7 * 60)
+
+        self.assertEqual(len(schedule), 50000)
+        events = {workstation: [] for workstation in workstations}
+        for name, due, operations in orders:
+            for previous, following in zip(operations, operations[1:]):
+                self.assertLessEqual(schedule[previous[0]][1], schedule[following[0]][0])
+            for operation, workstation, minutes, in_progress in operations:
+                start, end = schedule[operation]
+                self.assertGreaterEqual(start, 7 * 60)
+                events[workstation] += [(start, 1), (end, -1)]
+
+        # never more operations at once than a workstation has slots
+        for workstation, changes in events.items():
+            running = 0
+            for at, change in sorted(changes):
+                running += change
+                self.assertLessEqual(running, capacities[workstation])
+
+    def tearDown(self):
+        frappe.db.rollback()
@@ -0,0 +1,119 @@
+import frappe
+import json
+import random
+import statistics
+import unittest
+
+from healthcare_manufacturing.quality_control.doctype.control_chart.control_chart import (
+    apply_inspection, load_control_charts, update_control_charts)
+from healthcare_manufacturing.quality_control.spc import (
+    C_CHART, CHART_STATE, CONTROL_CONSTANTS, MIN_SUBGROUPS, P_CHART, RANGE_RULE, RUN_LENGTH, XBAR_R, add_defects,
+    add_subgroup, get_inspection_subgroups, western_electric_violations)
+
+class TestSPC(unittest.TestCase):
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def new_chart(self, chart_type):
+        return frappe._dict(CHART_STATE, chart_type=chart_type)
+
+    def test_xbar_r_limits_match_batch_statistics(self):
+        """Test streamed X-bar R limits equal those computed over the whole history"""
+        rng = random.Random(7)
+        subgroups = [[rng.gauss(50, 2) for j in range(5)] for i in range(200)]
+        chart = self.new_chart(XBAR_R)
+        for values in subgroups:
+            add_subgroup(chart, values)
+
+        means = [statistics.fmean(values) for values in subgroups]
+        mean_range = statistics.fmean(max(values) - min(values) for values in subgroups)
+        a2, d3, d4 = CONTROL_CONSTANTS[5]
+        self.assertAlmostEqual(chart.center_line, statistics.fmean(means))
+        self.assertAlmostEqual(chart.std_dev, statistics.stdev(means))
+        self.assertAlmostEqual(chart.ucl, statistics.fmean(means) + a2 * mean_range)
+        self.assertAlmostEqual(chart.lcl, statistics.fmean(means) - a2 * mean_range)
+        self.assertAlmostEqual(chart.range_ucl, d4 * mean_range)
+        self.assertEqual(chart.range_lcl, 0)
+
+    def test_western_electric_rules(self):
+        """Test each run rule fires on the point that completes it"""
+        self.assertEqual(western_electric_violations([0.5, -3.2]), [1])
+        self.assertEqual(western_electric_violations([2.5, 0.1, 2.4]), [2])
+        self.assertEqual(western_electric_violations([2.5, -2.4, 0.1]), [])
+        self.assertEqual(western_electric_violations([1.5, 1.2, 0.3, 1.1, 1.4]), [3])
+        self.assertEqual(western_electric_violations([-0.2] * 7 + [-0.5]), [4])
+        self.assertEqual(western_electric_violations([-0.2] * 6 + [0.1, -0.5]), [])
+
+    def test_shift_is_signalled(self):
+        """Test a process shift and a wide subgroup are signalled once the limits are estimated"""
+        rng = random.Random(3)
+        chart = self.new_chart(XBAR_R)
+        for i in range(MIN_SUBGROUPS):
+            self.assertEqual(add_subgroup(chart, [rng.gauss(10, 0.1) for j in range(4)])[1], [])
+
+        self.assertIn(1, add_subgroup(chart, [12, 12.1, 11.9, 12])[1])
+        self.assertIn(RANGE_RULE, add_subgroup(chart, [9, 11, 10, 10])[1])
+        self.assertGreaterEqual(chart.violations, 2)
+
+    def test_individual_readings_use_moving_range(self):
+        """Test one reading per inspection is charted against the moving range"""
+        chart = self.new_chart(XBAR_R)
+        for value in [10, 12, 11, 13]:
+            add_subgroup(chart, [value])
+
+        self.assertEqual(chart.range_count, 3)
+        self.assertAlmostEqual(chart.range_center, 5 / 3)
+        self.assertAlmostEqual(chart.ucl, 11.5 + 2.66 * 5 / 3)
+
+    def test_attribute_charts(self):
+        """Test p and c chart center lines and limits"""
+        p_chart, c_chart = self.new_chart(P_CHART), self.new_chart(C_CHART)
+        for defects in [2, 4, 3, 1, 5]:
+            add_defects(p_chart, defects, 100)
+            add_defects(c_chart, defects)
+
+        self.assertAlmostEqual(p_chart.center_line, 0.03)
+        self.assertAlmostEqual(p_chart.ucl, 0.03 + 3 * (0.03 * 0.97 / 100) ** 0.5)
+        self.assertAlmostEqual(c_chart.center_line, 3)
+        self.assertEqual(c_chart.lcl, 0)
+        self.assertIn(1, add_defects(c_chart, 12)[1])
+
+    def test_inspection_updates_item_charts(self):
+        """Test an inspection feeds the X-bar R and c charts of each specification and the item's p chart"""
+        readings = [("Diameter", "25.1", "Accepted"), ("Diameter", "24.8", "Accepted"),
+            ("Finish", "Scratched", "Rejected")]
+        charts = {}
+        apply_inspection(charts, "QI-TEST-1", "QC-TEST-001", get_inspection_subgroups(readings), len(readings))
+
+        by_type = {(chart.specification, chart.chart_type): chart for chart in charts.values()}
+        self.assertEqual(set(by_type), {("Diameter", XBAR_R), ("Diameter", C_CHART), ("Finish", C_CHART),
+            ("", P_CHART)})
+        self.assertAlmostEqual(by_type["Diameter", XBAR_R].last_value, 24.95)
+        self.assertEqual(by_type["Finish", C_CHART].defect_sum, 1)
+        self.assertAlmostEqual(by_type["", P_CHART].last_value, 1 / 3)
+
+    def test_submitted_inspections_persist_running_statistics(self):
+        """Test each submitted inspection updates the stored chart without rescanning history"""
+        for value in ["10.1", "9.9", "10.0"]:
+            qi = frappe._dict(name=frappe.generate_hash(length=10), item_code="QC-TEST-001",
+                readings=[frappe._dict(specification="SPC Length", value=value, status="Accepted")])
+            update_control_charts(qi, "on_submit")
+
+        names = frappe.get_all("Control Chart", pluck="name",
+            filters={"item_code": "QC-TEST-001", "specification": "SPC Length", "chart_type": XBAR_R})
+        (chart,) = load_control_charts(names).values()
+        self.assertEqual(chart.subgroups, 3)
+        self.assertAlmostEqual(chart.mean, 10.0)
+        self.assertAlmostEqual(chart.range_center, 0.15)
+
+    def test_update_throughput(self):
+        """Test a chart keeps the same state however long its history is"""
+        chart, rng = self.new_chart(XBAR_R), random.Random(11)
+        subgroups = [[rng.gauss(0, 1) for j in range(5)] for i in range(20000)]
+
+        for values in subgroups:
+            add_subgroup(chart, values)
+
+        self.assertEqual(set(chart), set(CHART_STATE) | {"chart_type"})
+        self.assertEqual(chart.subgroups, 20000)
+        self.assertEqual(len(json.loads(chart.recent)), RUN_LENGTH)
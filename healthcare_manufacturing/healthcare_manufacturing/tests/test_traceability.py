@@ -0,0 +1,204 @@
+import frappe
+import unittest
+from unittest.mock import patch
+
+from healthcare_manufacturing.api.traceability import (
+    get_traceability_report,
+    group_movements,
+    iter_report_rows,
+    trace_serial,
+    trace_serials,
+)
+from healthcare_manufacturing.inventory.doctype.batch_genealogy.batch_genealogy import (
+    add_batch_links,
+    get_batch_ancestors,
+    get_batch_descendants,
+    remove_batch_links,
+)
+from healthcare_manufacturing.inventory.trace_cache import clear_trace_cache, get_trace_cache_stats
+from healthcare_manufacturing.inventory.doctype.serial_no_movement.serial_no_movement import (
+    get_serial_no_movements,
+    parse_serial_nos,
+)
+
+class TestTraceability(unittest.TestCase):
+    def setUp(self):
+        clear_trace_cache()
+        if not frappe.db.exists("Item", "TRACE-TEST-001"):
+            frappe.get_doc({
+                "doctype": "Item",
+                "item_code": "TRACE-TEST-001",
+                "item_name": "Trace Test Device",
+                "item_group": "Medical Equipment",
+                "stock_uom": "Nos",
+                "is_stock_item": 1,
+                "has_serial_no": 1
+            }).insert()
+        if not frappe.db.exists("Item", "TRACE-TEST-FG"):
+            frappe.get_doc({
+                "doctype": "Item",
+                "item_code": "TRACE-TEST-FG",
+                "item_name": "Trace Test Assembly",
+                "item_group": "Medical Equipment",
+                "stock_uom": "Nos",
+                "is_stock_item": 1
+            }).insert()
+
+    def receive_serials(self, *serial_nos):
+        stock_entry = frappe.get_doc({
+            "doctype": "Stock Entry",
+            "stock_entry_type": "Material Receipt",
+            "to_warehouse": "Stores - HC",
+            "items": [{
+                "item_code": "TRACE-TEST-001",
+                "qty": len(serial_nos),
+                "basic_rate": 10,
+                "t_warehouse": "Stores - HC",
+                "serial_no": "\n".join(serial_nos)
+            }]
+        })
+        stock_entry.insert()
+        stock_entry.submit()
+        return stock_entry
+
+    def transfer_serial(self, serial_no, from_warehouse, to_warehouse):
+        stock_entry = frappe.get_doc({
+            "doctype": "Stock Entry",
+            "stock_entry_type": "Material Transfer",
+            "items": [{
+                "item_code": "TRACE-TEST-001",
+                "qty": 1,
+                "s_warehouse": from_warehouse,
+                "t_warehouse": to_warehouse,
+                "serial_no": serial_no
+            }]
+        })
+        stock_entry.insert()
+        stock_entry.submit()
+
+    def manufacture_serial(self, serial_no, produce=True):
+        """Manufacture entry producing ``serial_no``, or consuming it into an assembly"""
+        if produce:
+            items = [{"item_code": "TRACE-TEST-001", "qty": 1, "basic_rate": 10, "serial_no": serial_no,
+                "t_warehouse": "Stores - HC", "is_finished_item": 1}]
+        else:
+            items = [{"item_code": "TRACE-TEST-001", "qty": 1, "serial_no": serial_no,
+                "s_warehouse": "Stores - HC"},
+                {"item_code": "TRACE-TEST-FG", "qty": 1, "basic_rate": 10,
+                "t_warehouse": "Finished Goods - HC", "is_finished_item": 1}]
+
+        stock_entry = frappe.get_doc({
+            "doctype": "Stock Entry",
+            "stock_entry_type": "Manufacture",
+            "items": items
+        })
+        stock_entry.insert()
+        stock_entry.submit()
+
+    def count_queries(self, method, *args):
+        with patch.object(frappe.db, "sql", wraps=frappe.db.sql) as sql:
+            method(*args)
+        return sql.call_count
+
+    def test_parse_serial_nos(self):
+        """Test serial number fields are split exactly and deduplicated"""
+        self.assertEqual(parse_serial_nos("SER1\nSER10, SER1\n\n"), ["SER1", "SER10"])
+
+    def test_serial_index_matches_exact_serials(self):
+        """Test the movement index does not match serials by substring"""
+        stock_entry = self.receive_serials("TRC-SER1", "TRC-SER10")
+
+        movements = get_serial_no_movements("TRC-SER1")
+        self.assertEqual([m.voucher_no for m in movements["Stock Entry"]], [stock_entry.name])
+        self.assertEqual(len(movements["Stock Entry"]), 1)
+
+        stock_entry.cancel()
+        self.assertEqual(get_serial_no_movements("TRC-SER1"), {})
+
+    def test_trace_serial_query_count_is_constant(self):
+        """Test trace_serial issues as many queries for 60 production movements as for one"""
+        self.manufacture_serial("TRC-BENCH-1")
+        for i in range(60):
+            # produced and consumed in turn, every movement is a Manufacture entry
+            self.manufacture_serial("TRC-BENCH-60", produce=i % 2 == 0)
+
+        few = self.count_queries(trace_serial, "TRC-BENCH-1")
+        many = self.count_queries(trace_serial, "TRC-BENCH-60")
+
+        self.assertEqual(len(trace_serial("TRC-BENCH-60")["production_history"]), 60)
+        self.assertEqual(few, many)
+
+    def test_trace_serials_matches_single_traces(self):
+        """Test bulk trace resolves a recall list set-wise with the queries of a single trace"""
+        serial_nos = [f"TRC-BULK-{i:04d}" for i in range(500)]
+        self.receive_serials(*serial_nos)
+        single = self.count_queries(trace_serial, serial_nos[0])
+        clear_trace_cache()
+
+        queries = self.count_queries(trace_serials, serial_nos + ["TRC-BULK-MISSING"])
+
+        result = trace_serials("\n".join(serial_nos[:3] + ["TRC-BULK-MISSING"]))
+        self.assertEqual(result["not_found"], ["TRC-BULK-MISSING"])
+        self.assertEqual(result["traces"][1], trace_serial(serial_nos[1]))
+        self.assertLessEqual(queries, single)
+
+    def test_trace_cache_is_invalidated_by_ledger(self):
+        """Test cached traces are served until a movement of that serial is submitted"""
+        self.receive_serials("TRC-CACHE-1", "TRC-CACHE-2")
+        first = trace_serial("TRC-CACHE-1")
+        trace_serial("TRC-CACHE-2")
+
+        self.assertEqual(self.count_queries(trace_serial, "TRC-CACHE-1"), 0)
+        self.assertEqual(trace_serial("TRC-CACHE-1"), first)
+
+        self.manufacture_serial("TRC-CACHE-1", produce=False)
+        self.assertGreater(self.count_queries(trace_serial, "TRC-CACHE-1"), 0)
+        self.assertEqual(len(trace_serial("TRC-CACHE-1")["production_history"]),
+            len(first["production_history"]) + 1)
+
+        # untouched serials keep their cached trace
+        self.assertEqual(self.count_queries(trace_serial, "TRC-CACHE-2"), 0)
+
+        stats = get_trace_cache_stats()
+        self.assertGreaterEqual(stats["hits"], 3)
+        self.assertGreater(stats["invalidations"], 0)
+
+    def test_traceability_report_pages_match_stream(self):
+        """Test keyset pages return every group once and never split a group"""
+        self.receive_serials("TRC-RPT-1", "TRC-RPT-2", "TRC-RPT-3")
+        self.transfer_serial("TRC-RPT-2", "Stores - HC", "Finished Goods - HC")
+
+        streamed = list(group_movements(iter_report_rows({"item_code": "TRACE-TEST-001"})))
+
+        paged, after = [], None
+        while True:
+            page = get_traceability_report("TRACE-TEST-001", after=after, page_length=2)
+            paged.extend(page["groups"])
+            after = page["after"]
+            if not after:
+                break
+
+        self.assertEqual([(g["serial_no"], len(g["movements"])) for g in paged],
+            [(g["serial_no"], len(g["movements"])) for g in streamed])
+
+    def test_batch_genealogy_closure(self):
+        """Test multi-level genealogy survives removing one of two paths"""
+        # RAW -> MIX-A -> FINAL and RAW -> MIX-B -> FINAL
+        add_batch_links("Stock Entry", "GEN-SE-1", [("GEN-RAW", "GEN-MIX-A"), ("GEN-RAW", "GEN-MIX-B")])
+        add_batch_links("Stock Entry", "GEN-SE-2", [("GEN-MIX-A", "GEN-FINAL"), ("GEN-MIX-B", "GEN-FINAL")])
+
+        descendants = {d.batch_no: d.depth for d in get_batch_descendants("GEN-RAW")}
+        self.assertEqual(descendants, {"GEN-MIX-A": 1, "GEN-MIX-B": 1, "GEN-FINAL": 2})
+        self.assertIn("GEN-RAW", [a.batch_no for a in get_batch_ancestors("GEN-FINAL")])
+
+        # A cycle back to the raw batch is refused
+        add_batch_links("Stock Entry", "GEN-SE-3", [("GEN-FINAL", "GEN-RAW")])
+        self.assertEqual(get_batch_ancestors("GEN-RAW"), [])
+
+        remove_batch_links("Stock Entry", "GEN-SE-1")
+        self.assertEqual(get_batch_descendants("GEN-RAW"), [])
+        self.assertEqual({a.batch_no for a in get_batch_ancestors("GEN-FINAL")}, {"GEN-MIX-A", "GEN-MIX-B"})
+
+    def tearDown(self):
+        frappe.db.rollback()
+        clear_trace_cache()
@@ -1,5 +1,6 @@
 import frappe
 import unittest
+from unittest.mock import patch
 from frappe.utils import now_datetime, add_days
 
 class TestWorkOrder(unittest.TestCase):
@@ -110,6 +111,70 @@ class TestWorkOrder(unittest.TestCase):
             filters={"work_order": work_order.name})
         self.assertTrue(len(stock_entries) > 0)
 
+    def test_bulk_work_order_creation(self):
+        """Test bulk insert of tender-sized orders takes as many queries as a few orders"""
+        from healthcare_manufacturing.manufacturing.doctype.work_order.work_order import insert_work_orders
+        
+        orders = [{
+            "production_item": "TEST-ITEM-001",
+            "bom_no": self.bom_name,
+            "qty": 1 + i % 10,
+            "planned_start_date": now_datetime()
+        } for i in range(300)]
+        
+        single = [frappe.get_doc(dict(order, doctype="Work Order")).insert().name
+            for order in (orders[0], orders[-1])]
+        
+        # warm the meta and BOM caches, then count the queries of a small and a large batch
+        insert_work_orders(orders[:1])
+        with patch.object(frappe.db, "sql", wraps=frappe.db.sql) as sql:
+            insert_work_orders(orders[:10])
+        few = sql.call_count
+        with patch.object(frappe.db, "sql", wraps=frappe.db.sql) as sql:
+            bulk = insert_work_orders(orders)
+        
+        self.assertEqual(sql.call_count, few)
+        self.assertEqual(len(set(bulk)), len(orders))
+        
+        # same rows as the regular validation sets
+        for single_name, bulk_name in ((single[0], bulk[0]), (single[-1], bulk[-1])):
+            expected, created = frappe.get_doc("Work Order", single_name), frappe.get_doc("Work Order", bulk_name)
+            self.assertEqual(created.status, "Draft")
+            self.assertEqual([(d.item_code, d.required_qty) for d in created.required_items],
+                [(d.item_code, d.required_qty) for d in expected.required_items])
+            self.assertEqual([d.operation for d in created.operations], [d.operation for d in expected.operations])
+
+    def test_production_schedule_pages(self):
+        """Test the Gantt schedule pages through a date window with real progress"""
+        from healthcare_manufacturing.api.manufacturing import get_production_schedule
+        from healthcare_manufacturing.manufacturing.doctype.work_order.work_order import insert_work_orders
+        
+        start = now_datetime()
+        names = insert_work_orders([{
+            "production_item": "TEST-ITEM-001",
+            "bom_no": self.bom_name,
+            "qty": 10,
+            "planned_start_date": add_days(start, i),
+            "planned_end_date": add_days(start, i + 2)
+        } for i in range(7)])
+        frappe.db.sql("""UPDATE `tabWork Order` SET docstatus = 1, status = 'Not Started'
+            WHERE name IN %s""", [tuple(names)])
+        frappe.db.sql("""UPDATE `tabWork Order` SET planned_start_date = %s, planned_end_date = %s
+            WHERE name = %s""", (add_days(start, 60), add_days(start, 61), names[-1]))
+        
+        tasks, after = [], None
+        while True:
+            page = get_production_schedule(from_date=add_days(start, -1), to_date=add_days(start, 30),
+                after=after, page_length=2)
+            tasks += [task for task in page["tasks"] if task["id"] in names]
+            after = page["after"]
+            if not after:
+                break
+        
+        # the order outside the window is left out, the others come in start order
+        self.assertEqual([task["id"] for task in tasks], names[:-1])
+        self.assertTrue(all(task["progress"] == 0 for task in tasks))
+
     def tearDown(self):
         # Clean up test data
         frappe.db.rollback()
\ No newline at end of file
@@ -0,0 +1,217 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import frappe
+
+GENERATION_KEY = "hm_cache_generation"
+SHARED_PREFIX = "hm_dashboard"
+
+# Documents that change the data of another doctype's dashboards
+INVALIDATION_ALIASES = {
+    "Stock Ledger Entry": "Bin"
+}
+
+_caches = {}
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache with a time to live per entry.
+
+    Entries past their TTL, or stored under an older ``version``, are kept for
+    ``stale_ttl`` more seconds so callers can serve them while recomputing.
+    """
+
+    def __init__(self, name, maxsize=256, ttl=60, stale_ttl=0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = self.stale_hits = self.misses = self.evictions = 0
+
+    def lookup(self, key, version=None):
+        """Return ``(found, value, fresh)`` for ``key``"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires, entry_version = entry
+                fresh = now <= expires and entry_version == version
+                if fresh or (self.stale_ttl and now <= expires + self.stale_ttl):
+                    self._data.move_to_end(key)
+                    if fresh:
+                        self.hits += 1
+                    else:
+                        self.stale_hits += 1
+                    return True, value, fresh
+
+                del self._data[key]
+
+            self.misses += 1
+            return False, None, False
+
+    def get(self, key, default=None, version=None):
+        found, value, fresh = self.lookup(key, version)
+        return value if found and fresh else default
+
+    def set(self, key, value, version=None, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires, version)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0
+            }
+
+
+def get_cache(name, **kwargs):
+    """Get the process-wide cache registered under ``name``, creating it on first use"""
+    if name not in _caches:
+        _caches[name] = TTLCache(name, **kwargs)
+    return _caches[name]
+
+
+def make_cache_key(namespace, *args, **kwargs):
+    """Redis key of a call; ``frappe.cache()`` prefixes it with the site's db name"""
+    arguments = frappe.as_json([args, sorted(kwargs.items())], indent=None)
+    digest = hashlib.md5(arguments.encode()).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+def get_local_key(key):
+    """In-process key of a Redis key: one worker can serve several sites"""
+    return (frappe.local.site, key)
+
+
+def get_generations(doctypes):
+    """Current invalidation stamps of ``doctypes``, shared by all workers through Redis"""
+    generations = frappe.cache().hgetall(GENERATION_KEY) or {}
+    return tuple(generations.get(doctype) for doctype in doctypes)
+
+
+def invalidate_doctype(doctype):
+    frappe.cache().hset(GENERATION_KEY, doctype, frappe.generate_hash(length=10))
+
+
+def invalidate_dashboard_cache(doc, method=None):
+    """doc_events handler: mark dashboards reading ``doc.doctype`` stale once the change commits"""
+    doctype = INVALIDATION_ALIASES.get(doc.doctype, doc.doctype)
+    frappe.db.after_commit.add(lambda: invalidate_doctype(doctype))
+
+
+def clear_dashboard_cache():
+    """Drop every cached dashboard result instead of serving it stale"""
+    for cache in _caches.values():
+        if cache.name.startswith(SHARED_PREFIX):
+            cache.clear()
+    frappe.cache().delete_keys(SHARED_PREFIX)
+
+
+def dashboard_cache(depends_on, ttl=60, stale_ttl=600):
+    """Cache a dashboard method per arguments in process memory and Redis.
+
+    Results are invalidated when a document of a ``depends_on`` doctype changes
+    (see :func:`invalidate_dashboard_cache`). Expired or invalidated results are
+    still served for ``stale_ttl`` seconds while a background thread recomputes
+    them, so only a never-computed key makes the caller wait.
+    """
+    def decorator(fn):
+        namespace = f"{SHARED_PREFIX}:{fn.__module__}.{fn.__name__}"
+        cache = get_cache(namespace, maxsize=128, ttl=ttl, stale_ttl=stale_ttl)
+
+        def compute(key, generation, args, kwargs):
+            value = fn(*args, **kwargs)
+            cache.set(get_local_key(key), value, version=generation)
+            frappe.cache().set_value(key, (value, time.time(), generation),
+                expires_in_sec=ttl + stale_ttl)
+            return value
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = make_cache_key(namespace, *args, **kwargs)
+            generation = get_generations(depends_on)
+
+            found, value, fresh = cache.lookup(get_local_key(key), version=generation)
+            if not found:
+                shared = frappe.cache().get_value(key)
+                if shared:
+                    value, computed_at, shared_generation = shared
+                    age = time.time() - computed_at
+                    found = True
+                    fresh = age <= ttl and shared_generation == generation
+                    if fresh:
+                        cache.set(get_local_key(key), value, version=generation, ttl=ttl - age)
+
+            if not found:
+                return compute(key, generation, args, kwargs)
+
+            if not fresh:
+                refresh_in_background(key, lambda: compute(key, generation, args, kwargs))
+
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def refresh_in_background(key, refresh):
+    """Run ``refresh`` once per ``key`` in a thread with its own site connection"""
+    local_key = get_local_key(key)
+    with _refresh_lock:
+        if local_key in _refreshing:
+            return
+        _refreshing.add(local_key)
+
+    from healthcare_manufacturing.utils.concurrency import site_connection
+
+    site, sites_path = frappe.local.site, frappe.local.sites_path
+
+    def run():
+        try:
+            with site_connection(site, sites_path):
+                try:
+                    refresh()
+                except Exception:
+                    frappe.log_error(title=f"Cache refresh failed for {key}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(local_key)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+@frappe.whitelist()
+def get_cache_stats():
+    """Hit/miss statistics of the in-process caches of this worker"""
+    frappe.only_for("System Manager")
+    return [cache.stats() for cache in _caches.values()]
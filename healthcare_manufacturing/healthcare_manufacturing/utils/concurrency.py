@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+
+import frappe
+
+from healthcare_manufacturing.utils.cache import get_cache
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hm-fan-out")
+
+
+@contextmanager
+def site_connection(site, sites_path, user=None):
+    """Give the current thread its own frappe context and database connection"""
+    frappe.init(site=site, sites_path=sites_path)
+    try:
+        frappe.connect()
+        if user:
+            frappe.set_user(user)
+        yield
+    finally:
+        frappe.destroy()
+
+
+def fan_out(providers, timeout=5):
+    """Run independent ``providers`` concurrently and collect what finishes in time.
+
+    ``providers`` maps a name to a callable taking no arguments. Each runs in a
+    pool thread with its own site connection, so the total latency is that of
+    the slowest provider, capped at ``timeout`` seconds. Returns
+    ``(results, stale, errors)``: providers that time out or fail fall back to
+    their last good value (listed in ``stale``, or ``None`` if there is none) and
+    failures are reported in ``errors`` by name.
+    """
+    last_good = get_cache("fan_out", maxsize=512, ttl=24 * 60 * 60)
+    results, stale, errors = {}, [], {}
+
+    if frappe.flags.in_test:
+        # keep providers on the test transaction
+        for name, provider in providers.items():
+            results[name] = provider()
+        return results, stale, errors
+
+    site, sites_path, user = frappe.local.site, frappe.local.sites_path, frappe.session.user
+
+    def run(provider):
+        with site_connection(site, sites_path, user):
+            return provider()
+
+    futures = {name: _executor.submit(run, provider) for name, provider in providers.items()}
+    deadline = time.monotonic() + timeout
+
+    for name, future in futures.items():
+        key = f"{site}:{name}"
+        try:
+            results[name] = future.result(timeout=max(deadline - time.monotonic(), 0))
+            last_good.set(key, results[name])
+            continue
+        except TimeoutError:
+            errors[name] = f"Timed out after {timeout}s"
+        except Exception as e:
+            errors[name] = str(e)
+            frappe.log_error(title=f"Metric provider {name} failed")
+
+        results[name] = last_good.get(key)
+        if results[name] is not None:
+            stale.append(name)
+
+    return results, stale, errors
@@ -0,0 +1,122 @@
+import base64
+import hashlib
+import json
+from itertools import islice
+
+import frappe
+from frappe import _
+from frappe.utils import cstr, now
+
+
+def make_row_name(*parts):
+    """Deterministic primary key for a row identified by ``parts``"""
+    return hashlib.md5("|".join(cstr(part) for part in parts).encode()).hexdigest()
+
+
+def chunked(items, size):
+    """Yield lists of at most ``size`` items"""
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def upsert(doctype, fields, rows, increment=(), chunk_size=1000):
+    """Insert ``rows`` into ``doctype``, merging into existing rows with the same name.
+
+    ``fields`` must start with ``name``. Columns listed in ``increment`` are added
+    onto the stored value; every other column is overwritten.
+    """
+    timestamp, user = now(), frappe.session.user
+    columns = ["creation", "modified", "owner", "modified_by"] + list(fields)
+    updates = ["`modified` = VALUES(`modified`)"] + [
+        f"`{field}` = `{field}` + VALUES(`{field}`)" if field in increment
+        else f"`{field}` = VALUES(`{field}`)"
+        for field in fields[1:]
+    ]
+    placeholder = "({})".format(", ".join(["%s"] * len(columns)))
+
+    for chunk in chunked(rows, chunk_size):
+        values = []
+        for row in chunk:
+            values.extend([timestamp, timestamp, user, user])
+            values.extend(row)
+
+        frappe.db.sql(f"""
+            INSERT INTO `tab{doctype}` ({", ".join(f"`{c}`" for c in columns)})
+            VALUES {", ".join([placeholder] * len(chunk))}
+            ON DUPLICATE KEY UPDATE {", ".join(updates)}
+        """, values)
+
+
+def bulk_update(doctype, fields, rows, chunk_size=1000):
+    """Set ``fields`` of existing rows of ``doctype`` from ``rows`` of ``(name, *values)``.
+
+    Each chunk is a single UPDATE joined on the primary key; ``modified`` is
+    left alone, as with ``db_set(..., update_modified=False)``.
+    """
+    selects = ", ".join(["%s AS `name`"] + [f"%s AS `{field}`" for field in fields])
+    select = ", ".join(["%s"] * (len(fields) + 1))
+    assignments = ", ".join(f"t.`{field}` = v.`{field}`" for field in fields)
+
+    for chunk in chunked(rows, chunk_size):
+        values = [value for row in chunk for value in row]
+        derived = " UNION ALL ".join([f"SELECT {selects}"] + [f"SELECT {select}"] * (len(chunk) - 1))
+        frappe.db.sql(f"""
+            UPDATE `tab{doctype}` t
+            INNER JOIN ({derived}) v ON v.`name` = t.`name`
+            SET {assignments}
+        """, values)
+
+
+def reserve_series_names(naming_series, count):
+    """``count`` consecutive names of a naming series such as ``WO-.YYYY.-``, taken in one step"""
+    from frappe.model.naming import parse_naming_series
+
+    parts = naming_series.split(".")
+    hashes = [part for part in parts if part.startswith("#")]
+    digits = len(hashes[-1]) if hashes else 5
+    prefix = parse_naming_series([part for part in parts if part and not part.startswith("#")])
+
+    frappe.db.sql("INSERT IGNORE INTO `tabSeries` (`name`, `current`) VALUES (%s, 0)", prefix)
+    current = frappe.db.sql("SELECT `current` FROM `tabSeries` WHERE `name` = %s FOR UPDATE", prefix)[0][0]
+    frappe.db.sql("UPDATE `tabSeries` SET `current` = %s WHERE `name` = %s", (current + count, prefix))
+
+    return [f"{prefix}{number:0{digits}d}" for number in range(current + 1, current + count + 1)]
+
+
+def bulk_insert_docs(docs, chunk_size=1000):
+    """Write new, already named documents and their child rows with multi-row inserts.
+
+    No controller methods or doc_events run: callers validate and fill the
+    documents themselves.
+    """
+    timestamp, user = now(), frappe.session.user
+    rows = {}
+    for doc in docs:
+        for d in [doc] + doc.get_all_children():
+            d.name = d.name or frappe.generate_hash(length=10)
+            d.creation = d.modified = timestamp
+            d.owner = d.modified_by = user
+            d.docstatus = 0
+            rows.setdefault(d.doctype, []).append(d.get_valid_dict(convert_dates_to_str=True))
+
+    for doctype, values in rows.items():
+        fields = list(values[0])
+        frappe.db.bulk_insert(doctype, fields, [[row.get(field) for field in fields] for row in values],
+            chunk_size=chunk_size)
+
+
+def encode_cursor(key):
+    """Opaque pagination cursor for the keyset ``key`` of the last row of a page"""
+    return base64.urlsafe_b64encode(frappe.as_json(key, indent=None).encode()).decode()
+
+
+def decode_cursor(cursor, length):
+    """Keyset key of a cursor made by :func:`encode_cursor`, with ``length`` parts"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        key = None
+    if not isinstance(key, list) or len(key) != length:
+        frappe.throw(_("Invalid page cursor"))
+    return key
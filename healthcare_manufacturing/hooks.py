@@ -57,7 +57,7 @@ app_license = "MIT"
 # ------------
 
 # before_install = "healthcare_manufacturing.install.before_install"
-# after_install = "healthcare_manufacturing.install.after_install"
+after_install = "healthcare_manufacturing.install.after_install"
 
 # Desk Notifications
 # ------------------
@@ -89,16 +89,97 @@ app_license = "MIT"
 # ---------------
 # Hook on document methods and events
 
+_invalidate_dashboard_cache = "healthcare_manufacturing.utils.cache.invalidate_dashboard_cache"
+
+_update_production_rollup = "healthcare_manufacturing.manufacturing.doctype.production_rollup.production_rollup.update_production_rollup"
+
+_update_serial_no_movements = "healthcare_manufacturing.inventory.doctype.serial_no_movement.serial_no_movement.update_serial_no_movements"
+
+_update_batch_genealogy = "healthcare_manufacturing.inventory.doctype.batch_genealogy.batch_genealogy.update_batch_genealogy"
+
+_update_stock_balance = "healthcare_manufacturing.inventory.doctype.stock_balance.stock_balance.update_stock_balance"
+
+_invalidate_trace_cache = "healthcare_manufacturing.inventory.trace_cache.invalidate_trace_cache"
+
+_invalidate_bom_explosions = "healthcare_manufacturing.manufacturing.bom_explosion.invalidate_bom_explosions"
+
+_invalidate_item_prices = "healthcare_manufacturing.manufacturing.bom_costing.invalidate_item_prices"
+
+_invalidate_inspection_templates = "healthcare_manufacturing.quality_control.inspection_templates.invalidate_inspection_templates"
+
+_update_control_charts = "healthcare_manufacturing.quality_control.doctype.control_chart.control_chart.update_control_charts"
+
+_dashboard_cache_events = {
+    "on_update": _invalidate_dashboard_cache,
+    "on_submit": _invalidate_dashboard_cache,
+    "on_update_after_submit": _invalidate_dashboard_cache,
+    "on_cancel": _invalidate_dashboard_cache,
+    "on_trash": _invalidate_dashboard_cache
+}
+
 doc_events = {
     "Sales Order": {
         "on_submit": "healthcare_manufacturing.manufacturing.doctype.production_plan.production_plan.create_production_plan_from_sales_order"
     },
     "Purchase Receipt": {
-        "on_submit": "healthcare_manufacturing.quality_control.doctype.quality_inspection.quality_inspection.create_quality_inspection"
+        "on_submit": [
+            "healthcare_manufacturing.quality_control.doctype.quality_inspection.quality_inspection.create_quality_inspection",
+            _update_serial_no_movements
+        ],
+        "on_cancel": _update_serial_no_movements
     },
-    "Work Order": {
-        "on_submit": "healthcare_manufacturing.manufacturing.doctype.work_order.work_order.reserve_materials"
-    }
+    "Work Order": _dashboard_cache_events,
+    "BOM": {
+        "on_submit": _invalidate_bom_explosions,
+        "on_update_after_submit": _invalidate_bom_explosions,
+        "on_cancel": _invalidate_bom_explosions,
+        "on_trash": _invalidate_bom_explosions
+    },
+    "Item Price": {
+        "on_update": _invalidate_item_prices,
+        "on_trash": _invalidate_item_prices
+    },
+    "Item": {
+        **_dashboard_cache_events,
+        "on_update": [_invalidate_dashboard_cache, _invalidate_inspection_templates],
+        "on_trash": [_invalidate_dashboard_cache, _invalidate_inspection_templates]
+    },
+    "Quality Inspection Template": {
+        "on_update": _invalidate_inspection_templates,
+        "on_trash": _invalidate_inspection_templates
+    },
+    "Quality Inspection": {
+        **{event: [handler, _invalidate_trace_cache] for event, handler in _dashboard_cache_events.items()},
+        "on_submit": [_invalidate_dashboard_cache, _invalidate_trace_cache, _update_control_charts],
+        "on_cancel": [_invalidate_dashboard_cache, _invalidate_trace_cache, _update_control_charts]
+    },
+    "NCR": _dashboard_cache_events,
+    "CAPA": _dashboard_cache_events,
+    "Account": _dashboard_cache_events,
+    "Bin": _dashboard_cache_events,
+    "Stock Entry": {
+        "on_submit": [
+            _update_production_rollup,
+            _update_serial_no_movements,
+            _update_batch_genealogy
+        ],
+        "on_cancel": [
+            _update_production_rollup,
+            _update_serial_no_movements,
+            _update_batch_genealogy
+        ]
+    },
+    "Delivery Note": {
+        "on_submit": [_update_serial_no_movements, _invalidate_trace_cache],
+        "on_cancel": [_update_serial_no_movements, _invalidate_trace_cache]
+    },
+    "Stock Ledger Entry": {
+        "before_insert": "healthcare_manufacturing.api.traceability.set_trace_key",
+        "on_submit": [_update_stock_balance, _invalidate_dashboard_cache, _invalidate_trace_cache],
+        "on_cancel": _invalidate_trace_cache
+    },
+    "Sales Invoice": _dashboard_cache_events,
+    "KPI": _dashboard_cache_events
 }
 
 # Scheduled Tasks
@@ -110,6 +191,9 @@ scheduler_events = {
     ],
     "hourly": [
         "healthcare_manufacturing.inventory.doctype.stock_balance.stock_balance.update_stock_balances"
+    ],
+    "weekly": [
+        "healthcare_manufacturing.inventory.doctype.stock_balance.stock_balance.verify_stock_balances"
     ]
 }
 